@@ -1,12 +1,99 @@
+import hashlib
+import json
+import os
+import threading
+
 import requests
 import arrow
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# ARK publishes the day's holdings and trades in the evening, New York time
+PUBLISH_TIME = (19, 0)
+NY = 'America/New_York'
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    '''
+    Returns the session shared by every Ark instance. It keeps connections to the API open
+    and retries failed requests with a backoff.
+    '''
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                          allowed_methods=['GET'])
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+            _session = requests.Session()
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+
+def next_publication(t):
+    '''
+    Returns the first weekday publication time after t.
+    '''
+    local = t.to(NY)
+    for i in range(8):
+        candidate = local.shift(days=i).replace(hour=PUBLISH_TIME[0], minute=PUBLISH_TIME[1],
+                                                second=0, microsecond=0)
+        if candidate.weekday() < 5 and candidate > t:
+            return candidate
+    raise ValueError('no publication within a week')
 
 
 class Ark:
-    def __init__ (self, BASE_URL='https://arkfunds.io/api', VERSION='v2'):
+    def __init__ (self, BASE_URL='https://arkfunds.io/api', VERSION='v2', cache_dir='./ark_cache', timeout=10, session=None):
         self.BASE_URL = BASE_URL
         self.VERSION = VERSION
         self.API_URL = BASE_URL + '/' + VERSION
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        self.session = session
+
+    def get_cache_filename(self, endpoint, params):
+        key = json.dumps({'url': self.API_URL, 'endpoint': endpoint, 'params': params}, sort_keys=True)
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest() + '.json')
+
+    def load_cached(self, filename):
+        '''
+        Returns the cached response, or None if there is none or ARK has published since it was fetched.
+        '''
+        if not os.path.exists(filename):
+            return None
+        with open(filename, 'r') as f:
+            cached = json.load(f)
+        if arrow.utcnow() >= next_publication(arrow.get(cached['fetched_at'])):
+            return None
+        return cached['response']
+
+    def get(self, endpoint, params):
+        '''
+        Requests an endpoint through the shared session. Responses are cached on disk
+        by endpoint and parameters until the next daily publication.
+        '''
+        filename = None
+        if self.cache_dir is not None:
+            filename = self.get_cache_filename(endpoint, params)
+            cached = self.load_cached(filename)
+            if cached is not None:
+                return cached
+
+        session = self.session if self.session is not None else get_session()
+        r = session.get(self.API_URL + endpoint, params=params, timeout=self.timeout)
+        r.raise_for_status()
+        response = r.json()
+
+        if filename is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(filename + '.tmp', 'w') as f:
+                json.dump({'fetched_at': arrow.utcnow().isoformat(), 'response': response}, f)
+            os.replace(filename + '.tmp', filename)
+        return response
 
     def get_etf_trades(self, symbol, start_date=None, end_date=None, limit=None):
         if start_date is None:
@@ -15,10 +102,8 @@ class Ark:
             end_date = arrow.utcnow().format('YYYY-MM-DD')
         if limit is None:
             limit = 100
-        url = self.API_URL + '/etf/trades'
         params = {'symbol': symbol, 'start_date': start_date, 'end_date': end_date, 'limit': limit}
-        r = requests.get(url, params=params)
-        return r.json()
+        return self.get('/etf/trades', params)
 
     def get_etf_holdings(self, symbol, start_date=None, end_date=None, limit=None):
         if start_date is None:
@@ -27,10 +112,8 @@ class Ark:
             end_date = arrow.utcnow().format('YYYY-MM-DD')
         if limit is None:
             limit = 100
-        url = self.API_URL + '/etf/holdings'
         params = {'symbol': symbol, 'start_date': start_date, 'end_date': end_date, 'limit': limit}
-        r = requests.get(url, params=params)
-        return r.json()
+        return self.get('/etf/holdings', params)
 
 if __name__ == '__main__':
     ark = Ark()
@@ -75,4 +158,4 @@ if __name__ == '__main__':
     }
   ]
 }
-'''
\ No newline at end of file
+'''
@@ -0,0 +1,146 @@
+from typing import Dict, List, Tuple, Union
+
+import arrow
+from sqlmodel import Session
+
+from database import get_ark_coverage, get_ark_holdings, replace_ark_holdings, set_ark_coverage
+from database.model import ArkCoverage, ArkHolding
+from . import Ark
+
+DATE_FORMAT = 'YYYY-MM-DD'
+# how far back to look for the snapshot before the first date of a trades query
+PREVIOUS_SNAPSHOT_DAYS = 10
+
+
+def to_holding(fund: str, holding: dict) -> ArkHolding:
+    return ArkHolding(fund=fund, date=holding['date'], ticker=holding.get('ticker'),
+                      company=holding.get('company'), cusip=holding.get('cusip'),
+                      shares=float(holding.get('shares') or 0), market_value=holding.get('market_value'),
+                      weight=holding.get('weight'))
+
+
+def diff_snapshots(fund: str, date: str, previous: List[ArkHolding], current: List[ArkHolding]) -> List[dict]:
+    '''
+    Derives the trades between two holdings snapshots, in the format of the trades endpoint.
+    etf_percent is the value traded as a percentage of the fund on the later date.
+    '''
+    def key(holding: ArkHolding) -> str:
+        return holding.cusip or holding.ticker or holding.company
+
+    before = {key(holding): holding for holding in previous}
+    after = {key(holding): holding for holding in current}
+    fund_value = sum(holding.market_value or 0 for holding in current)
+
+    trades = []
+    for k in sorted(before.keys() | after.keys(), key=str):
+        old, new = before.get(k), after.get(k)
+        change = (new.shares if new else 0) - (old.shares if old else 0)
+        if change == 0:
+            continue
+        holding = new or old
+        etf_percent = None
+        if holding.market_value and holding.shares and fund_value:
+            price = holding.market_value / holding.shares
+            etf_percent = round(abs(change) * price / fund_value * 100, 4)
+        trades.append({
+            'fund': fund,
+            'date': date,
+            'ticker': holding.ticker,
+            'company': holding.company,
+            'direction': 'Buy' if change > 0 else 'Sell',
+            'cusip': holding.cusip,
+            'shares': abs(change),
+            'etf_percent': etf_percent,
+        })
+    return trades
+
+
+class HoldingsHistory:
+    '''
+    Daily holdings snapshots of ARK funds kept in the database. Only the dates that have not been
+    fetched yet are requested from the API, date range queries are answered from disk and trades
+    are derived by diffing consecutive snapshots instead of trusting the trades endpoint.
+    '''
+
+    window_days = 30  # days requested at once while backfilling
+    limit = 10000  # holdings per request, enough for a window of every fund
+
+    def __init__(self, engine, ark: Union[Ark, None] = None):
+        self.engine = engine
+        self.ark = ark if ark is not None else Ark()
+
+    def fetch(self, fund: str, start: arrow.Arrow, end: arrow.Arrow) -> List[ArkHolding]:
+        holdings = []
+        while start <= end:
+            window_end = min(start.shift(days=self.window_days - 1), end)
+            response = self.ark.get_etf_holdings(fund, start.format(DATE_FORMAT),
+                                                 window_end.format(DATE_FORMAT), self.limit)
+            holdings += [to_holding(fund, holding) for holding in response.get('holdings', [])]
+            start = window_end.shift(days=1)
+        return holdings
+
+    def missing_ranges(self, coverage: Union[ArkCoverage, None], start: arrow.Arrow, end: arrow.Arrow) -> List[Tuple[arrow.Arrow, arrow.Arrow]]:
+        if coverage is None:
+            return [(start, end)]
+        ranges = []
+        covered_start = arrow.get(coverage.start_date)
+        covered_end = arrow.get(coverage.end_date)
+        if start < covered_start:
+            ranges.append((start, covered_start.shift(days=-1)))
+        if end > covered_end:
+            ranges.append((covered_end.shift(days=1), end))
+        return ranges
+
+    def sync(self, fund: str, start_date: str, end_date: Union[str, None] = None) -> int:
+        '''
+        Fetches the snapshots of the fund between the dates (today by default) that aren't stored yet.
+        Returns the number of holdings added.
+        '''
+        start = arrow.get(start_date)
+        end = arrow.get(end_date) if end_date is not None else arrow.utcnow().floor('day')
+
+        with Session(self.engine) as session:
+            coverage = get_ark_coverage(session, fund)
+            covered_start = coverage.start_date if coverage is not None else None
+            covered_end = coverage.end_date if coverage is not None else None
+
+            added = 0
+            for missing_start, missing_end in self.missing_ranges(coverage, start, end):
+                holdings = self.fetch(fund, missing_start, missing_end)
+                # days without a snapshot yet, like today before publication, are fetched again next time
+                last_date = max((holding.date for holding in holdings), default=None)
+                replace_ark_holdings(session, fund, holdings)
+                added += len(holdings)
+                if covered_start is None or missing_start.format(DATE_FORMAT) < covered_start:
+                    covered_start = missing_start.format(DATE_FORMAT)
+                if last_date is not None and (covered_end is None or last_date > covered_end):
+                    covered_end = last_date
+
+            if covered_start is not None and covered_end is not None:
+                set_ark_coverage(session, ArkCoverage(
+                    fund=fund, start_date=covered_start, end_date=covered_end))
+        return added
+
+    def get_holdings(self, fund: str, start_date: str, end_date: str) -> Dict[str, List[ArkHolding]]:
+        '''
+        Returns the stored snapshots of the fund between the dates, as {date: holdings}.
+        '''
+        with Session(self.engine) as session:
+            holdings = get_ark_holdings(session, fund, start_date, end_date)
+        snapshots = {}
+        for holding in holdings:
+            snapshots.setdefault(holding.date, []).append(holding)
+        return snapshots
+
+    def get_trades(self, fund: str, start_date: str, end_date: str) -> List[dict]:
+        '''
+        Derives the fund's trades on each snapshot date between the dates from the stored snapshots.
+        '''
+        lookback = arrow.get(start_date).shift(days=-PREVIOUS_SNAPSHOT_DAYS).format(DATE_FORMAT)
+        snapshots = self.get_holdings(fund, lookback, end_date)
+        dates = sorted(snapshots)
+        trades = []
+        for previous, date in zip(dates, dates[1:]):
+            if date >= start_date:
+                trades += diff_snapshots(fund, date, snapshots[previous], snapshots[date])
+        return trades
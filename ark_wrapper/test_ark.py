@@ -1,4 +1,6 @@
-from . import Ark
+import arrow
+
+from . import Ark, next_publication
 
 def test_init():
     ark = Ark()
@@ -14,4 +16,47 @@ def test_get_etf_trades():
 def test_get_etf_holdings():
     ark = Ark()
     holdings = ark.get_etf_holdings('ARKK')
-    assert holdings['symbol'] == 'ARKK'
\ No newline at end of file
+    assert holdings['symbol'] == 'ARKK'
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+class FakeSession:
+    def __init__(self):
+        self.requests = []
+
+    def get(self, url, params=None, timeout=None):
+        self.requests.append((url, params, timeout))
+        return FakeResponse({'symbol': params['symbol'], 'trades': []})
+
+
+def test_responses_are_cached_until_next_publication(tmp_path, monkeypatch):
+    session = FakeSession()
+    ark = Ark(cache_dir=str(tmp_path), session=session)
+    # a Wednesday afternoon in New York, before the evening publication
+    now = arrow.get('2022-06-01T18:00:00+00:00')
+    monkeypatch.setattr(arrow, 'utcnow', lambda: now)
+
+    assert ark.get_etf_trades('ARKK')['symbol'] == 'ARKK'
+    assert ark.get_etf_trades('ARKK')['symbol'] == 'ARKK'
+    ark.get_etf_trades('ARKW')
+    assert len(session.requests) == 2
+    assert session.requests[0][2] == ark.timeout
+
+    now = arrow.get('2022-06-01T23:30:00+00:00')
+    ark.get_etf_trades('ARKK')
+    assert len(session.requests) == 3
+
+
+def test_next_publication_skips_weekends():
+    friday_night = arrow.get('2022-06-04T00:00:00+00:00')
+    assert next_publication(friday_night).format('YYYY-MM-DD HH:mm') == '2022-06-06 19:00'
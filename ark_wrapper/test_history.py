@@ -0,0 +1,65 @@
+from database import ARK_TABLES, get_engine
+
+from .history import HoldingsHistory
+
+
+class FakeArk:
+    def __init__(self, snapshots):
+        self.snapshots = snapshots
+        self.requests = []
+
+    def get_etf_holdings(self, symbol, start_date=None, end_date=None, limit=None):
+        self.requests.append((symbol, start_date, end_date))
+        holdings = []
+        for date, snapshot in self.snapshots.items():
+            if start_date <= date <= end_date:
+                holdings += [dict(holding, fund=symbol, date=date) for holding in snapshot]
+        return {'symbol': symbol, 'holdings': holdings}
+
+
+def snapshot(shares_by_ticker):
+    return [{'ticker': ticker, 'cusip': ticker + '-CUSIP', 'company': ticker, 'shares': shares,
+             'market_value': shares * 10.0, 'weight': 1.0}
+            for ticker, shares in shares_by_ticker.items()]
+
+
+def test_sync_fetches_only_missing_dates():
+    ark = FakeArk({
+        '2022-06-01': snapshot({'TSLA': 100, 'ROKU': 50}),
+        '2022-06-02': snapshot({'TSLA': 120, 'ROKU': 50}),
+        '2022-06-03': snapshot({'TSLA': 120, 'ROKU': 20, 'COIN': 10}),
+        '2022-06-06': snapshot({'TSLA': 120, 'COIN': 10}),
+    })
+    history = HoldingsHistory(get_engine('sqlite://', ARK_TABLES), ark)
+
+    assert history.sync('ARKK', '2022-06-02', '2022-06-06') == 7
+    assert history.sync('ARKK', '2022-06-02', '2022-06-06') == 0
+    assert history.sync('ARKK', '2022-06-01', '2022-06-06') == 2
+    assert ark.requests[1] == ('ARKK', '2022-06-01', '2022-06-01')
+    # a day without a snapshot yet is requested again
+    history.sync('ARKK', '2022-06-01', '2022-06-07')
+    history.sync('ARKK', '2022-06-01', '2022-06-07')
+    assert ark.requests[-2:] == [('ARKK', '2022-06-07', '2022-06-07')] * 2
+
+    snapshots = history.get_holdings('ARKK', '2022-06-02', '2022-06-03')
+    assert list(snapshots) == ['2022-06-02', '2022-06-03']
+    assert {holding.ticker: holding.shares for holding in snapshots['2022-06-03']} == \
+        {'TSLA': 120, 'ROKU': 20, 'COIN': 10}
+
+
+def test_trades_are_derived_from_snapshots():
+    ark = FakeArk({
+        '2022-06-01': snapshot({'TSLA': 100, 'ROKU': 50}),
+        '2022-06-02': snapshot({'TSLA': 120, 'ROKU': 50}),
+        '2022-06-03': snapshot({'TSLA': 120, 'ROKU': 20, 'COIN': 10}),
+    })
+    history = HoldingsHistory(get_engine('sqlite://', ARK_TABLES), ark)
+    history.sync('ARKK', '2022-06-01', '2022-06-03')
+
+    trades = history.get_trades('ARKK', '2022-06-02', '2022-06-03')
+    assert [(trade['date'], trade['ticker'], trade['direction'], trade['shares']) for trade in trades] == [
+        ('2022-06-02', 'TSLA', 'Buy', 20),
+        ('2022-06-03', 'COIN', 'Buy', 10),
+        ('2022-06-03', 'ROKU', 'Sell', 30),
+    ]
+    assert trades[0]['etf_percent'] == round(20 * 10.0 / 1700.0 * 100, 4)
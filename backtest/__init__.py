@@ -0,0 +1,79 @@
+import arrow
+import numpy as np
+from alpaca_trade_api.rest import TimeFrame
+
+from bar_store import get_period
+from database import BLACKLIST_TABLES, get_engine
+from trade_algos.blacklist import Blacklist
+from trade_algos.ledger import FillLedger
+from trade_algos.rate_limit import TokenBucket
+from trade_algos.stream import FakeStream
+from .broker import BacktestBarStore, SimulatedBroker
+from .clock import BacktestFinished, SimulatedClock
+
+
+def summarize(equity: np.ndarray, traded_value: float) -> dict:
+    '''
+    Returns the total return, the maximum drawdown (as positive fractions) and the turnover,
+    i.e. the value traded divided by the average equity.
+    '''
+    if len(equity) == 0:
+        return {'return': 0.0, 'max_drawdown': 0.0, 'turnover': 0.0}
+    peaks = np.maximum.accumulate(equity)
+    return {
+        'return': float(equity[-1] / equity[0] - 1),
+        'max_drawdown': float(np.max(1 - equity / peaks)),
+        'turnover': float(traded_value / np.mean(equity)),
+    }
+
+
+class BacktestResult:
+    def __init__(self, broker: SimulatedBroker):
+        curve = np.array(broker.equity_curve, dtype=[('t', '<i8'), ('equity', '<f8')])
+        self.timestamps = curve['t']
+        self.equity = curve['equity']
+        self.orders = list(broker.orders.values())
+        self.summary = summarize(self.equity, broker.traded_value)
+
+    def __repr__(self):
+        return f'BacktestResult({self.summary})'
+
+
+class Backtest:
+    '''
+    Replays stored bars through an unmodified algorithm. The algorithm's api is swapped for a
+    simulated broker and its clock for a simulated one, so every sleep advances simulated time.
+    '''
+
+    def __init__(self, algorithm, bar_store_path: str, start: arrow.Arrow, end: arrow.Arrow, timeframe: TimeFrame = TimeFrame.Hour, cash: float = 100000.0, slippage: float = 0.0005, commission: float = 0.0):
+        self.algorithm = algorithm
+        self.clock = SimulatedClock(start, end, get_period(timeframe))
+        self.bar_store = BacktestBarStore(bar_store_path, self.clock)
+        self.broker = SimulatedBroker(self.bar_store, self.clock, timeframe, cash, slippage, commission)
+
+    def prepare(self):
+        algorithm = self.algorithm
+        algorithm.set_api(self.broker)
+        algorithm.clock = self.clock
+        algorithm.bar_store = self.bar_store
+        algorithm.create_stream = FakeStream
+        # simulated time moves faster than the caches' wall clock, so don't cache anything
+        algorithm.price_ttl = 0
+        algorithm.account.max_age = 0
+        algorithm.positions.max_age = 0
+        algorithm.rate_limiter = TokenBucket(1e12)
+        if hasattr(algorithm, 'ledger'):
+            algorithm.ledger = FillLedger(get_engine('sqlite://'))
+        if hasattr(algorithm, 'blacklist'):
+            algorithm.blacklist = Blacklist(get_engine('sqlite://', BLACKLIST_TABLES), self.clock)
+
+    def run(self, *args, **kwargs) -> BacktestResult:
+        '''
+        Runs the algorithm with the given arguments until the simulated clock reaches the end.
+        '''
+        self.prepare()
+        try:
+            self.algorithm.run(*args, **kwargs)
+        except BacktestFinished:
+            pass
+        return BacktestResult(self.broker)
@@ -0,0 +1,274 @@
+import itertools
+from types import SimpleNamespace
+from typing import Dict, List, Union
+
+import arrow
+import numpy as np
+from alpaca_trade_api.rest import APIError, TimeFrame
+
+from bar_store import BarStore, get_period
+from .clock import SimulatedClock, next_market_close
+
+
+class BacktestBarStore(BarStore):
+    '''
+    Read-only view of a bar store for backtests. Files are memory-mapped once, nothing is
+    fetched, and reads never return a bar that has not closed yet on the simulated clock.
+    '''
+
+    def __init__(self, path: str, clock: SimulatedClock):
+        super().__init__(path)
+        self.clock = clock
+        self.loaded = {}
+
+    def load(self, symbol: str, timeframe: TimeFrame) -> np.ndarray:
+        # TimeFrame has no value equality, so key on its string form like the file names do
+        key = (symbol, str(timeframe))
+        if key not in self.loaded:
+            # keep the memory map, so processes replaying the same store share its pages
+            bars = super().read(symbol, timeframe)
+            self.loaded[key] = (bars['t'], bars, int(get_period(timeframe).total_seconds()))
+        return self.loaded[key]
+
+    def read(self, symbol: str, timeframe: TimeFrame, start: Union[arrow.Arrow, None] = None, end: Union[arrow.Arrow, None] = None) -> np.ndarray:
+        timestamps, bars, period = self.load(symbol, timeframe)
+        closed = self.clock.timestamp - period
+        if end is not None:
+            closed = min(closed, end.int_timestamp)
+        lo = 0
+        if start is not None:
+            lo = timestamps.searchsorted(start.int_timestamp, side='left')
+        hi = timestamps.searchsorted(closed, side='right')
+        return bars[lo:hi]
+
+    def last_close(self, symbol: str, timeframe: TimeFrame) -> Union[float, None]:
+        timestamps, bars, period = self.load(symbol, timeframe)
+        i = timestamps.searchsorted(self.clock.timestamp - period, side='right')
+        if i == 0:
+            return None
+        return float(bars['c'][i - 1])
+
+    def sync(self, api, symbols: List[str], timeframe: TimeFrame, start: arrow.Arrow, end: arrow.Arrow, rate_limiter=None) -> int:
+        return 0
+
+
+def reject(message: str):
+    raise APIError({'message': message})
+
+
+class SimulatedBroker:
+    '''
+    Implements the parts of the Alpaca REST client the algorithms use on top of stored bars.
+    Market orders fill straight away at the last closed bar's close plus slippage, limit and stop
+    orders fill when the price crosses them, and day orders expire at the close.
+    '''
+
+    def __init__(self, bar_store: BacktestBarStore, clock: SimulatedClock, timeframe: TimeFrame = TimeFrame.Hour, cash: float = 100000.0, slippage: float = 0.0005, commission: float = 0.0):
+        self.bar_store = bar_store
+        self.clock = clock
+        self.timeframe = timeframe
+        self.cash = cash
+        self.slippage = slippage
+        self.commission = commission
+        self.positions: Dict[str, SimpleNamespace] = {}
+        self.orders: Dict[str, SimpleNamespace] = {}
+        self.client_order_ids: Dict[str, SimpleNamespace] = {}
+        self.order_ids = itertools.count(1)
+        self.open_orders: Dict[str, SimpleNamespace] = {}
+        self.prices: Dict[str, Union[float, None]] = {}
+        self.prices_at = None
+        self.equity_curve = []
+        self.traded_value = 0.0
+        self._use_raw_data = False
+        clock.listeners.append(self.on_time)
+
+    # market data
+
+    def get_price(self, symbol: str) -> Union[float, None]:
+        # equity is marked to market on every clock tick, so remember the prices until it moves
+        if self.prices_at != self.clock.timestamp:
+            self.prices = {}
+            self.prices_at = self.clock.timestamp
+        if symbol not in self.prices:
+            self.prices[symbol] = self.bar_store.last_close(symbol, self.timeframe)
+        return self.prices[symbol]
+
+    def get_latest_trades(self, symbols: List[str]) -> dict:
+        trades = {}
+        for symbol in symbols:
+            price = self.get_price(symbol)
+            if price is not None:
+                trades[symbol] = SimpleNamespace(S=symbol, p=price, t=self.clock.now().isoformat())
+        return trades
+
+    def get_bars(self, symbol, timeframe: TimeFrame, start=None, end=None, limit=None, **kwargs) -> list:
+        symbols = [symbol] if isinstance(symbol, str) else symbol
+        start = arrow.get(start) if start is not None else None
+        end = arrow.get(end) if end is not None else None
+        bars = []
+        for s in symbols:
+            for bar in self.bar_store.read(s, timeframe, start, end):
+                bars.append(SimpleNamespace(S=s, t=arrow.get(int(bar['t'])).isoformat(), o=float(bar['o']), h=float(bar['h']),
+                                            l=float(bar['l']), c=float(bar['c']), v=float(bar['v'])))
+        return bars[:limit] if limit is not None else bars
+
+    def get_asset(self, symbol: str):
+        return SimpleNamespace(symbol=symbol, tradable=True, fractionable=True)
+
+    def list_assets(self, status=None, asset_class=None) -> list:
+        return [self.get_asset(symbol) for symbol in self.bar_store.symbols(self.timeframe)]
+
+    # clock and account
+
+    def get_clock(self):
+        return SimpleNamespace(is_open=self.clock.is_open, timestamp=self.clock.now().datetime,
+                               next_open=self.clock.next_open.to('UTC').datetime,
+                               next_close=self.clock.next_close.to('UTC').datetime)
+
+    def get_equity(self) -> float:
+        equity = self.cash
+        for symbol, position in self.positions.items():
+            price = self.get_price(symbol)
+            equity += position.qty * (price if price is not None else position.avg_entry_price)
+        return equity
+
+    def get_account(self):
+        equity = self.get_equity()
+        return SimpleNamespace(cash=self.cash, buying_power=self.cash, equity=equity, portfolio_value=equity)
+
+    def list_positions(self) -> list:
+        positions = []
+        for symbol, position in self.positions.items():
+            price = self.get_price(symbol) or position.avg_entry_price
+            positions.append(SimpleNamespace(symbol=symbol, qty=position.qty, avg_entry_price=position.avg_entry_price,
+                                             current_price=price, market_value=position.qty * price, side='long'))
+        return positions
+
+    def get_position(self, symbol: str):
+        for position in self.list_positions():
+            if position.symbol == symbol:
+                return position
+        reject('position does not exist')
+
+    # orders
+
+    def submit_order(self, symbol: str, side: str, type: str = 'market', time_in_force: str = 'day', qty=None, notional=None,
+                     limit_price=None, stop_price=None, client_order_id=None, **kwargs):
+        if client_order_id is not None and client_order_id in self.client_order_ids:
+            reject('client_order_id must be unique')
+        if qty is None and notional is None:
+            reject('qty or notional is required')
+
+        now = self.clock.now()
+        order = SimpleNamespace(
+            id=str(next(self.order_ids)), client_order_id=client_order_id, symbol=symbol, side=side, type=type,
+            time_in_force=time_in_force, qty=float(qty) if qty is not None else None,
+            notional=float(notional) if notional is not None else None,
+            limit_price=float(limit_price) if limit_price is not None else None,
+            stop_price=float(stop_price) if stop_price is not None else None,
+            status='new', filled_qty=0.0, filled_avg_price=None, filled_at=None,
+            submitted_at=now.isoformat(), expires_at=next_market_close(now) if time_in_force == 'day' else None)
+
+        price = self.get_price(symbol)
+        if price is None:
+            reject(f'no price data for {symbol}')
+        if type == 'market':
+            self.fill(order, price)
+        elif type not in ('limit', 'stop'):
+            reject(f'unsupported order type {type}')
+
+        self.orders[order.id] = order
+        if order.status == 'new':
+            self.open_orders[order.id] = order
+        if client_order_id is not None:
+            self.client_order_ids[client_order_id] = order
+        return order
+
+    def fill(self, order: SimpleNamespace, price: float):
+        fill_price = price * (1 + self.slippage) if order.side == 'buy' else price * (1 - self.slippage)
+        qty = order.qty if order.qty is not None else order.notional / fill_price
+        cost = qty * fill_price
+        position = self.positions.get(order.symbol)
+
+        if order.side == 'buy':
+            if cost + self.commission > self.cash + 1e-9:
+                reject('insufficient buying power')
+            self.cash -= cost + self.commission
+            if position is None:
+                self.positions[order.symbol] = SimpleNamespace(qty=qty, avg_entry_price=fill_price)
+            else:
+                position.avg_entry_price = (position.qty * position.avg_entry_price + cost) / (position.qty + qty)
+                position.qty += qty
+        else:
+            held = position.qty if position is not None else 0.0
+            if order.notional is not None:
+                qty = min(qty, held)
+                cost = qty * fill_price
+            if qty > held + 1e-9 or qty <= 0:
+                reject('insufficient qty available for order')
+            self.cash += cost - self.commission
+            position.qty -= qty
+            if position.qty <= 1e-9:
+                del self.positions[order.symbol]
+
+        self.traded_value += cost
+        order.status = 'filled'
+        order.filled_qty = qty
+        order.filled_avg_price = fill_price
+        order.filled_at = self.clock.now().isoformat()
+
+    def process_orders(self):
+        now = self.clock.now()
+        for order in list(self.open_orders.values()):
+            if order.status not in ('new', 'accepted'):
+                del self.open_orders[order.id]
+                continue
+            if order.expires_at is not None and now >= order.expires_at:
+                order.status = 'expired'
+                del self.open_orders[order.id]
+                continue
+            price = self.get_price(order.symbol)
+            if price is None:
+                continue
+            buy = order.side == 'buy'
+            if order.type == 'limit' and ((buy and price <= order.limit_price) or (not buy and price >= order.limit_price)):
+                price = min(price, order.limit_price) if buy else max(price, order.limit_price)
+            elif not (order.type == 'stop' and ((buy and price >= order.stop_price) or (not buy and price <= order.stop_price))):
+                continue
+            try:
+                self.fill(order, price)
+            except APIError:
+                order.status = 'rejected'
+            del self.open_orders[order.id]
+
+    def get_order(self, order_id: str):
+        if order_id not in self.orders:
+            reject('order not found')
+        return self.orders[order_id]
+
+    def get_order_by_client_order_id(self, client_order_id: str):
+        if client_order_id not in self.client_order_ids:
+            reject('order not found')
+        return self.client_order_ids[client_order_id]
+
+    def cancel_order(self, order_id: str):
+        order = self.get_order(order_id)
+        if order.status in ('new', 'accepted'):
+            order.status = 'canceled'
+
+    def list_orders(self, status: str = 'open', limit: Union[int, None] = None, after: Union[str, None] = None, symbols: Union[List[str], None] = None, **kwargs) -> list:
+        orders = []
+        for order in reversed(list(self.orders.values())):
+            is_open = order.status in ('new', 'accepted')
+            if status == 'open' and not is_open or status == 'closed' and is_open:
+                continue
+            if after is not None and arrow.get(order.submitted_at) < arrow.get(after):
+                continue
+            if symbols is not None and order.symbol not in symbols:
+                continue
+            orders.append(order)
+        return orders[:limit] if limit is not None else orders
+
+    def on_time(self, now: arrow.Arrow):
+        self.process_orders()
+        self.equity_curve.append((now.int_timestamp, self.get_equity()))
@@ -0,0 +1,89 @@
+from datetime import timedelta
+
+import arrow
+
+NY = 'America/New_York'
+MARKET_OPEN = (9, 30)
+MARKET_CLOSE = (16, 0)
+
+
+class BacktestFinished(BaseException):
+    '''
+    Raised by the simulated clock once it passes the end of the backtest. It derives from
+    BaseException so the strategies' own "except Exception" retry handlers don't swallow it.
+    '''
+    pass
+
+
+def is_market_open(t: arrow.Arrow) -> bool:
+    '''
+    Regular trading hours, Monday to Friday 9:30 to 16:00 New York time. Holidays are not modelled.
+    '''
+    local = t.to(NY)
+    if local.weekday() >= 5:
+        return False
+    return MARKET_OPEN <= (local.hour, local.minute) < MARKET_CLOSE
+
+
+def next_session_time(t: arrow.Arrow, hour_minute) -> arrow.Arrow:
+    '''
+    Returns the first weekday time at hour_minute New York time that is after t.
+    '''
+    day = t.to(NY).floor('day')
+    for i in range(8):
+        candidate = day.shift(days=i)
+        if candidate.weekday() >= 5:
+            continue
+        candidate = arrow.get(candidate.datetime.replace(
+            hour=hour_minute[0], minute=hour_minute[1]).replace(tzinfo=None), NY)
+        if candidate > t:
+            return candidate
+    raise ValueError('no trading day within a week')
+
+
+def next_market_open(t: arrow.Arrow) -> arrow.Arrow:
+    return next_session_time(t, MARKET_OPEN)
+
+
+def next_market_close(t: arrow.Arrow) -> arrow.Arrow:
+    return next_session_time(t, MARKET_CLOSE)
+
+
+class SimulatedClock:
+    '''
+    Drop-in replacement for the algorithms' wall clock. Sleeping advances simulated time, and
+    since nothing changes between bar closes and market opens or closes, a short sleep jumps
+    straight to the next of those events.
+    '''
+
+    def __init__(self, start: arrow.Arrow, end: arrow.Arrow, period: timedelta):
+        self.end = end
+        self.period = int(period.total_seconds())
+        self.listeners = []
+        self.set_time(start)
+
+    def set_time(self, t: arrow.Arrow):
+        self.current = t
+        self.timestamp = t.int_timestamp
+        self.next_open = next_market_open(t)
+        self.next_close = next_market_close(t)
+        self.is_open = is_market_open(t)
+
+    def now(self) -> arrow.Arrow:
+        return self.current
+
+    def next_event(self) -> int:
+        next_bar = (self.timestamp // self.period + 1) * self.period
+        return min(next_bar, self.next_open.int_timestamp, self.next_close.int_timestamp)
+
+    def sleep(self, seconds: float):
+        timestamp = max(self.timestamp + int(seconds), self.next_event())
+        if timestamp > self.end.int_timestamp:
+            raise BacktestFinished()
+        if timestamp >= self.next_open.int_timestamp or timestamp >= self.next_close.int_timestamp:
+            self.set_time(arrow.get(timestamp))
+        else:
+            self.current = arrow.get(timestamp)
+            self.timestamp = timestamp
+        for listener in self.listeners:
+            listener(self.current)
@@ -0,0 +1,72 @@
+import contextlib
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import List, Union
+
+import arrow
+
+from trade_algos.mean_reversion import TIMEFRAMES, MeanReversionAlgorithm
+from . import Backtest
+
+SWEEP_COLUMNS = ['timeframe', 'top_n', 'chunk_size', 'budget', 'return', 'max_drawdown', 'turnover']
+
+
+def param_grid(**values) -> List[dict]:
+    '''
+    Returns every combination of the given parameter values, e.g. param_grid(top_n=[5, 10], budget=0.0)
+    -> [{'top_n': 5, 'budget': 0.0}, {'top_n': 10, 'budget': 0.0}]. A single value counts as a list of one,
+    so values can come straight from the command line. Raises ValueError for an unknown timeframe.
+    '''
+    values = {key: list(value) if isinstance(value, (list, tuple)) else [value] for key, value in values.items()}
+    for timeframe in values.get('timeframe', []):
+        if timeframe not in TIMEFRAMES:
+            raise ValueError(f'unknown timeframe {timeframe!r}, expected one of {TIMEFRAMES}')
+    keys = list(values.keys())
+    return [dict(zip(keys, combination)) for combination in itertools.product(*values.values())]
+
+
+def run_mean_reversion(params: dict, symbols: List[str], bar_store_path: str, start: arrow.Arrow, end: arrow.Arrow, cash: float = 100000.0, slippage: float = 0.0005) -> dict:
+    '''
+    Backtests MeanReversionAlgorithm with one parameter set and returns the parameters
+    together with the result's summary. The algorithm's output is discarded.
+    '''
+    # the simulated broker replaces the REST client, so the keys are never used
+    algorithm = MeanReversionAlgorithm('backtest', 'backtest')
+    algorithm.set_top_n(params.get('top_n', algorithm.top_n))
+    algorithm.set_chunk_size(params.get('chunk_size', algorithm.chunk_size))
+    algorithm.set_budget(params.get('budget', algorithm.budget))
+    # the sweep already runs one backtest per core
+    algorithm.set_max_workers(1)
+
+    backtest = Backtest(algorithm, bar_store_path, start, end, cash=cash, slippage=slippage)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        result = backtest.run(symbols, timeFrame=params.get('timeframe', 'month'))
+    return {**params, **result.summary}
+
+
+def sweep(grid: List[dict], symbols: List[str], bar_store_path: str, start: arrow.Arrow, end: arrow.Arrow, cash: float = 100000.0, slippage: float = 0.0005, max_workers: Union[int, None] = None) -> List[dict]:
+    '''
+    Backtests every parameter set of the grid in a process pool, one process per core by default.
+    Workers memory-map the same bar store files, so the bars are shared instead of copied.
+    Returns one row per parameter set, best return first.
+    '''
+    run = partial(run_mean_reversion, symbols=symbols, bar_store_path=bar_store_path,
+                  start=start, end=end, cash=cash, slippage=slippage)
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        results = list(executor.map(run, grid))
+    return sorted(results, key=lambda row: row['return'], reverse=True)
+
+
+def format_table(rows: List[dict], columns: List[str] = SWEEP_COLUMNS) -> str:
+    '''
+    Formats sweep results as a plain text table.
+    '''
+    cells = [[f'{row[column]:.4f}' if isinstance(row.get(column), float) else str(row.get(column, ''))
+              for column in columns] for row in rows]
+    widths = [max([len(column)] + [len(line[i]) for line in cells]) for i, column in enumerate(columns)]
+    lines = ['  '.join(column.ljust(width) for column, width in zip(columns, widths))]
+    for line in cells:
+        lines.append('  '.join(cell.ljust(width) for cell, width in zip(line, widths)))
+    return '\n'.join(lines)
@@ -0,0 +1,106 @@
+import arrow
+import numpy as np
+import pytest
+from alpaca_trade_api.rest import APIError, TimeFrame
+
+from bar_store import BAR_DTYPE, BarStore, get_period
+from trade_algos.mean_reversion import MeanReversionAlgorithm
+from . import Backtest
+from .broker import BacktestBarStore, SimulatedBroker
+from .clock import BacktestFinished, SimulatedClock
+from .sweep import format_table, param_grid, sweep
+
+START = arrow.get('2022-06-01T00:00:00+00:00')
+
+
+def make_store(path, closes_by_symbol):
+    store = BarStore(str(path))
+    for symbol, closes in closes_by_symbol.items():
+        bars = np.zeros(len(closes), dtype=BAR_DTYPE)
+        bars['t'] = START.int_timestamp + np.arange(len(closes)) * 3600
+        bars['o'] = bars['h'] = bars['l'] = bars['c'] = closes
+        store.write(symbol, TimeFrame.Hour, bars)
+    return store
+
+
+def test_clock_jumps_to_market_events():
+    # Wednesday 2022-06-01 00:00 UTC is 20:00 the previous evening in New York
+    clock = SimulatedClock(START, START.shift(days=7), get_period(TimeFrame.Hour))
+    assert not clock.is_open
+    clock.sleep(1)
+    assert clock.now() == START.shift(hours=1)
+    while not clock.is_open:
+        clock.sleep(60)
+    assert clock.now().to('America/New_York').format('HH:mm') == '09:30'
+    with pytest.raises(BacktestFinished):
+        clock.sleep(60 * 60 * 24 * 7)
+
+
+def test_broker_fills_with_slippage_and_only_sees_closed_bars(tmp_path):
+    make_store(tmp_path, {'AAPL': np.arange(100.0, 148.0)})
+    clock = SimulatedClock(START.shift(hours=14), START.shift(days=2), get_period(TimeFrame.Hour))
+    broker = SimulatedBroker(BacktestBarStore(str(tmp_path), clock), clock, cash=1000.0, slippage=0.01)
+
+    # the bar that opened at 13:00 closed at 14:00, the 14:00 bar hasn't closed yet
+    assert broker.get_price('AAPL') == 113.0
+    assert len(broker.get_bars('AAPL', TimeFrame.Hour, START)) == 14
+
+    order = broker.submit_order('AAPL', 'buy', qty=2, client_order_id='a')
+    assert order.status == 'filled'
+    assert order.filled_avg_price == pytest.approx(113.0 * 1.01)
+    assert broker.cash == pytest.approx(1000.0 - 2 * 113.0 * 1.01)
+    with pytest.raises(APIError):
+        broker.submit_order('AAPL', 'buy', qty=1, client_order_id='a')
+    with pytest.raises(APIError):
+        broker.submit_order('AAPL', 'buy', qty=100)
+
+    limit = broker.submit_order('AAPL', 'sell', type='limit', qty=2, limit_price=116.0,
+                                time_in_force='gtc')
+    clock.sleep(3600)
+    assert limit.status == 'new'
+    clock.sleep(3600 * 2)
+    assert limit.status == 'filled'
+    assert limit.filled_avg_price == pytest.approx(116.0 * 0.99)
+    assert broker.positions == {}
+
+
+def test_mean_reversion_backtest(tmp_path):
+    hours = 24 * 60
+    make_store(tmp_path, {
+        'UP': 100.0 + np.arange(hours) * 0.1,
+        'DOWN': 500.0 - np.arange(hours) * 0.1,
+    })
+    algo = MeanReversionAlgorithm('key', 'secret')
+    backtest = Backtest(algo, str(tmp_path), START.shift(days=35), START.shift(days=42), cash=10000.0)
+    result = backtest.run(['UP', 'DOWN'])
+
+    assert {order.symbol for order in result.orders} == {'UP'}
+    assert result.timestamps[-1] <= START.shift(days=42).int_timestamp
+    assert result.summary['return'] > 0
+
+
+def test_sweep(tmp_path):
+    hours = 24 * 60
+    make_store(tmp_path, {
+        'UP': 100.0 + np.arange(hours) * 0.1,
+        'FLAT': 50.0 + np.arange(hours) * 0.01,
+        'DOWN': 500.0 - np.arange(hours) * 0.1,
+    })
+    grid = param_grid(top_n=[1, 2], budget=[0.0, 1000.0])
+    results = sweep(grid, ['UP', 'FLAT', 'DOWN'], str(tmp_path), START.shift(days=35),
+                    START.shift(days=42), cash=10000.0, max_workers=2)
+
+    assert len(results) == 4
+    assert sorted((row['top_n'], row['budget']) for row in results) == \
+        sorted((params['top_n'], params['budget']) for params in grid)
+    assert [row['return'] for row in results] == sorted((row['return'] for row in results), reverse=True)
+    assert 'max_drawdown' in format_table(results).splitlines()[0]
+
+
+def test_param_grid_wraps_single_values_and_checks_timeframes():
+    assert param_grid(timeframe='week', top_n=5, budget=[0.0, 10.0]) == [
+        {'timeframe': 'week', 'top_n': 5, 'budget': 0.0},
+        {'timeframe': 'week', 'top_n': 5, 'budget': 10.0},
+    ]
+    with pytest.raises(ValueError):
+        param_grid(timeframe=['week', 'fortnight'])
@@ -0,0 +1,188 @@
+import os
+from datetime import timedelta
+from typing import Dict, List, Tuple, Union
+
+import arrow
+import numpy as np
+from alpaca_trade_api.rest import TimeFrame, TimeFrameUnit
+
+# one record per bar, t is the bar open time in unix seconds
+BAR_DTYPE = np.dtype([
+    ('t', '<i8'),
+    ('o', '<f8'),
+    ('h', '<f8'),
+    ('l', '<f8'),
+    ('c', '<f8'),
+    ('v', '<f8'),
+])
+
+COVERAGE_DTYPE = np.dtype('<i8')
+
+
+def get_period(timeframe: TimeFrame) -> timedelta:
+    '''
+    Returns the length of a single bar for the given timeframe. Months are treated as 31 days.
+    '''
+    units = {
+        TimeFrameUnit.Minute: timedelta(minutes=1),
+        TimeFrameUnit.Hour: timedelta(hours=1),
+        TimeFrameUnit.Day: timedelta(days=1),
+        TimeFrameUnit.Week: timedelta(weeks=1),
+        TimeFrameUnit.Month: timedelta(days=31),
+    }
+    return units[timeframe.unit] * timeframe.amount
+
+
+def bars_to_array(bars) -> np.ndarray:
+    '''
+    Converts a list of Alpaca bars into a structured array sorted by time.
+    '''
+    array = np.empty(len(bars), dtype=BAR_DTYPE)
+    for i, bar in enumerate(bars):
+        array[i] = (arrow.get(bar.t).int_timestamp,
+                    bar.o, bar.h, bar.l, bar.c, bar.v)
+    return np.sort(array, order='t')
+
+
+class BarStore:
+    '''
+    Append-only on-disk bar store. Bars are kept in one flat binary file per symbol and timeframe,
+    memory-mapped on read, and only the time ranges that are not on disk yet are fetched from Alpaca.
+    '''
+    settle_periods = 2  # the last bars before the end may not be published yet, so they are fetched again
+
+    def __init__(self, path: str = './bars'):
+        self.path = path
+
+    def get_filename(self, symbol: str, timeframe: TimeFrame) -> str:
+        return os.path.join(self.path, str(timeframe), f'{symbol}.bin')
+
+    def symbols(self, timeframe: TimeFrame) -> List[str]:
+        '''
+        Returns the symbols that have bars stored for the timeframe.
+        '''
+        directory = os.path.join(self.path, str(timeframe))
+        if not os.path.isdir(directory):
+            return []
+        return sorted(filename[:-len('.bin')] for filename in os.listdir(directory) if filename.endswith('.bin'))
+
+    def get_coverage_filename(self, symbol: str, timeframe: TimeFrame) -> str:
+        return os.path.join(self.path, str(timeframe), f'{symbol}.meta')
+
+    def get_coverage(self, symbol: str, timeframe: TimeFrame) -> Union[Tuple[int, int], None]:
+        '''
+        Returns the (start, end) unix timestamps that have already been fetched for the symbol.
+        '''
+        filename = self.get_coverage_filename(symbol, timeframe)
+        if not os.path.exists(filename):
+            return None
+        coverage = np.fromfile(filename, dtype=COVERAGE_DTYPE)
+        return int(coverage[0]), int(coverage[1])
+
+    def set_coverage(self, symbol: str, timeframe: TimeFrame, start: int, end: int):
+        filename = self.get_coverage_filename(symbol, timeframe)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        np.array([start, end], dtype=COVERAGE_DTYPE).tofile(filename + '.tmp')
+        os.replace(filename + '.tmp', filename)
+
+    def read(self, symbol: str, timeframe: TimeFrame, start: Union[arrow.Arrow, None] = None, end: Union[arrow.Arrow, None] = None) -> np.ndarray:
+        '''
+        Returns the stored bars for the symbol between start and end as a read-only memory-mapped array.
+        '''
+        filename = self.get_filename(symbol, timeframe)
+        if not os.path.exists(filename) or os.path.getsize(filename) == 0:
+            return np.empty(0, dtype=BAR_DTYPE)
+        bars = np.memmap(filename, dtype=BAR_DTYPE, mode='r')
+        lo = 0
+        hi = len(bars)
+        if start is not None:
+            lo = np.searchsorted(bars['t'], start.int_timestamp, side='left')
+        if end is not None:
+            hi = np.searchsorted(bars['t'], end.int_timestamp, side='right')
+        return bars[lo:hi]
+
+    def write(self, symbol: str, timeframe: TimeFrame, bars: np.ndarray) -> int:
+        '''
+        Adds bars to the store, skipping bars that are already stored. New bars after the
+        last stored bar are appended, anything older forces the file to be rewritten in order.
+        Returns the number of bars added.
+        '''
+        filename = self.get_filename(symbol, timeframe)
+        stored = self.read(symbol, timeframe)
+        if len(stored) > 0:
+            bars = bars[~np.isin(bars['t'], stored['t'])]
+        if len(bars) == 0:
+            return 0
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+        if len(stored) == 0 or bars['t'].min() > stored['t'][-1]:
+            with open(filename, 'ab') as f:
+                bars.tofile(f)
+            return len(bars)
+
+        merged = np.sort(np.concatenate([np.asarray(stored), bars]), order='t')
+        del stored
+        merged.tofile(filename + '.tmp')
+        os.replace(filename + '.tmp', filename)
+        return len(bars)
+
+    def sync(self, api, symbols: List[str], timeframe: TimeFrame, start: arrow.Arrow, end: arrow.Arrow, rate_limiter=None) -> int:
+        '''
+        Fetches the bars missing from the store. Symbols whose missing bars start at about the same
+        time share a request, so symbols that are up to date are not downloaded again because
+        another symbol is new or needs older bars. Only bars that have closed before end are stored. Coverage only moves past the last
+        settle_periods bars once a bar there has been received. Returns the number of bars added.
+        If a rate limiter is given, it is acquired before each request.
+        '''
+        period = get_period(timeframe)
+        start_ts = start.int_timestamp
+        closed_ts = end.shift(seconds=-period.total_seconds()).int_timestamp
+        settle_seconds = self.settle_periods * int(period.total_seconds())
+        settled_ts = closed_ts - settle_seconds
+
+        # where the missing bars of each symbol start, they all run up to end
+        missing = {}
+        for symbol in symbols:
+            coverage = self.get_coverage(symbol, timeframe)
+            if coverage is None or start_ts < coverage[0]:
+                missing_start = start_ts
+            elif closed_ts > coverage[1]:
+                missing_start = coverage[1]
+            else:
+                continue
+            if missing_start <= closed_ts:
+                missing[symbol] = missing_start
+
+        # symbols whose missing bars start within settle_periods bars of each other share a request
+        groups = []
+        for symbol, missing_start in sorted(missing.items(), key=lambda item: item[1]):
+            if groups and missing_start - groups[-1][0] <= settle_seconds:
+                groups[-1][1].append(symbol)
+            else:
+                groups.append((missing_start, [symbol]))
+
+        bars_by_symbol: Dict[str, list] = {}
+        fetch_starts = {}
+        for fetch_start, group in groups:
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+            bars = api.get_bars(group, timeframe, start=arrow.get(fetch_start).isoformat(),
+                                end=end.isoformat())
+            for bar in bars:
+                bars_by_symbol.setdefault(bar.S, []).append(bar)
+            fetch_starts.update((symbol, fetch_start) for symbol in group)
+
+        added = 0
+        for symbol, fetch_start in fetch_starts.items():
+            array = bars_to_array(bars_by_symbol.get(symbol, []))
+            array = array[array['t'] <= closed_ts]
+            added += self.write(symbol, timeframe, array)
+            # bars missing at the end may be late, halted symbols just don't have them
+            covered_ts = max(settled_ts, int(array['t'][-1]) if len(array) > 0 else fetch_start)
+            coverage = self.get_coverage(symbol, timeframe)
+            if coverage is None:
+                self.set_coverage(symbol, timeframe, fetch_start, max(fetch_start, covered_ts))
+            else:
+                self.set_coverage(symbol, timeframe, min(coverage[0], fetch_start),
+                                  max(coverage[1], covered_ts))
+        return added
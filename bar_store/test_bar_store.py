@@ -0,0 +1,67 @@
+import arrow
+from alpaca_trade_api.rest import TimeFrame
+
+from tests.fakes import FakeApi, make_bars
+
+from . import BarStore
+
+
+def test_sync_fetches_only_missing_tail(tmp_path):
+    start = arrow.get('2022-06-01T00:00:00+00:00')
+    closes = [float(i) for i in range(48)]
+    api = FakeApi(make_bars('AAPL', start, closes) + make_bars('MSFT', start, closes))
+    store = BarStore(str(tmp_path))
+
+    store.sync(api, ['AAPL', 'MSFT'], TimeFrame.Hour, start, start.shift(hours=24))
+    assert len(store.read('AAPL', TimeFrame.Hour)) == 24
+
+    added = store.sync(api, ['AAPL', 'MSFT'], TimeFrame.Hour,
+                       start, start.shift(hours=30))
+    assert added == 12
+    assert len(api.requests) == 2
+    assert arrow.get(api.requests[1][1]) == start.shift(hours=23)
+
+    bars = store.read('MSFT', TimeFrame.Hour, start.shift(hours=10))
+    assert bars['c'][0] == 10
+    assert list(bars['c']) == sorted(bars['c'])
+
+
+def test_sync_backfills_head(tmp_path):
+    start = arrow.get('2022-06-01T00:00:00+00:00')
+    api = FakeApi(make_bars('AAPL', start, [float(i) for i in range(48)]))
+    store = BarStore(str(tmp_path))
+
+    store.sync(api, ['AAPL'], TimeFrame.Hour,
+               start.shift(hours=24), start.shift(hours=48))
+    store.sync(api, ['AAPL'], TimeFrame.Hour, start, start.shift(hours=48))
+    bars = store.read('AAPL', TimeFrame.Hour)
+    assert list(bars['c']) == [float(i) for i in range(48)]
+
+
+def test_sync_refetches_bars_published_late(tmp_path):
+    start = arrow.get('2022-06-01T00:00:00+00:00')
+    bars = make_bars('AAPL', start, [float(i) for i in range(24)])
+    # the last two closed bars are not published yet
+    api = FakeApi(bars[:22])
+    store = BarStore(str(tmp_path))
+
+    store.sync(api, ['AAPL'], TimeFrame.Hour, start, start.shift(hours=24))
+    assert len(store.read('AAPL', TimeFrame.Hour)) == 22
+
+    api.bars = bars
+    assert store.sync(api, ['AAPL'], TimeFrame.Hour, start, start.shift(hours=24)) == 2
+    assert list(store.read('AAPL', TimeFrame.Hour)['c']) == [float(i) for i in range(24)]
+
+
+def test_sync_does_not_refetch_up_to_date_symbols(tmp_path):
+    start = arrow.get('2022-06-01T00:00:00+00:00')
+    closes = [float(i) for i in range(48)]
+    api = FakeApi(make_bars('AAPL', start, closes) + make_bars('MSFT', start, closes))
+    store = BarStore(str(tmp_path))
+    store.sync(api, ['AAPL'], TimeFrame.Hour, start, start.shift(hours=24))
+
+    # MSFT is new, AAPL only needs its tail
+    store.sync(api, ['AAPL', 'MSFT'], TimeFrame.Hour, start, start.shift(hours=30))
+    assert [(symbols, arrow.get(fetch_start)) for symbols, fetch_start, _ in api.requests[1:]] == [
+        (['MSFT'], start), (['AAPL'], start.shift(hours=23))]
+    assert len(store.read('AAPL', TimeFrame.Hour)) == len(store.read('MSFT', TimeFrame.Hour)) == 30
@@ -0,0 +1,62 @@
+'''
+Compares the per-symbol Python loop that MeanReversionAlgorithm.mean used to run
+against the vectorized rate of change engine.
+
+    python -m benchmarks.bench_analytics
+'''
+import time
+
+import numpy as np
+
+from trade_algos.analytics import rate_of_change_stats
+
+BARS_PER_SYMBOL = 336  # a month of hourly bars
+
+
+def make_bars(n_symbols: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    symbol_index = np.repeat(np.arange(n_symbols), BARS_PER_SYMBOL)
+    timestamps = np.tile(np.arange(BARS_PER_SYMBOL) * 3600, n_symbols)
+    closes = 100 + rng.standard_normal(len(symbol_index)).cumsum()
+    # the API does not guarantee ordering, so shuffle the rows
+    order = rng.permutation(len(symbol_index))
+    return symbol_index[order], timestamps[order], closes[order]
+
+
+def loop_means(symbol_index, timestamps, closes) -> dict:
+    bars_by_symbol = {}
+    for symbol, t, c in zip(symbol_index.tolist(), timestamps.tolist(), closes.tolist()):
+        if symbol in bars_by_symbol:
+            bars_by_symbol[symbol].append((t, c))
+        else:
+            bars_by_symbol[symbol] = [(t, c)]
+
+    means = {}
+    for symbol in bars_by_symbol:
+        bars_by_symbol[symbol].sort(key=lambda bar: bar[0])
+        changes = []
+        for i in range(1, len(bars_by_symbol[symbol])):
+            changes.append(bars_by_symbol[symbol][i][1] - bars_by_symbol[symbol][i-1][1])
+        means[symbol] = sum(changes) / len(changes)
+    return means
+
+
+def bench(n_symbols: int):
+    symbol_index, timestamps, closes = make_bars(n_symbols)
+
+    start = time.perf_counter()
+    expected = loop_means(symbol_index, timestamps, closes)
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    mean, _, _ = rate_of_change_stats(symbol_index, timestamps, closes, n_symbols)
+    vector_time = time.perf_counter() - start
+
+    assert np.allclose([expected[i] for i in range(n_symbols)], mean)
+    print(f'{n_symbols} symbols: loop {loop_time:.3f}s, vectorized {vector_time:.3f}s, '
+          f'speedup {loop_time / vector_time:.1f}x')
+
+
+if __name__ == '__main__':
+    for n_symbols in [1000, 10000]:
+        bench(n_symbols)
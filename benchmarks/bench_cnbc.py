@@ -0,0 +1,82 @@
+'''
+Compares parsing Lightning Round articles with BeautifulSoup against the streaming quote
+link parser, and fetching them one at a time against ingest_articles.
+
+    python -m benchmarks.bench_cnbc
+'''
+import tempfile
+import time
+from types import SimpleNamespace
+
+from bs4 import BeautifulSoup
+
+from cnbc_article_parser import get_article_data, ingest_articles
+
+LATENCY = 0.05  # seconds per simulated request
+
+
+def make_article(seed: int) -> str:
+    # about the size of a real article page: navigation and scripts around a few dozen picks
+    nav = ''.join(f'<li><a href="https://www.cnbc.com/section/{i}">Section {i}</a></li>' for i in range(400))
+    script = '<script>' + 'var x = 1;' * 2000 + '</script>'
+    picks = ''.join(f'<p><a href="https://www.cnbc.com/quotes/T{seed}{i}">Company {i}</a>: '
+                    f'"I like it, buy buy buy." <a href="/video/{i}">Watch</a></p>' for i in range(30))
+    return f'<html><head>{script}</head><body><ul>{nav}</ul><div class="ArticleBody">{picks}</div></body></html>'
+
+
+def soup_article_data(article_html) -> dict:
+    soup = BeautifulSoup(article_html, 'html.parser')
+    links = [link for link in soup.find_all('a') if 'cnbc.com/quotes' in (link.get('href') or '')]
+    return {link.get('href').split('/')[-1]: link.parent.text for link in links}
+
+
+class SlowSession:
+    def __init__(self, pages):
+        self.pages = pages
+
+    def get(self, url, headers=None, timeout=None):
+        time.sleep(LATENCY)
+        return SimpleNamespace(text=self.pages[url], raise_for_status=lambda: None)
+
+
+def bench_parse(n_articles: int):
+    articles = [make_article(i) for i in range(n_articles)]
+
+    start = time.perf_counter()
+    expected = [soup_article_data(article) for article in articles]
+    soup_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    data = [get_article_data(article) for article in articles]
+    stream_time = time.perf_counter() - start
+
+    assert data == expected
+    print(f'parse {n_articles} articles: BeautifulSoup {soup_time:.3f}s, streaming {stream_time:.3f}s, '
+          f'speedup {soup_time / stream_time:.1f}x')
+
+
+def bench_ingest(n_articles: int):
+    pages = {f'https://www.cnbc.com/{i}.html': make_article(i) for i in range(n_articles)}
+    session = SlowSession(pages)
+
+    start = time.perf_counter()
+    for url in pages:
+        soup_article_data(session.get(url).text)
+    serial_time = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        start = time.perf_counter()
+        ingest_articles(list(pages), cache_dir=cache_dir, session=session)
+        ingest_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        ingest_articles(list(pages), cache_dir=cache_dir, session=session)
+        cached_time = time.perf_counter() - start
+
+    print(f'ingest {n_articles} articles at {LATENCY * 1000:.0f}ms each: one at a time {serial_time:.2f}s, '
+          f'concurrent {ingest_time:.2f}s, cached {cached_time:.2f}s')
+
+
+if __name__ == '__main__':
+    bench_parse(100)
+    bench_ingest(300)
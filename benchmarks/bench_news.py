@@ -0,0 +1,37 @@
+'''
+Load tests the news pipeline offline, against the local stand-ins for NewsAPI and CNBC,
+and times ticker lookups in the mention index.
+
+    python -m benchmarks.bench_news
+'''
+import time
+
+from news_pipeline import FakeCnbcSession, FakeNewsApi, NewsPipeline, newsapi_batches
+
+LATENCY = 0.02  # seconds per simulated page request
+
+
+def bench(n_articles: int, page_size: int = 100):
+    news_api = FakeNewsApi(n_articles=n_articles)
+    pipeline = NewsPipeline(session=FakeCnbcSession(news_api.pages, latency=LATENCY))
+
+    start = time.perf_counter()
+    index = pipeline.run(newsapi_batches(news_api, pages=n_articles // page_size + 1, page_size=page_size))
+    run_time = time.perf_counter() - start
+
+    tickers = index.tickers()
+    start = time.perf_counter()
+    for _ in range(100):
+        for ticker in tickers:
+            index.get_latest(ticker)
+    lookup_time = (time.perf_counter() - start) / (100 * len(tickers))
+
+    stats = pipeline.stats
+    print(f"{n_articles} articles at {LATENCY * 1000:.0f}ms each: {run_time:.2f}s, "
+          f"{stats['parsed']} parsed, {stats['duplicates']} duplicates, {stats['mentions']} mentions, "
+          f"lookup {lookup_time * 1e9:.0f}ns")
+
+
+if __name__ == '__main__':
+    for n_articles in [1000, 5000]:
+        bench(n_articles)
@@ -1,42 +1,221 @@
 import os
+import re
+import html
 import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Union
 
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from newsapi import NewsApiClient
 from dotenv import load_dotenv
 
 load_dotenv()
 
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_4) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/81.0.4044.138 Safari/537.36"
+}
+QUOTE_LINK = "cnbc.com/quotes"
+# elements that never have an end tag, so they are never the parent of a link
+VOID_ELEMENTS = {"area", "base", "br", "col", "embed", "hr", "img", "input",
+                 "link", "meta", "param", "source", "track", "wbr"}
+RAW_TEXT_ELEMENTS = {tag: re.compile(f"</{tag}\\s*>", re.IGNORECASE) for tag in ["script", "style"]}
+# comments, doctypes and processing instructions, or a start or end tag with its attributes
+TAG = re.compile(r"""<!--.*?-->|<[!?][^>]*>|<(/?)([a-zA-Z][^\s/>]*)((?:[^>"']|"[^"]*"|'[^']*')*)>""", re.DOTALL)
+HREF = re.compile(r"""(?:^|\s)href\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""", re.IGNORECASE)
 
-def get_article_html(url):
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_4) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/81.0.4044.138 Safari/537.36"
-    }
-    response = requests.get(url, headers=headers)
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    '''
+    Returns the session shared by every article request. It keeps connections to CNBC open
+    and retries failed requests with a backoff.
+    '''
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                          allowed_methods=['GET'])
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=retry)
+            _session = requests.Session()
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+
+def get_article_html(url, session=None, timeout=10):
+    session = session if session is not None else get_session()
+    response = session.get(url, headers=HEADERS, timeout=timeout)
+    response.raise_for_status()
 
     return response.text
 
 
+class QuoteLinkParser:
+    '''
+    Streams through an article and keeps only the quote links and the text of the element
+    around each of them. Tags are found with a single regular expression instead of a full
+    HTML tokenizer and no tree is built: the open elements are a stack of offsets into the
+    text seen so far, and an element's text is joined only if it contains a quote link.
+    '''
+
+    def __init__(self):
+        self.chunks = []
+        # [tag, index of its first chunk, indexes of the quote links directly inside it], starting with the document
+        self.stack = [[None, 0, []]]
+        self.links = []  # [ticker, text of the link's parent]
+
+    def start_tag(self, tag, attrs):
+        if tag == "a":
+            match = HREF.search(attrs)
+            href = html.unescape(next(group for group in match.groups() if group is not None)) if match else None
+            if href and QUOTE_LINK in href:
+                self.stack[-1][2].append(len(self.links))
+                self.links.append([href.split("/")[-1], None])
+        if tag not in VOID_ELEMENTS:
+            self.stack.append([tag, len(self.chunks), []])
+            if attrs.endswith("/"):
+                self.end_tag(tag)
+
+    def end_tag(self, tag):
+        # close the most recent element with the tag, and any left open inside it
+        for i in range(len(self.stack) - 1, 0, -1):
+            if self.stack[i][0] == tag:
+                break
+        else:
+            return
+        while len(self.stack) > i:
+            self.pop_element()
+
+    def pop_element(self):
+        _, start, links = self.stack.pop()
+        if links:
+            text = html.unescape("".join(self.chunks[start:]))
+            for link in links:
+                self.links[link][1] = text
+
+    def parse(self, article_html) -> Dict[str, str]:
+        position = 0
+        while True:
+            match = TAG.search(article_html, position)
+            if match is None:
+                break
+            if match.start() > position:
+                self.chunks.append(article_html[position:match.start()])
+            position = match.end()
+            closing, tag, attrs = match.groups()
+            if tag is None:
+                continue  # a comment, doctype or processing instruction
+            tag = tag.lower()
+            if closing:
+                self.end_tag(tag)
+                continue
+            self.start_tag(tag, attrs)
+            if tag in RAW_TEXT_ELEMENTS and not attrs.endswith("/"):
+                # their content is code, not markup or text, so skip to the end tag
+                end = RAW_TEXT_ELEMENTS[tag].search(article_html, position)
+                position = end.start() if end else len(article_html)
+        if position < len(article_html):
+            self.chunks.append(article_html[position:])
+        while self.stack:
+            self.pop_element()
+        return {ticker: text for ticker, text in self.links}
+
+
 def get_article_data(article_html):
     '''
     Returns a dictionary of the article's data. Tickers are the keys and the intent phrase that needs to be analyzed is the value.
     '''
-    soup = BeautifulSoup(article_html, "html.parser")
-    links = soup.find_all("a")
-    # all links must contain the substring 'cnbc.com/quotes'
-    links = [link for link in links if "cnbc.com/quotes" in link.get("href")]
-    link_parents = [link.parent for link in links]
-    # get all the raw text of each link
-    link_texts = [link.text for link in link_parents]
-    # get the tickers from the links
-    tickers = []
-    for link in links:
-        href = link.get("href")
-        ticker = href.split("/")[-1]
-        tickers.append(ticker)
+    if QUOTE_LINK not in article_html:
+        return {}
+    return QuoteLinkParser().parse(article_html)
+
+
+class ArticleCache:
+    '''
+    Tickers and phrases extracted from articles, kept on disk by URL and by a hash of the page, so
+    an article is fetched once and a page served under several URLs is parsed once.
+    '''
+
+    def __init__(self, cache_dir='./cnbc_cache'):
+        self.cache_dir = cache_dir
+
+    def get_filename(self, kind, key):
+        return os.path.join(self.cache_dir, kind + '-' + hashlib.sha1(key.encode()).hexdigest() + '.json')
+
+    def load(self, kind, key):
+        filename = self.get_filename(kind, key)
+        if not os.path.exists(filename):
+            return None
+        with open(filename, 'r') as f:
+            return json.load(f)
+
+    def store(self, kind, key, value):
+        filename = self.get_filename(kind, key)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # written under a unique name first, so concurrent readers never see half a file
+        temp = f'{filename}.{threading.get_ident()}.tmp'
+        with open(temp, 'w') as f:
+            json.dump(value, f)
+        os.replace(temp, filename)
+
+    def get_url(self, url) -> Union[Dict[str, str], None]:
+        cached = self.load('url', url)
+        return cached['data'] if cached is not None else None
+
+    def get_content(self, content_hash) -> Union[Dict[str, str], None]:
+        return self.load('content', content_hash)
+
+    def put(self, url, content_hash, data):
+        self.store('content', content_hash, data)
+        self.store('url', url, {'url': url, 'hash': content_hash, 'data': data})
+
+
+def ingest_article(url, cache: ArticleCache, session=None):
+    article_html = get_article_html(url, session)
+    content_hash = hashlib.sha1(article_html.encode()).hexdigest()
+    data = cache.get_content(content_hash)
+    if data is None:
+        data = get_article_data(article_html)
+    cache.put(url, content_hash, data)
+    return data
+
+
+def ingest_articles(urls: List[str], cache_dir='./cnbc_cache', max_workers=16, session=None, refresh=False) -> Dict[str, Dict[str, str]]:
+    '''
+    Returns the article data of every URL, e.g. {url: {'NOK': 'Nokia: ...'}}. Cached articles are not
+    fetched again unless refresh is set, the rest are fetched concurrently over the shared session.
+    Articles that can't be fetched are left out.
+    '''
+    cache = ArticleCache(cache_dir)
+    urls = list(dict.fromkeys(urls))
+    articles = {}
+    missing = []
+    for url in urls:
+        data = None if refresh else cache.get_url(url)
+        if data is None:
+            missing.append(url)
+        else:
+            articles[url] = data
+
+    def ingest(url):
+        try:
+            return ingest_article(url, cache, session)
+        except requests.RequestException as e:
+            print(f'Could not fetch {url}: {e}')
+            return None
 
-    return dict(zip(tickers, link_texts))
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(missing))) as executor:
+            for url, data in zip(missing, executor.map(ingest, missing)):
+                if data is not None:
+                    articles[url] = data
+    return {url: articles[url] for url in urls if url in articles}
 
 
 if __name__ == '__main__':
@@ -53,10 +232,9 @@ if __name__ == '__main__':
     # with open('output.json', 'w') as f:
     #     json.dump(output_data, f, indent=4)
     url = "https://www.cnbc.com/2022/06/23/cramers-lightning-round-nokia-is-right-to-buy.html"
-    article_html = get_article_html(url)
 
     # this properly gets all the tickers from a CNBC article, however
     # I'm not sure if the tickers are all correct
     # will have to check if they're correct and remove all characters that are not relevant
 
-    print(json.dumps(get_article_data(article_html)))
+    print(json.dumps(ingest_articles([url])[url]))
@@ -1,6 +1,100 @@
-from sqlmodel import Session, select
+import threading
+from typing import Optional
 
-from database.model import Holding
+from sqlalchemy import event, func, literal, text, union_all
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import Session, SQLModel, create_engine, delete, select
+
+from database.model import ArkCoverage, ArkHolding, BlacklistEntry, CachedMean, Holding, Sale
+
+# WAL lets readers and a writer work at the same time, and with it NORMAL sync is still safe
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    'cache_size': -16000,  # 16 MB
+}
+# rows per statement, well below SQLite's limit on bound parameters
+BATCH_SIZE = 500
+
+# the tables each store keeps in its own database
+HOLDING_TABLES = [Holding.__table__, Sale.__table__]
+BLACKLIST_TABLES = [BlacklistEntry.__table__]
+MEANS_TABLES = [CachedMean.__table__]
+ARK_TABLES = [ArkHolding.__table__, ArkCoverage.__table__]
+
+_engines = {}
+_engine_tables = {}  # names of the tables created through each shared engine
+_engines_lock = threading.Lock()
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Apply SQLITE_PRAGMAS to a new connection
+    """
+    cursor = dbapi_connection.cursor()
+    for pragma, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {pragma}={value}")
+    cursor.close()
+
+
+def create_tables(engine, tables: list):
+    """
+    Create the tables and their indexes if they don't exist yet, and migrate what older versions stored in them
+    """
+    SQLModel.metadata.create_all(engine, tables=tables)
+    if engine.dialect.name == "sqlite":
+        with engine.begin() as connection:
+            for table in tables:
+                if table in (Holding.__table__, Sale.__table__):
+                    add_order_id_column(connection, table.name)
+            if Holding.__table__ in tables:
+                migrate_holding_dates(connection)
+    # create_all skips the indexes of tables that already exist
+    for table in tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+
+def get_engine(url: str = "sqlite:///holdings.db", tables: list = HOLDING_TABLES):
+    """
+    Get the engine shared by everything using the database at url, creating the given tables on first use.
+    In-memory databases can't be shared, so every call gets a new one
+    """
+    with _engines_lock:
+        engine = _engines.get(url)
+        if engine is None:
+            engine = create_engine(url)
+            if engine.dialect.name == "sqlite" and engine.url.database in (None, "", ":memory:"):
+                create_tables(engine, tables)
+                return engine
+            if engine.dialect.name == "sqlite":
+                event.listen(engine, "connect", set_sqlite_pragmas)
+            _engines[url] = engine
+            _engine_tables[url] = set()
+        missing = [table for table in tables if table.name not in _engine_tables[url]]
+        if missing:
+            create_tables(engine, missing)
+            _engine_tables[url].update(table.name for table in missing)
+        return engine
+
+
+def migrate_holding_dates(connection):
+    """
+    Convert buy dates stored as ISO strings with an offset by older versions to UTC datetimes, so they sort by time
+    """
+    connection.execute(text(
+        "UPDATE holding SET buy_date = strftime('%Y-%m-%d %H:%M:%f', buy_date) "
+        "WHERE buy_date LIKE '%T%' AND strftime('%Y-%m-%d %H:%M:%f', buy_date) IS NOT NULL"))
+
+
+def add_order_id_column(connection, table: str):
+    """
+    Add the order_id column to a holding or sale table created by an older version
+    """
+    columns = [row[1] for row in connection.exec_driver_sql(f"PRAGMA table_info({table})")]
+    if "order_id" not in columns:
+        connection.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN order_id VARCHAR")
 
 
 def get_all_holdings(session: Session, tickers: list[str] = []) -> list[Holding]:
@@ -22,12 +116,12 @@ def get_all_holdings(session: Session, tickers: list[str] = []) -> list[Holding]
     return holdings
 
 
-def get_most_recent_holding(session: Session, ticker: str) -> Holding | None:
+def get_most_recent_holding(session: Session, ticker: str) -> Optional[Holding]:
     """
     Get the most recent holding from the database
     """
     statement = select(Holding).where(
-        Holding.ticker == ticker).order_by(Holding.buy_date.desc())
+        Holding.ticker == ticker).order_by(Holding.buy_date.desc(), Holding.id.desc())
 
     results = session.execute(statement).first()
 
@@ -37,6 +131,24 @@ def get_most_recent_holding(session: Session, ticker: str) -> Holding | None:
     return results[0]
 
 
+def get_most_recent_holdings(session: Session, tickers: list[str]) -> dict[str, Holding]:
+    """
+    Get the most recent holding of each of the tickers, one query per BATCH_SIZE tickers. Tickers without holdings are left out
+    """
+    holdings = {}
+    for i in range(0, len(tickers), BATCH_SIZE):
+        ranked = select(
+            Holding.id,
+            func.row_number().over(
+                partition_by=Holding.ticker,
+                order_by=(Holding.buy_date.desc(), Holding.id.desc())).label("rank"),
+        ).where(Holding.ticker.in_(tickers[i:i + BATCH_SIZE])).subquery()
+        statement = select(Holding).join(ranked, Holding.id == ranked.c.id).where(ranked.c.rank == 1)
+        for holding in session.exec(statement).all():
+            holdings[holding.ticker] = holding
+    return holdings
+
+
 def add_holding(session: Session, holding: Holding):
     """
     Add a holding to the database
@@ -45,10 +157,163 @@ def add_holding(session: Session, holding: Holding):
     session.commit()
 
 
+def add_holdings(session: Session, holdings: list[Holding]):
+    """
+    Add many holdings to the database in one transaction
+    """
+    session.add_all(holdings)
+    session.commit()
+
+
+def upsert_holdings(session: Session, holdings: list[Holding]):
+    """
+    Insert holdings in one transaction, replacing the stored holdings with the same id
+    """
+    for i in range(0, len(holdings), BATCH_SIZE):
+        rows = [holding.model_dump() for holding in holdings[i:i + BATCH_SIZE]]
+        statement = insert(Holding).values(rows)
+        statement = statement.on_conflict_do_update(
+            index_elements=[Holding.id],
+            set_={column: statement.excluded[column] for column in rows[0] if column != "id"})
+        session.execute(statement)
+    session.commit()
+
+
+def add_sales(session: Session, sales: list[Sale]):
+    """
+    Add many sales to the database in one transaction
+    """
+    session.add_all(sales)
+    session.commit()
+
+
+def get_recorded_order_ids(session: Session, model, order_ids: list[str]) -> set[str]:
+    """
+    Get the ids among order_ids that already have a row in the holding or sale table of model,
+    one query per BATCH_SIZE ids
+    """
+    recorded = set()
+    for i in range(0, len(order_ids), BATCH_SIZE):
+        statement = select(model.order_id).where(model.order_id.in_(order_ids[i:i + BATCH_SIZE]))
+        recorded.update(session.exec(statement).all())
+    return recorded
+
+
+def iter_fills(session: Session, batch_size: int = BATCH_SIZE):
+    """
+    Stream every holding and sale as (side, ticker, shares, price, date) tuples in the order they happened,
+    fetching batch_size rows at a time
+    """
+    buys = select(literal("buy").label("side"), Holding.ticker, Holding.shares,
+                  Holding.buy_price.label("price"), Holding.buy_date.label("date"), Holding.id)
+    sells = select(literal("sell").label("side"), Sale.ticker, Sale.shares,
+                   Sale.sell_price.label("price"), Sale.sell_date.label("date"), Sale.id)
+    fills = union_all(buys, sells).subquery()
+    # a buy and a sell at the same time are applied buy first
+    statement = select(fills.c.side, fills.c.ticker, fills.c.shares, fills.c.price, fills.c.date).order_by(
+        fills.c.date, fills.c.side, fills.c.id)
+    for row in session.execute(statement.execution_options(yield_per=batch_size)):
+        yield tuple(row)
+
+
+def get_blacklist_entries(session: Session) -> list[BlacklistEntry]:
+    """
+    Get all blacklist entries from the database
+    """
+    return list(session.exec(select(BlacklistEntry)).all())
+
+
+def set_blacklist_entries(session: Session, entries: list[BlacklistEntry]):
+    """
+    Add blacklist entries to the database, replacing existing entries for the same tickers
+    """
+    for entry in entries:
+        session.merge(entry)
+    session.commit()
+
+
+def remove_blacklist_entry(session: Session, ticker: str):
+    """
+    Remove a ticker from the blacklist
+    """
+    session.execute(delete(BlacklistEntry).where(BlacklistEntry.ticker == ticker))
+    session.commit()
+
+
+def remove_expired_blacklist_entries(session: Session, now: int):
+    """
+    Remove the blacklist entries that expired at or before now
+    """
+    session.execute(delete(BlacklistEntry).where(BlacklistEntry.expires <= now))
+    session.commit()
+
+
+def get_cached_means(session: Session, tickers: list[str], timeframe: str, computed_after: int = 0) -> list[CachedMean]:
+    """
+    Get the cached means of the tickers for the timeframe that were computed after computed_after
+    """
+    statement = select(CachedMean).where(
+        CachedMean.timeframe == timeframe,
+        CachedMean.ticker.in_(tickers),
+        CachedMean.computed_at > computed_after)
+    return list(session.exec(statement).all())
+
+
+def set_cached_means(session: Session, means: list[CachedMean]):
+    """
+    Add cached means to the database in one statement, replacing existing means for the same ticker and timeframe
+    """
+    if len(means) == 0:
+        return
+    statement = insert(CachedMean).values([mean.model_dump() for mean in means])
+    statement = statement.on_conflict_do_update(
+        index_elements=[CachedMean.ticker, CachedMean.timeframe],
+        set_={column: statement.excluded[column] for column in ['mean', 'watermark', 'computed_at']})
+    session.execute(statement)
+    session.commit()
+
+
+def get_ark_holdings(session: Session, fund: str, start_date: str, end_date: str) -> list[ArkHolding]:
+    """
+    Get the stored holdings of a fund between two dates, ordered by date
+    """
+    statement = select(ArkHolding).where(
+        ArkHolding.fund == fund,
+        ArkHolding.date >= start_date,
+        ArkHolding.date <= end_date).order_by(ArkHolding.date)
+    return list(session.exec(statement).all())
+
+
+def replace_ark_holdings(session: Session, fund: str, holdings: list[ArkHolding]):
+    """
+    Store holdings snapshots of a fund, replacing any stored snapshot of the same dates
+    """
+    dates = {holding.date for holding in holdings}
+    if len(dates) == 0:
+        return
+    session.execute(delete(ArkHolding).where(
+        ArkHolding.fund == fund, ArkHolding.date.in_(dates)))
+    session.add_all(holdings)
+    session.commit()
+
+
+def get_ark_coverage(session: Session, fund: str) -> Optional[ArkCoverage]:
+    """
+    Get the range of dates that have been fetched for a fund
+    """
+    return session.get(ArkCoverage, fund)
+
+
+def set_ark_coverage(session: Session, coverage: ArkCoverage):
+    """
+    Set the range of dates that have been fetched for a fund
+    """
+    session.merge(coverage)
+    session.commit()
+
+
 if __name__ == "__main__":
-    from sqlmodel import create_engine, SQLModel
-    engine = create_engine("sqlite:///test.db")
-    SQLModel.metadata.create_all(engine)
+    engine = get_engine("sqlite:///test.db")
 
     with Session(engine) as session:
         holdings = get_all_holdings(session)
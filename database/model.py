@@ -1,20 +1,74 @@
+from datetime import datetime, timezone
 from typing import Optional
 
 import arrow
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel, create_engine, Session, select
 
 
 class Holding(SQLModel, table=True):
+    __table_args__ = (Index('ix_holding_ticker_buy_date', 'ticker', 'buy_date'),
+                      Index('ix_holding_order_id', 'order_id', unique=True))
+
     id: Optional[int] = Field(default=None, primary_key=True)
     ticker: str
     shares: float
     buy_price: float
-    buy_date: Optional[str] = Field(default=arrow.now().isoformat())
+    buy_date: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    order_id: Optional[str] = None  # Alpaca id of the order that filled
 
     def get_date(self) -> arrow.Arrow:
         return arrow.get(self.buy_date)
 
 
+class Sale(SQLModel, table=True):
+    __table_args__ = (Index('ix_sale_ticker_sell_date', 'ticker', 'sell_date'),
+                      Index('ix_sale_order_id', 'order_id', unique=True))
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    ticker: str
+    shares: float
+    sell_price: float
+    sell_date: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    order_id: Optional[str] = None  # Alpaca id of the order that filled
+
+    def get_date(self) -> arrow.Arrow:
+        return arrow.get(self.sell_date)
+
+
+class BlacklistEntry(SQLModel, table=True):
+    ticker: str = Field(primary_key=True)
+    expires: int  # unix timestamp after which the ticker can be bought again
+
+
+class CachedMean(SQLModel, table=True):
+    ticker: str = Field(primary_key=True)
+    timeframe: str = Field(primary_key=True)
+    mean: float
+    watermark: int  # unix timestamp of the end of the bars the mean was calculated over
+    computed_at: int  # unix timestamp
+
+
+class ArkHolding(SQLModel, table=True):
+    __table_args__ = (Index('ix_arkholding_fund_date', 'fund', 'date'),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    fund: str
+    date: str  # YYYY-MM-DD
+    ticker: Optional[str] = None
+    company: Optional[str] = None
+    cusip: Optional[str] = None
+    shares: float
+    market_value: Optional[float] = None
+    weight: Optional[float] = None
+
+
+class ArkCoverage(SQLModel, table=True):
+    fund: str = Field(primary_key=True)
+    start_date: str  # first date that has been fetched, YYYY-MM-DD
+    end_date: str  # last date that has been fetched, YYYY-MM-DD
+
+
 if __name__ == "__main__":
     holding_one = Holding(ticker="AAPL", shares=100, buy_price=100.00)
     # generate an arrow time from two weeks ago
@@ -22,7 +76,7 @@ if __name__ == "__main__":
     holding_two = Holding(ticker="MSFT", shares=100, buy_price=100.00)
     # holding three is AAPL but double the shares at half the price
     holding_three = Holding(ticker="AAPL", shares=200,
-                            buy_price=50.00, buy_date=two_weeks_ago.isoformat())
+                            buy_price=50.00, buy_date=two_weeks_ago.datetime)
 
     engine = create_engine("sqlite:///test.db")
     SQLModel.metadata.create_all(engine)
@@ -2,9 +2,11 @@ import os
 
 import arrow
 import pytest
+from sqlalchemy import inspect, text
 from sqlmodel import Session, SQLModel, create_engine
 
-from database import get_all_holdings, get_most_recent_holding, add_holding
+from database import (BLACKLIST_TABLES, MEANS_TABLES, add_holding, add_holdings, get_all_holdings, get_engine,
+                      get_most_recent_holding, get_most_recent_holdings, upsert_holdings)
 from database.model import Holding
 
 
@@ -21,7 +23,7 @@ def setup_db():
         add_holding(session, holding)
 
         holding = Holding(ticker="AAPL", shares=200,
-                          buy_price=50.00, buy_date=arrow.now().shift(weeks=-2).isoformat())
+                          buy_price=50.00, buy_date=arrow.utcnow().shift(weeks=-2).datetime)
         add_holding(session, holding)
 
     yield
@@ -47,5 +49,82 @@ def test_get_most_recent_holding():
     with Session(engine) as session:
         holding = get_most_recent_holding(session, ticker="AAPL")
         assert holding is not None
+        assert holding.shares == 100
         holding = get_most_recent_holding(session, ticker="TSLA")
         assert holding is None
+
+
+def test_bulk_writes_and_indexes(tmp_path):
+    engine = get_engine(f"sqlite:///{tmp_path}/holdings.db")
+    assert get_engine(f"sqlite:///{tmp_path}/holdings.db") is engine
+
+    with Session(engine) as session:
+        add_holdings(session, [Holding(ticker=f"T{i}", shares=1, buy_price=float(i))
+                               for i in range(1000)])
+        holdings = get_all_holdings(session, tickers=["T1", "T2"])
+        assert sorted(holding.buy_price for holding in holdings) == [1.0, 2.0]
+
+        holding = holdings[0]
+        upsert_holdings(session, [
+            Holding(id=holding.id, ticker=holding.ticker, shares=5, buy_price=holding.buy_price, buy_date=holding.buy_date),
+            Holding(ticker="NEW", shares=1, buy_price=10.0),
+        ])
+        assert len(get_all_holdings(session)) == 1001
+        assert get_all_holdings(session, tickers=[holding.ticker])[0].shares == 5
+
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        plan = connection.exec_driver_sql(
+            "EXPLAIN QUERY PLAN SELECT * FROM holding WHERE ticker = 'T1' ORDER BY buy_date DESC").fetchall()
+        assert "ix_holding_ticker_buy_date" in str(plan)
+
+
+def test_get_most_recent_holdings(tmp_path):
+    engine = get_engine(f"sqlite:///{tmp_path}/holdings.db")
+    now = arrow.utcnow()
+
+    with Session(engine) as session:
+        add_holdings(session, [
+            Holding(ticker=f"T{i % 600}", shares=1, buy_price=float(i), buy_date=now.shift(days=i).datetime)
+            for i in range(1800)])
+        holdings = get_most_recent_holdings(session, [f"T{i}" for i in range(600)] + ["MISSING"])
+
+    assert len(holdings) == 600
+    assert holdings["T0"].buy_price == 1200.0
+    assert holdings["T599"].buy_price == 1799.0
+    assert holdings["T0"].get_date() == now.shift(days=1200)
+
+
+def test_stores_only_create_their_tables(tmp_path):
+    engine = get_engine(f"sqlite:///{tmp_path}/blacklist.db", BLACKLIST_TABLES)
+    assert inspect(engine).get_table_names() == ["blacklistentry"]
+
+    # a second store sharing the file adds its own tables
+    assert get_engine(f"sqlite:///{tmp_path}/blacklist.db", MEANS_TABLES) is engine
+    assert inspect(engine).get_table_names() == ["blacklistentry", "cachedmean"]
+
+    assert inspect(get_engine("sqlite://", MEANS_TABLES)).get_table_names() == ["cachedmean"]
+
+
+def test_legacy_buy_dates_are_migrated(tmp_path):
+    url = f"sqlite:///{tmp_path}/legacy.db"
+    legacy = create_engine(url)
+    with legacy.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE holding (id INTEGER PRIMARY KEY, ticker VARCHAR NOT NULL, shares FLOAT NOT NULL, "
+            "buy_price FLOAT NOT NULL, buy_date VARCHAR)"))
+        # the same instant in two offsets, and a later one that sorts first as a string
+        connection.execute(text(
+            "INSERT INTO holding (ticker, shares, buy_price, buy_date) VALUES "
+            "('AAPL', 1, 10, '2022-06-01T10:00:00.250000-04:00'), "
+            "('AAPL', 1, 20, '2022-06-01T15:00:00+00:00'), "
+            "('AAPL', 1, 30, '2022-06-01T12:00:00-04:00')"))
+    legacy.dispose()
+
+    engine = get_engine(url)
+    with Session(engine) as session:
+        holding = get_most_recent_holding(session, "AAPL")
+        assert holding.buy_price == 30.0
+        assert holding.get_date() == arrow.get("2022-06-01T16:00:00+00:00")
+        dates = sorted(holding.get_date() for holding in get_all_holdings(session))
+        assert dates[0] == arrow.get("2022-06-01T14:00:00.250+00:00")
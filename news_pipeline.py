@@ -0,0 +1,246 @@
+import hashlib
+import random
+import threading
+import time
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+
+from cnbc_article_parser import get_article_data, get_article_html
+
+LIGHTNING_ROUND_QUERY = "Cramer's Lightning Round"
+
+
+def normalize_url(url: str) -> str:
+    '''
+    Drops the query and fragment, e.g. tracking parameters, so the same article always has the same URL.
+    '''
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip('/'), '', ''))
+
+
+class Mention:
+    __slots__ = ('url', 'phrase', 'published_at')
+
+    def __init__(self, url: str, phrase: str, published_at: Union[str, None] = None):
+        self.url = url
+        self.phrase = phrase
+        self.published_at = published_at
+
+    def __repr__(self):
+        return f'Mention({self.url}, {self.phrase!r}, published_at={self.published_at})'
+
+
+class MentionIndex:
+    '''
+    Inverted index from ticker to its most recently published mentions, oldest first, whatever
+    order they are added in. Only the last max_mentions of each ticker are kept, and every lookup
+    is a single dict access. Mentions without a publish time count as the oldest.
+    '''
+
+    def __init__(self, max_mentions: int = 20):
+        self.max_mentions = max_mentions
+        self.mentions: Dict[str, List[Mention]] = {}
+        self.published: Dict[str, List[str]] = {}  # publish times of the kept mentions, in the same order
+        self.counts: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def add(self, ticker: str, mention: Mention):
+        with self.lock:
+            self.counts[ticker] = self.counts.get(ticker, 0) + 1
+            mentions = self.mentions.setdefault(ticker, [])
+            published = self.published.setdefault(ticker, [])
+            published_at = mention.published_at or ''
+            i = bisect_right(published, published_at)
+            if i == 0 and len(mentions) >= self.max_mentions:
+                # older than every kept mention
+                return
+            mentions.insert(i, mention)
+            published.insert(i, published_at)
+            if len(mentions) > self.max_mentions:
+                del mentions[0], published[0]
+
+    def get_mentions(self, ticker: str) -> List[Mention]:
+        '''
+        Returns a copy of the kept mentions of the ticker, safe to iterate while the pipeline adds more.
+        '''
+        with self.lock:
+            return list(self.mentions.get(ticker, ()))
+
+    def get_latest(self, ticker: str) -> Union[Mention, None]:
+        with self.lock:
+            mentions = self.mentions.get(ticker)
+            return mentions[-1] if mentions else None
+
+    def get_count(self, ticker: str) -> int:
+        '''
+        Returns the number of mentions ever indexed for the ticker, including the ones no longer kept.
+        '''
+        return self.counts.get(ticker, 0)
+
+    def tickers(self) -> List[str]:
+        return list(self.mentions.keys())
+
+
+class NewsPipeline:
+    '''
+    Turns batches of NewsAPI articles into ticker mentions. Articles are deduplicated by URL
+    before they are fetched and by a hash of the page after, the pages of each batch are fetched
+    concurrently over one session and the tickers and phrases found in them are added to the index.
+    '''
+
+    def __init__(self, index: Union[MentionIndex, None] = None, session=None, max_workers: int = 16,
+                 sources: Tuple[str, ...] = ('CNBC',)):
+        self.index = index if index is not None else MentionIndex()
+        self.session = session
+        self.max_workers = max_workers
+        self.sources = sources
+        self.seen_urls = set()
+        self.seen_hashes = set()
+        self.stats = {'articles': 0, 'duplicates': 0, 'skipped': 0, 'failed': 0, 'parsed': 0, 'mentions': 0}
+
+    def select(self, articles: List[dict]) -> List[dict]:
+        '''
+        Returns the articles from the wanted sources that have not been seen yet, and marks them seen.
+        '''
+        selected = []
+        for article in articles:
+            self.stats['articles'] += 1
+            if (article.get('source') or {}).get('name') not in self.sources or not article.get('url'):
+                self.stats['skipped'] += 1
+                continue
+            url = normalize_url(article['url'])
+            if url in self.seen_urls:
+                self.stats['duplicates'] += 1
+                continue
+            self.seen_urls.add(url)
+            selected.append(article)
+        return selected
+
+    def fetch(self, article: dict) -> Union[str, None]:
+        try:
+            return get_article_html(article['url'], self.session)
+        except requests.RequestException as e:
+            print(f"Could not fetch {article['url']}: {e}")
+            return None
+
+    def process(self, articles: List[dict]) -> int:
+        '''
+        Processes one batch of articles and returns the number of mentions added to the index.
+        '''
+        selected = self.select(articles)
+        if not selected:
+            return 0
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(selected))) as executor:
+            pages = list(executor.map(self.fetch, selected))
+
+        added = 0
+        for article, article_html in zip(selected, pages):
+            url = normalize_url(article['url'])
+            if article_html is None:
+                self.stats['failed'] += 1
+                # try again if it shows up in a later batch
+                self.seen_urls.discard(url)
+                continue
+            content_hash = hashlib.sha1(article_html.encode()).hexdigest()
+            if content_hash in self.seen_hashes:
+                self.stats['duplicates'] += 1
+                continue
+            self.seen_hashes.add(content_hash)
+            self.stats['parsed'] += 1
+            for ticker, phrase in get_article_data(article_html).items():
+                self.index.add(ticker, Mention(url, phrase.strip(), article.get('publishedAt')))
+                added += 1
+        self.stats['mentions'] += added
+        return added
+
+    def run(self, batches: Iterable[List[dict]]) -> MentionIndex:
+        '''
+        Consumes batches as they arrive, e.g. from newsapi_batches, and returns the index.
+        '''
+        for batch in batches:
+            self.process(batch)
+        return self.index
+
+
+def newsapi_batches(client, query: str = LIGHTNING_ROUND_QUERY, pages: int = 1, page_size: int = 100) -> Iterator[List[dict]]:
+    '''
+    Yields a page of articles at a time from a NewsApiClient, or anything with the same get_everything.
+    '''
+    for page in range(1, pages + 1):
+        response = client.get_everything(q=query, language='en', page=page, page_size=page_size)
+        articles = response.get('articles', [])
+        if not articles:
+            return
+        yield articles
+
+
+class FakeNewsApi:
+    '''
+    Local stand-in for NewsApiClient that serves n_articles synthetic Lightning Round articles,
+    newest first like get_everything. Some are repeated with tracking parameters, some reposted
+    under another URL and some come from other sources, like real search results. The pages of
+    the CNBC articles are in pages.
+    '''
+
+    def __init__(self, n_articles: int = 100, duplicate_rate: float = 0.2, seed: int = 0):
+        rng = random.Random(seed)
+        tickers = [f'T{i}' for i in range(200)]
+        self.articles = []
+        self.pages = {}
+        page_urls = []
+        for i in range(n_articles):
+            published = datetime(2022, 1, 1, 23) + timedelta(hours=i)
+            url = f'https://www.cnbc.com/{published:%Y/%m/%d}/cramers-lightning-round-{i}.html'
+            published_at = f'{published:%Y-%m-%dT%H:%M:%SZ}'
+            roll = rng.random()
+            if self.articles and roll < duplicate_rate / 2:
+                # the same article with tracking parameters
+                repeated = rng.choice(self.articles)
+                self.articles.append(dict(repeated, url=repeated['url'] + f'?utm_source={i}'))
+                continue
+            if self.articles and roll < duplicate_rate:
+                # the same page under another URL
+                self.pages[url] = self.pages[rng.choice(page_urls)]
+            else:
+                self.pages[url] = self.make_page(rng.sample(tickers, 10))
+            page_urls.append(url)
+            source = 'CNBC' if rng.random() > 0.1 else 'Yahoo Entertainment'
+            self.articles.append({'source': {'id': None, 'name': source}, 'title': f"Cramer's lightning round {i}",
+                                  'url': url, 'publishedAt': published_at})
+        self.articles.sort(key=lambda article: article['publishedAt'], reverse=True)
+
+    @staticmethod
+    def make_page(tickers: List[str]) -> str:
+        picks = ''.join(f'<p><a href="https://www.cnbc.com/quotes/{ticker}">{ticker} Inc</a>: '
+                        f'"I like {ticker}, buy it."</p>' for ticker in tickers)
+        return f'<html><body><ul><li><a href="/markets">Markets</a></li></ul><div class="ArticleBody">{picks}</div></body></html>'
+
+    def get_everything(self, q=None, language=None, page: int = 1, page_size: int = 100, **kwargs) -> dict:
+        articles = self.articles[(page - 1) * page_size:page * page_size]
+        return {'status': 'ok', 'totalResults': len(self.articles), 'articles': articles}
+
+
+class FakeCnbcSession:
+    '''
+    Local stand-in for the session that fetches CNBC pages, serving the given pages after latency seconds.
+    '''
+
+    def __init__(self, pages: Dict[str, str], latency: float = 0.0):
+        self.pages = pages
+        self.latency = latency
+        self.requested = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.requested.append(url)
+        if self.latency:
+            time.sleep(self.latency)
+        page = self.pages.get(normalize_url(url))
+        if page is None:
+            raise requests.HTTPError(f'404 Not Found: {url}', response=SimpleNamespace(status_code=404))
+        return SimpleNamespace(text=page, raise_for_status=lambda: None)
@@ -6,10 +6,17 @@ import arrow
 import fire
 from dotenv import load_dotenv
 from alpaca_trade_api.rest import TimeFrame
+from newsapi import NewsApiClient
 
 from ark_wrapper import Ark
+from ark_wrapper.history import HoldingsHistory
+from database import ARK_TABLES, get_engine
+from news_pipeline import FakeCnbcSession, FakeNewsApi, NewsPipeline, newsapi_batches
+from backtest import Backtest
+from backtest.sweep import format_table, param_grid, sweep as run_sweep
 from trade_algos import BaseAlgorithm
 from trade_algos.copycat import CopyCatAlgorithm
+from trade_algos.ledger import FillLedger
 from trade_algos.simple import SimpleAlgorithm
 from trade_algos.mean_reversion import MeanReversionAlgorithm
 from utils import get_all_ark_holdings
@@ -20,8 +27,8 @@ API_KEY = os.getenv('API_KEY')
 API_SECRET = os.getenv('API_SECRET')
 
 
-def simple(symbol: str, qty: int = 1, gain: float = 1, loss: float = 1):
-    '''Executes the simple algorithm.'''
+def simple(symbol: str, qty: int = 1, gain: float = 1, loss: float = 1, stream: bool = False):
+    '''Executes the simple algorithm. With --stream, prices come from the websocket instead of polling.'''
     simple_algo = SimpleAlgorithm(API_KEY, API_SECRET)
 
     simple_algo.add_symbol(symbol, qty=qty)
@@ -29,7 +36,10 @@ def simple(symbol: str, qty: int = 1, gain: float = 1, loss: float = 1):
     simple_algo.set_max_loss(symbol, loss)
     simple_algo.set_min_gain(symbol, gain)
 
-    simple_algo.run()
+    if stream:
+        simple_algo.run_streaming()
+    else:
+        simple_algo.run()
 
 
 def copycat(symbol: str, daily_budget_percentage: float, min_bal: float):
@@ -43,8 +53,31 @@ def copycat(symbol: str, daily_budget_percentage: float, min_bal: float):
     copycat.run()
 
 
-def ark(symbol: str, mode: str, start_date: str = None, end_date: str = None, limit: int = 100):
-    '''Prints the ARK holdings for the given ARK ticker.'''
+def ark(symbol: str, mode: str, start_date: str = None, end_date: str = None, limit: int = 100, local: bool = False, history_db: str = './ark_history.db'):
+    '''Prints the ARK holdings for the given ARK ticker. With --local, holdings and trades come from the local history, and mode backfill fills it from start_date.'''
+    if local or mode == 'backfill':
+        history = HoldingsHistory(get_engine(f'sqlite:///{history_db}', ARK_TABLES))
+        if end_date is None:
+            end_date = arrow.utcnow().format('YYYY-MM-DD')
+        if start_date is None:
+            start_date = arrow.get(end_date).shift(days=-1).format('YYYY-MM-DD')
+        added = history.sync(symbol, start_date, end_date)
+        if mode == 'backfill':
+            print(f'Added {added} holdings of {symbol}')
+        elif mode == 'holdings':
+            holdings = [holding.model_dump(exclude={'id'})
+                        for snapshot in history.get_holdings(symbol, start_date, end_date).values()
+                        for holding in snapshot]
+            print(json.dumps({'symbol': symbol, 'date_from': start_date, 'date_to': end_date,
+                              'holdings': holdings[:limit]}, indent=4))
+        elif mode == 'trades':
+            trades = history.get_trades(symbol, start_date, end_date)
+            print(json.dumps({'symbol': symbol, 'date_from': start_date, 'date_to': end_date,
+                              'trades': trades[:limit]}, indent=4))
+        else:
+            print('Invalid mode')
+        return
+
     ark = Ark()
     if mode == 'holdings':
         print(json.dumps(ark.get_etf_holdings(
@@ -80,18 +113,17 @@ def historical(symbol: str, timeframe: str = 'day', limit: int = 100):
     start_str = start.isoformat()
     print(start_str)
 
-    bars = base.api.get_bars(
-        symbol, timeframe_table[timeframe], start=start_str, end=end_str, limit=limit)
+    bars = base.get_stored_bars(
+        [symbol], timeframe_table[timeframe], start, end)[symbol][:limit]
     for bar in bars:
-        timestamp = arrow.get(bar.t)
-        print(f'Date: {timestamp.format("YYYY-MM-DD hh:mm:ss")} Open: {bar.o} Close: {bar.c} High: {bar.h} Low: {bar.l} Volume: {bar.v}')
+        timestamp = arrow.get(int(bar['t']))
+        print(f'Date: {timestamp.format("YYYY-MM-DD hh:mm:ss")} Open: {bar["o"]} Close: {bar["c"]} High: {bar["h"]} Low: {bar["l"]} Volume: {bar["v"]}')
 
 
 def current(symbol: str):
     '''Prints the current price of the given ticker.'''
     base = BaseAlgorithm(API_KEY, API_SECRET)
-    barset = base.api.get_bars(symbol, TimeFrame.Minute, limit=1)
-    print(barset[0].c)
+    print(base.get_current_price(symbol))
 
 
 def yesterday(symbol: str):
@@ -106,7 +138,7 @@ def mean(symbol: str, timeframe: str = 'month'):
     print(mean_reversion.mean([symbol], timeframe)[symbol])
 
 
-def mean_reversion(symbols: Union[List[str], None] = None, ticker_file: str = './tickers.txt', cache_means: bool = False, cache_filename: str = './mean_reversion.json', budget: float = 0.0, testing: bool = False, timeframe: str = 'month'):
+def mean_reversion(symbols: Union[List[str], None] = None, ticker_file: str = './tickers.txt', cache_means: bool = False, cache_filename: str = './mean_reversion.db', budget: float = 0.0, testing: bool = False, timeframe: str = 'month', requests_per_minute: int = 200, workers: int = 4):
     '''Executes the mean reversion algorithm.'''
     mean_reversion = MeanReversionAlgorithm(API_KEY, API_SECRET)
     ticker_file_exists = os.path.exists(ticker_file)
@@ -122,10 +154,51 @@ def mean_reversion(symbols: Union[List[str], None] = None, ticker_file: str = '.
         cache_means = True
 
     mean_reversion.set_budget(budget)
+    mean_reversion.set_requests_per_minute(requests_per_minute)
+    mean_reversion.set_max_workers(workers)
     mean_reversion.run(symbols, cache_means, timeframe,
                        cache_filename, testing)
 
 
+def backtest(start: str, end: str, ticker_file: str = './tickers.txt', bar_store: str = './bars', cash: float = 100000.0, slippage: float = 0.0005, timeframe: str = 'month'):
+    '''Replays the mean reversion algorithm over the stored hourly bars between start and end.'''
+    with open(ticker_file, 'r') as f:
+        symbols = [line.strip() for line in f.readlines()]
+
+    # the simulated broker replaces the REST client, so no keys are needed
+    mean_reversion = MeanReversionAlgorithm('backtest', 'backtest')
+    result = Backtest(mean_reversion, bar_store, arrow.get(start), arrow.get(end),
+                      cash=cash, slippage=slippage).run(symbols, timeFrame=timeframe)
+    print(json.dumps(result.summary, indent=4))
+
+
+def sweep(start: str, end: str, ticker_file: str = './tickers.txt', bar_store: str = './bars', timeframe: Union[str, List[str]] = 'month', top_n: Union[int, List[int]] = 10, chunk_size: Union[int, List[int]] = 10, budget: Union[float, List[float]] = 0.0, cash: float = 100000.0, slippage: float = 0.0005, workers: Union[int, None] = None):
+    '''Backtests every combination of the given mean reversion settings across all cores, e.g. --top_n=[5,10,20].'''
+    with open(ticker_file, 'r') as f:
+        symbols = [line.strip() for line in f.readlines()]
+
+    grid = param_grid(timeframe=timeframe, top_n=top_n,
+                      chunk_size=chunk_size, budget=budget)
+    results = run_sweep(grid, symbols, bar_store, arrow.get(start), arrow.get(end),
+                        cash, slippage, workers)
+    print(format_table(results))
+
+
+def news(query: str = "Cramer's Lightning Round", pages: int = 1, top: int = 10, offline: bool = False):
+    '''Prints the most mentioned tickers in the CNBC articles NewsAPI finds for the query. With --offline, local stand-ins replace NewsAPI and CNBC.'''
+    if offline:
+        client = FakeNewsApi()
+        pipeline = NewsPipeline(session=FakeCnbcSession(client.pages))
+    else:
+        client = NewsApiClient(api_key=os.getenv('NEWS_API_KEY'))
+        pipeline = NewsPipeline()
+    index = pipeline.run(newsapi_batches(client, query, pages))
+    tickers = sorted(index.tickers(), key=index.get_count, reverse=True)[:top]
+    print(json.dumps({ticker: {'mentions': index.get_count(ticker), 'latest': index.get_latest(ticker).phrase}
+                      for ticker in tickers}, indent=4))
+    print(json.dumps(pipeline.stats, indent=4))
+
+
 def test():
     '''Used for testing.'''
     # print(f'{symbol} {qty} {gain} {loss}')
@@ -135,9 +208,16 @@ def test():
     print(base.get_current_crypto_price('ETH'))
 
 
-def portfolio():
-    '''Prints your current portfolio.'''
+def portfolio(local: bool = False, database: str = './holdings.db'):
+    '''Prints your current portfolio. With --local, prints the FIFO cost basis and P&L of the fills recorded in the database instead.'''
     base = BaseAlgorithm(API_KEY, API_SECRET)
+    if local:
+        lots = FillLedger(get_engine(f'sqlite:///{database}')).get_portfolio()
+        held = lots.held()
+        prices = base.get_current_prices(held) if held else {}
+        print(json.dumps({'realized_pnl': round(lots.get_realized_pnl(), 2),
+                          'tickers': lots.summary(prices)}, indent=4))
+        return
     print(json.dumps(base.get_portfolio(raw=True), indent=4))
 
 
@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+import requests
+from bs4 import BeautifulSoup
+
+from cnbc_article_parser import get_article_data, ingest_articles
+
+ARTICLE = '''<html><head><title>Cramer's lightning round</title><link rel="stylesheet" href="a.css"></head>
+<body><div class="ArticleBody">
+<a href="/">CNBC</a><a name="top"></a>
+<p><a href="https://www.cnbc.com/quotes/NOK">Nokia</a>: "I think Nokia is right to buy."<br>
+It's cheap.</p>
+<p>Also <strong><a href="https://www.cnbc.com/quotes/AAPL">Apple</a></strong> &amp; more.</p>
+<ul><li><a href="https://www.cnbc.com/quotes/TSLA">Tesla</a>: "Sell it."<li>unclosed</ul>
+<p><!-- <a href="https://www.cnbc.com/quotes/OLD">Old</a> --><script>if (a<b) {}</script>
+<a data-href="/" href='https://www.cnbc.com/quotes/MSFT'>Microsoft</a> &lt;3</p>
+<p><img src="x.png"/><a href="https://www.cnbc.com/quotes/NOK">Nokia</a> again.</p>
+</div></body></html>'''
+
+
+def soup_article_data(article_html):
+    # the BeautifulSoup parser this module used before, for comparison
+    soup = BeautifulSoup(article_html, "html.parser")
+    links = [link for link in soup.find_all("a") if "cnbc.com/quotes" in (link.get("href") or "")]
+    return {link.get("href").split("/")[-1]: link.parent.text for link in links}
+
+
+def test_get_article_data_matches_beautifulsoup():
+    data = get_article_data(ARTICLE)
+    assert data == soup_article_data(ARTICLE)
+    assert list(data) == ['NOK', 'AAPL', 'TSLA', 'MSFT']
+    assert data['MSFT'] == '\nMicrosoft <3'
+    assert data['NOK'] == 'Nokia again.'
+    assert data['AAPL'] == 'Apple'
+    assert get_article_data('<p><a>no link</a></p>') == {}
+
+
+class FakeSession:
+    def __init__(self, pages):
+        self.pages = pages
+        self.requested = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.requested.append(url)
+        if url not in self.pages:
+            response = SimpleNamespace(status_code=404)
+            raise requests.HTTPError('404', response=response)
+        return SimpleNamespace(text=self.pages[url], raise_for_status=lambda: None)
+
+
+def test_ingest_articles_caches_by_url_and_content(tmp_path):
+    pages = {f'https://www.cnbc.com/{i}.html': ARTICLE.replace('Tesla', f'Tesla {i % 2}') for i in range(6)}
+    session = FakeSession(pages)
+    urls = list(pages) + ['https://www.cnbc.com/missing.html', 'https://www.cnbc.com/0.html']
+
+    articles = ingest_articles(urls, cache_dir=str(tmp_path), session=session)
+    assert list(articles) == list(pages)
+    assert articles['https://www.cnbc.com/3.html']['TSLA'] == 'Tesla 1: "Sell it."unclosed'
+    assert sorted(session.requested) == sorted(urls[:-1])
+    # two distinct pages, each stored once by content and once per URL
+    assert len(list(tmp_path.iterdir())) == 2 + len(pages)
+
+    session.requested = []
+    assert ingest_articles(urls, cache_dir=str(tmp_path), session=session) == articles
+    assert session.requested == ['https://www.cnbc.com/missing.html']
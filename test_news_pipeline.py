@@ -0,0 +1,71 @@
+from cnbc_article_parser import get_article_data
+from news_pipeline import (FakeCnbcSession, FakeNewsApi, Mention, MentionIndex, NewsPipeline, newsapi_batches,
+                           normalize_url)
+
+
+def test_pipeline_dedupes_and_indexes_mentions():
+    news_api = FakeNewsApi(n_articles=200, duplicate_rate=0.3)
+    session = FakeCnbcSession(news_api.pages)
+    pipeline = NewsPipeline(MentionIndex(max_mentions=3), session=session, max_workers=4)
+    index = pipeline.run(newsapi_batches(news_api, pages=5, page_size=50))
+
+    cnbc = [article for article in news_api.articles if article['source']['name'] == 'CNBC']
+    # every URL is fetched once, whatever tracking parameters it comes with
+    assert sorted(session.requested) == sorted({normalize_url(article['url']) for article in cnbc})
+
+    # and every distinct page is indexed once
+    expected = {}
+    for page in set(news_api.pages[url] for url in session.requested):
+        for ticker in get_article_data(page):
+            expected[ticker] = expected.get(ticker, 0) + 1
+    assert {ticker: index.get_count(ticker) for ticker in index.tickers()} == expected
+    assert pipeline.stats['parsed'] == len(set(news_api.pages[url] for url in session.requested))
+    assert pipeline.stats['articles'] == 200
+    assert pipeline.stats['articles'] == (pipeline.stats['skipped'] + pipeline.stats['duplicates'] +
+                                          pipeline.stats['parsed'])
+
+    ticker = max(expected, key=expected.get)
+    mentions = index.get_mentions(ticker)
+    assert len(mentions) == min(3, expected[ticker])
+    # the articles come newest first, the index keeps the most recently published
+    published = [mention.published_at for mention in mentions]
+    assert published == sorted(published)
+    assert published[-1] == max(article['publishedAt'] for article in cnbc
+                                if ticker in get_article_data(news_api.pages[normalize_url(article['url'])]))
+    assert index.get_latest(ticker).phrase == f'{ticker} Inc: "I like {ticker}, buy it."'
+    assert index.get_latest('NOPE') is None
+
+
+def test_pipeline_retries_failed_fetches():
+    article = {'source': {'name': 'CNBC'}, 'url': 'https://www.cnbc.com/2022/06/01/lightning.html'}
+    session = FakeCnbcSession({})
+    pipeline = NewsPipeline(session=session)
+
+    assert pipeline.process([article]) == 0
+    assert pipeline.stats['failed'] == 1
+
+    session.pages[article['url']] = FakeNewsApi.make_page(['NOK', 'AAPL'])
+    assert pipeline.process([article]) == 2
+    assert pipeline.index.get_latest('NOK').url == article['url']
+
+
+def test_mentions_are_a_snapshot():
+    index = MentionIndex(max_mentions=2)
+    index.add('AAPL', Mention('https://www.cnbc.com/a', 'AAPL: buy'))
+    mentions = index.get_mentions('AAPL')
+    index.add('AAPL', Mention('https://www.cnbc.com/b', 'AAPL: sell'))
+
+    assert [mention.url for mention in mentions] == ['https://www.cnbc.com/a']
+    assert len(index.get_mentions('AAPL')) == 2
+    assert index.get_mentions('NOPE') == []
+
+
+def test_mentions_are_ordered_by_publish_time():
+    index = MentionIndex(max_mentions=2)
+    for day in ['03', '01', '04', '02']:
+        index.add('AAPL', Mention(f'https://www.cnbc.com/{day}', 'AAPL: buy', f'2022-06-{day}T23:00:00Z'))
+
+    assert [mention.url for mention in index.get_mentions('AAPL')] == ['https://www.cnbc.com/03',
+                                                                        'https://www.cnbc.com/04']
+    assert index.get_latest('AAPL').url == 'https://www.cnbc.com/04'
+    assert index.get_count('AAPL') == 4
@@ -1,4 +1,5 @@
-from utils import get_all_ark_holdings, get_ark_tickers
+from ark_wrapper import Ark
+from utils import get_all_ark_holdings, get_ark_tickers, get_ark_universe
 
 def test_get_ark_tickers():
     tickers = get_ark_tickers()
@@ -6,4 +7,15 @@ def test_get_ark_tickers():
 
 def test_get_all_ark_holdings():
     tickers = get_all_ark_holdings()
-    assert len(tickers)
\ No newline at end of file
+    assert len(tickers)
+
+
+def test_get_ark_universe(monkeypatch):
+    holdings = {
+        'ARKK': [{'ticker': 'TSLA', 'weight': 10.5}, {'ticker': 'ROKU', 'weight': 5.0}, {'ticker': None}],
+        'ARKW': [{'ticker': 'TSLA', 'weight': 6.2}, {'ticker': '4689', 'weight': 1.0}, {'ticker': 'ARCT UQ', 'weight': 1.0}],
+    }
+    monkeypatch.setattr(Ark, 'get_etf_holdings', lambda self, fund: {'holdings': holdings[fund]})
+
+    universe = get_ark_universe(['ARKK', 'ARKW'])
+    assert universe == {'TSLA': {'ARKK': 10.5, 'ARKW': 6.2}, 'ROKU': {'ARKK': 5.0}}
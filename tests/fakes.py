@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+from typing import Dict, Iterable, List
+
+import arrow
+
+
+def make_bars(symbol: str, start: arrow.Arrow, closes: Iterable[float], frame: str = 'hours') -> List[SimpleNamespace]:
+    '''
+    Returns bars shaped like the ones the Alpaca API returns, one per close, starting at start
+    and one frame ('hours', 'days', ...) apart.
+    '''
+    return [SimpleNamespace(S=symbol, t=start.shift(**{frame: i}).isoformat(), o=close, h=close, l=close, c=close, v=100)
+            for i, close in enumerate(closes)]
+
+
+class FakeClock:
+    '''
+    Clock that stays at the given time until it is moved. Sleeping moves it forward.
+    '''
+
+    def __init__(self, now: arrow.Arrow):
+        self.current = now
+
+    def now(self) -> arrow.Arrow:
+        return self.current
+
+    def sleep(self, seconds: float):
+        self.current = self.current.shift(seconds=seconds)
+
+
+class FakeApi:
+    '''
+    Local stand-in for the Alpaca REST client, for testing without an account.
+    Bars are served from the given list, orders are recorded, and prices, order statuses and buy prices can be set by the test.
+    '''
+
+    def __init__(self, bars: List[SimpleNamespace] = None, buy_prices: Dict[str, float] = None,
+                 prices: Dict[str, float] = None):
+        self.bars = bars if bars is not None else []
+        self.buy_prices = buy_prices if buy_prices is not None else {}
+        self.prices = prices if prices is not None else {}
+        self.statuses = {}
+        self.requests = []  # (symbols, start, end) of every bar request
+        self.requested = []  # ids of every order looked up
+        self.orders = []
+
+    def get_bars(self, symbols, timeframe, start=None, end=None):
+        self.requests.append((list(symbols), start, end))
+        start = arrow.get(start)
+        end = arrow.get(end)
+        return [bar for bar in self.bars if bar.S in symbols and start <= arrow.get(bar.t) <= end]
+
+    def get_latest_trades(self, symbols):
+        return {symbol: SimpleNamespace(p=self.prices[symbol]) for symbol in symbols if symbol in self.prices}
+
+    def get_order(self, order_id):
+        self.requested.append(order_id)
+        return {'id': order_id, 'symbol': 'AAPL', 'side': 'sell', 'status': self.statuses[order_id],
+                'filled_qty': '1', 'filled_avg_price': '100'}
+
+    def list_orders(self, status=None, symbols=None):
+        return [SimpleNamespace(side='buy', status='filled', filled_qty='1', filled_at='2022-06-01T14:30:00Z',
+                                filled_avg_price=self.buy_prices[symbol])
+                for symbol in symbols]
+
+    def submit_order(self, **order):
+        self.orders.append(order)
+        return SimpleNamespace(id=str(len(self.orders)), status='new', filled_avg_price=None)
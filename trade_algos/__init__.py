@@ -1,15 +1,43 @@
-from typing import Union
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Union
 
 import arrow
+import numpy as np
+import requests
 from alpaca_trade_api.rest import REST, APIError, TimeFrame
 
+from bar_store import BarStore
+from .account import AccountSnapshot
+from .clock import WallClock
+from .orders import OrderResult, OrderTracker, make_client_order_id
+from .positions import PositionBook
+from .rate_limit import requests_per_minute
+from .stream import create_stream
+
 
 class BaseAlgorithm:
+    price_ttl = 5.0  # seconds a fetched price is reused for
+
     def __init__(self, API_KEY: str, API_SECRET: str, base_url: str = 'https://paper-api.alpaca.markets', api_version: str = 'v2'):
         self.api = REST(API_KEY, API_SECRET, base_url=base_url,
                         api_version=api_version)
+        self.api_key = API_KEY
+        self.api_secret = API_SECRET
+        self.base_url = base_url
         self.symbols = {}
         self.holding_count = 0
+        self.clock = WallClock()
+        self.bar_store = BarStore()
+        self.rate_limiter = requests_per_minute(200)
+        self.price_cache = {}
+        self.yesterday_prices = {}
+        self.yesterday_prices_date = None
+        self.fractionable = {}
+        self.fractionable_date = None
+        self.account = AccountSnapshot(self.api)
+        self.positions = PositionBook(self.api)
+        self.order_tracker = OrderTracker(self.api, on_fill=self.record_fill)
 
     def add_symbol(self, symbol: str, **kwargs):
         self.symbols[symbol] = kwargs or {}
@@ -20,15 +48,27 @@ class BaseAlgorithm:
     def get_symbols(self):
         return self.symbols.keys()
 
+    def set_api(self, api):
+        '''
+        Points the algorithm and its account, position and order caches at a different API,
+        e.g. a simulated broker.
+        '''
+        self.api = api
+        self.account.api = api
+        self.account.invalidate()
+        self.positions.api = api
+        self.positions.invalidate()
+        self.order_tracker.api = api
+
+    def set_requests_per_minute(self, limit: int):
+        self.rate_limiter = requests_per_minute(limit)
+
     def get_number_of_shares(self, symbol: str):
-        try:
-            return float(self.api.get_position(symbol).qty)
-        except APIError:
-            return 0
+        return self.positions.get_qty(symbol)
 
     def has_traded_today(self):
         # get the now timestamp
-        now = arrow.now().format('YYYY-MM-DD')
+        now = self.clock.now().format('YYYY-MM-DD')
         # get all orders after the now timestamp
         orders = self.api.list_orders(after=now, status='closed', limit=500)
 
@@ -46,36 +86,196 @@ class BaseAlgorithm:
         return self.get_number_of_shares(symbol) * self.get_current_price(symbol)
 
     def get_account_value(self):
-        return self.api.get_account().portfolio_value
+        return self.account.get().portfolio_value
 
     def get_account_cash(self):
-        return float(self.api.get_account().cash)
+        return self.account.get().cash
 
     def get_account_buying_power(self):
-        return float(self.api.get_account().buying_power)
+        return self.account.get().buying_power
 
     def get_account_equity(self):
-        return float(self.api.get_account().equity)
+        return self.account.get().equity
+
+    def create_stream(self):
+        return create_stream(self.api_key, self.api_secret, self.base_url)
+
+    def get_current_prices(self, symbols: List[str]) -> Dict[str, float]:
+        '''
+        Returns the latest trade price of each symbol. Prices younger than price_ttl are served
+        from the price cache and the rest are fetched together in a single request. Symbols
+        without a latest trade, e.g. halted or delisted ones, are left out.
+        '''
+        now = time.monotonic()
+        prices = {}
+        missing = []
+        for symbol in symbols:
+            cached = self.price_cache.get(symbol)
+            if cached is not None and now - cached[1] < self.price_ttl:
+                prices[symbol] = cached[0]
+            else:
+                missing.append(symbol)
+
+        if missing:
+            self.rate_limiter.acquire()
+            trades = self.api.get_latest_trades(missing)
+            for symbol, trade in trades.items():
+                price = float(trade.p)
+                self.price_cache[symbol] = (price, now)
+                prices[symbol] = price
+        return prices
 
     def get_current_price(self, symbol: str):
-        return float(self.api.get_bars(symbol, TimeFrame.Minute, limit=1)[0].c)
+        prices = self.get_current_prices([symbol])
+        if symbol not in prices:
+            raise ValueError(f'no latest trade for {symbol}, it may be halted or delisted')
+        return prices[symbol]
 
     def get_current_crypto_price(self, symbol: str, exchange: str = 'CBSE'):
         q = self.api.get_latest_crypto_quote(symbol + 'USD', exchange)
         return float(q.ap)
 
+    def get_stored_bars(self, symbols: List[str], timeframe: TimeFrame, start: arrow.Arrow, end: arrow.Arrow) -> Dict[str, np.ndarray]:
+        '''
+        Returns the bars for each symbol between start and end, fetching only the bars missing from the bar store.
+        '''
+        self.bar_store.sync(self.api, symbols, timeframe,
+                            start, end, self.rate_limiter)
+        return {symbol: self.bar_store.read(symbol, timeframe, start, end) for symbol in symbols}
+
+    def get_yesterday_prices(self, symbols: List[str]) -> Dict[str, float]:
+        '''
+        Returns the last daily close of each symbol. Daily bars of all symbols that haven't been
+        looked up today are fetched in a single request, and the closes are kept for the rest of the day.
+        Symbols without daily bars are left out.
+        '''
+        now = self.clock.now()
+        today = now.format('YYYY-MM-DD')
+        if self.yesterday_prices_date != today:
+            self.yesterday_prices = {}
+            self.yesterday_prices_date = today
+
+        missing = [symbol for symbol in symbols if symbol not in self.yesterday_prices]
+        if missing:
+            # the free data plan doesn't allow queries that end within the last 15 minutes
+            bars_by_symbol = self.get_stored_bars(
+                missing, TimeFrame.Day, now.shift(days=-7), now.shift(minutes=-15))
+            for symbol, bars in bars_by_symbol.items():
+                if len(bars) > 0:
+                    self.yesterday_prices[symbol] = float(bars[-1]['c'])
+        return {symbol: self.yesterday_prices[symbol] for symbol in symbols if symbol in self.yesterday_prices}
+
+    def get_fractionable(self, symbols: List[str]) -> Dict[str, bool]:
+        '''
+        Returns whether each symbol can be traded in fractional shares. All active assets are
+        listed in one request a day instead of looking the symbols up one by one.
+        '''
+        today = self.clock.now().format('YYYY-MM-DD')
+        if self.fractionable_date != today:
+            self.rate_limiter.acquire()
+            self.fractionable = {asset.symbol: bool(getattr(asset, 'fractionable', False))
+                                 for asset in self.api.list_assets(status='active')}
+            self.fractionable_date = today
+        return {symbol: self.fractionable.get(symbol, False) for symbol in symbols}
+
     def get_yesterday_price(self, symbol: str):
-        barset = self.api.get_bars(
-            symbol, TimeFrame.Day, start=arrow.now().shift(days=-1).isoformat(), limit=2)
-        return float(barset[-1].c)
+        return self.get_yesterday_prices([symbol])[symbol]
 
     def clear_account_orders(self):
         orders = self.api.list_orders(status='open')
         for order in orders:
             self.api.cancel_order(order.id)
 
+    def submit_order(self, **order):
+        '''
+        Submits an order and keeps the account snapshot in step with it. Buys with a known
+        cost are debited from the snapshot, anything else invalidates it.
+        '''
+        self.rate_limiter.acquire()
+        result = self.api.submit_order(**order)
+        cost = None
+        if order['side'] == 'buy':
+            cost = order.get('notional')
+            price = order.get('limit_price') or order.get('stop_price')
+            if price is None and order['symbol'] in self.price_cache:
+                price = self.price_cache[order['symbol']][0]
+            if cost is None and price is not None and order.get('qty') is not None:
+                cost = float(order['qty']) * float(price)
+        if cost is None:
+            self.account.invalidate()
+        else:
+            self.account.debit(float(cost))
+        self.order_tracker.track(result)
+        return result
+
+    def submit_idempotent(self, order: dict, retries: int = 2):
+        '''
+        Submits an order that carries a client_order_id. If the connection fails, or Alpaca
+        already knows the id, the existing order is looked up instead of submitting it again.
+        '''
+        error = None
+        for _ in range(retries + 1):
+            try:
+                return self.submit_order(**order)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = e
+            except APIError as e:
+                if 'client_order_id' not in str(e):
+                    raise
+                error = e
+            # the order may have reached Alpaca before the request failed
+            try:
+                existing = self.api.get_order_by_client_order_id(
+                    order['client_order_id'])
+            except APIError:
+                continue
+            self.account.invalidate()
+            self.order_tracker.track(existing)
+            return existing
+        raise error
+
+    def submit_orders(self, planned: List[dict], max_workers: int = 8) -> List[OrderResult]:
+        '''
+        Submits a batch of planned orders (keyword arguments of submit_order) concurrently,
+        within the algorithm's rate limit. Orders without a client_order_id get a deterministic one
+        so retries are safe. Returns one result per planned order, in the same order.
+        '''
+        orders = []
+        for index, order in enumerate(planned):
+            order = dict(order)
+            if 'client_order_id' not in order:
+                order['client_order_id'] = make_client_order_id(
+                    order, index, self.clock.now().format('YYYY-MM-DD'))
+            orders.append(order)
+
+        def submit(order: dict) -> OrderResult:
+            try:
+                return OrderResult(order, self.submit_idempotent(order))
+            except Exception as e:
+                return OrderResult(order, error=e)
+
+        if not orders:
+            return []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(submit, orders))
+
+    def start_order_stream(self):
+        '''
+        Follows order updates over the websocket instead of polling them.
+        '''
+        return self.order_tracker.start_stream(self.create_stream())
+
+    def wait_for_orders(self, orders: list, timeout: Union[float, None] = None) -> List[dict]:
+        '''
+        Blocks until the given submitted orders are filled, canceled, expired or rejected.
+        '''
+        return self.order_tracker.wait([self.order_tracker.track(order) for order in orders], timeout)
+
+    def record_fill(self, symbol: str, side: str, qty: float, price: float, order_id: Union[str, None] = None):
+        self.positions.apply_fill(symbol, side, qty, price)
+
     def place_notional_order(self, symbol: str, price: float):
-        return self.api.submit_order(
+        return self.submit_order(
             symbol=symbol,
             notional=price,
             side='buy',
@@ -84,7 +284,7 @@ class BaseAlgorithm:
         )
 
     def place_buy_order(self, symbol: str, qty: Union[float, int]):
-        return self.api.submit_order(
+        return self.submit_order(
             symbol=symbol,
             qty=float(qty),
             side='buy',
@@ -93,7 +293,7 @@ class BaseAlgorithm:
         )
 
     def place_sell_order(self, symbol: str, qty: Union[float, int]):
-        return self.api.submit_order(
+        return self.submit_order(
             symbol=symbol,
             qty=float(qty),
             side='sell',
@@ -102,7 +302,7 @@ class BaseAlgorithm:
         )
 
     def place_limit_buy_order(self, symbol: str, qty: Union[float, int], limit_price: float):
-        return self.api.submit_order(
+        return self.submit_order(
             symbol=symbol,
             qty=float(qty),
             side='buy',
@@ -112,7 +312,7 @@ class BaseAlgorithm:
         )
 
     def place_limit_sell_order(self, symbol: str, qty: Union[float, int], limit_price: float):
-        return self.api.submit_order(
+        return self.submit_order(
             symbol=symbol,
             qty=float(qty),
             side='sell',
@@ -122,7 +322,7 @@ class BaseAlgorithm:
         )
 
     def place_stop_buy_order(self, symbol: str, qty: Union[float, int], stop_price: float):
-        return self.api.submit_order(
+        return self.submit_order(
             symbol=symbol,
             qty=float(qty),
             side='buy',
@@ -132,7 +332,7 @@ class BaseAlgorithm:
         )
 
     def place_stop_sell_order(self, symbol: str, qty: Union[float, int], stop_price: float):
-        return self.api.submit_order(
+        return self.submit_order(
             symbol=symbol,
             qty=float(qty),
             side='sell',
@@ -142,7 +342,7 @@ class BaseAlgorithm:
         )
 
     def sell_notional_order(self, symbol: str, price: float):
-        return self.api.submit_order(
+        return self.submit_order(
             symbol=symbol,
             notional=price,
             side='sell',
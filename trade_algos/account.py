@@ -0,0 +1,47 @@
+import threading
+import time
+
+
+class AccountSnapshot:
+    '''
+    Keeps the Alpaca account in memory so the account fields can be read without a request each.
+    The snapshot is refetched once it is older than max_age seconds or after it has been invalidated,
+    and buy orders can debit it locally instead of invalidating it.
+    '''
+
+    def __init__(self, api, max_age: float = 60.0):
+        self.api = api
+        self.max_age = max_age
+        self.account = None
+        self.fetched_at = 0.0
+        self.cash = 0.0
+        self.buying_power = 0.0
+        self.equity = 0.0
+        self.portfolio_value = 0.0
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        self.account = self.api.get_account()
+        self.fetched_at = time.monotonic()
+        self.cash = float(self.account.cash)
+        self.buying_power = float(self.account.buying_power)
+        self.equity = float(self.account.equity)
+        self.portfolio_value = float(self.account.portfolio_value)
+
+    def get(self) -> 'AccountSnapshot':
+        if self.account is None or time.monotonic() - self.fetched_at > self.max_age:
+            self.refresh()
+        return self
+
+    def invalidate(self):
+        self.account = None
+
+    def debit(self, amount: float):
+        '''
+        Takes the cost of a submitted buy order off the cached cash and buying power.
+        '''
+        with self.lock:
+            if self.account is None:
+                return
+            self.cash -= amount
+            self.buying_power -= amount
@@ -0,0 +1,92 @@
+import bisect
+import itertools
+import math
+from typing import Dict, Union
+
+
+def get_targets(symbols, budget: float, weights: Union[Dict[str, float], None] = None) -> Dict[str, float]:
+    '''
+    Splits the budget into dollar targets. Without weights every symbol gets an equal share,
+    otherwise the budget is split in proportion to the (non-negative) weights.
+    '''
+    if weights is None:
+        weights = {symbol: 1.0 for symbol in symbols}
+    weights = {symbol: max(float(weights.get(symbol, 0.0)), 0.0)
+               for symbol in symbols}
+    total = sum(weights.values())
+    if total == 0:
+        return {symbol: 0.0 for symbol in symbols}
+    return {symbol: budget * weights[symbol] / total for symbol in symbols}
+
+
+def allocate_notional(symbols, budget: float, weights: Union[Dict[str, float], None] = None, precision: int = 2) -> Dict[str, float]:
+    '''
+    Returns the dollar amount to buy of each symbol, rounded down to cents.
+    '''
+    scale = 10 ** precision
+    return {symbol: math.floor(target * scale) / scale
+            for symbol, target in get_targets(symbols, budget, weights).items()}
+
+
+def allocate_shares(prices: Dict[str, float], budget: float, weights: Union[Dict[str, float], None] = None, fractional: bool = False, precision: int = 6) -> Dict[str, Union[int, float]]:
+    '''
+    Returns the number of shares to buy of each symbol so that the cost stays within budget.
+
+    Each symbol first gets as many shares as fit in its target. Leftover cash then goes one share
+    at a time to the symbols furthest below their target, and anything still left is spread
+    round-robin over the symbols that are still affordable, a whole round at a time.
+    With fractional set, shares are rounded down to precision decimals instead.
+    '''
+    symbols = [symbol for symbol in prices if prices[symbol] > 0]
+    targets = get_targets(symbols, budget, weights)
+    amounts = {symbol: 0 for symbol in prices}
+
+    if fractional:
+        scale = 10 ** precision
+        for symbol in symbols:
+            amounts[symbol] = math.floor(
+                targets[symbol] / prices[symbol] * scale) / scale
+        return amounts
+
+    cash = budget
+    for symbol in symbols:
+        amounts[symbol] = int(targets[symbol] // prices[symbol])
+        cash -= amounts[symbol] * prices[symbol]
+
+    # one extra share for the symbols furthest below target, in order of the shortfall
+    shortfall = sorted(symbols, key=lambda symbol: (targets[symbol] - amounts[symbol] * prices[symbol]) / prices[symbol],
+                       reverse=True)
+    for symbol in shortfall:
+        if weights is not None and targets[symbol] == 0:
+            continue
+        if prices[symbol] <= cash:
+            amounts[symbol] += 1
+            cash -= prices[symbol]
+
+    # spread the rest round-robin over the affordable symbols, cheapest first. The affordable
+    # symbols are a prefix of the symbols sorted by price, and so are the ones a partial round
+    # reaches, so both are found by bisecting the prefix sums of the prices. The shares are counted
+    # per prefix length and handed out in one pass at the end. Every iteration leaves a shorter
+    # prefix affordable, so this is O(n log n) overall, dominated by the sort.
+    by_price = sorted((symbol for symbol in symbols if weights is None or targets[symbol] > 0),
+                      key=lambda symbol: prices[symbol])
+    sorted_prices = [prices[symbol] for symbol in by_price]
+    round_costs = list(itertools.accumulate(sorted_prices, initial=0.0))
+    extra = [0] * (len(by_price) + 1)  # shares added to each of the n cheapest symbols
+    affordable = bisect.bisect_right(sorted_prices, cash)
+    while affordable > 0:
+        rounds = int(cash // round_costs[affordable])
+        extra[affordable] += rounds
+        cash -= rounds * round_costs[affordable]
+        # a partial round buys one more share of the cheapest symbols while the cash lasts
+        reached = bisect.bisect_right(round_costs, cash, 0, affordable + 1) - 1
+        extra[reached] += 1
+        cash -= round_costs[reached]
+        affordable = bisect.bisect_right(sorted_prices, cash)
+
+    shares = 0
+    for n in range(len(by_price), 0, -1):
+        shares += extra[n]
+        amounts[by_price[n - 1]] += shares
+
+    return amounts
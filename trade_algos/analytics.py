@@ -0,0 +1,57 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+def stack_bars(bars_by_symbol: Dict[str, np.ndarray]) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]:
+    '''
+    Flattens a dict of per-symbol bar arrays into (symbols, symbol index, timestamp, close) arrays.
+    '''
+    symbols = list(bars_by_symbol.keys())
+    lengths = [len(bars_by_symbol[symbol]) for symbol in symbols]
+    symbol_index = np.repeat(np.arange(len(symbols)), lengths)
+    if not symbols or sum(lengths) == 0:
+        return symbols, symbol_index, np.empty(0, dtype=np.int64), np.empty(0)
+    timestamps = np.concatenate([bars_by_symbol[symbol]['t'] for symbol in symbols])
+    closes = np.concatenate([bars_by_symbol[symbol]['c'] for symbol in symbols])
+    return symbols, symbol_index, timestamps, closes
+
+
+def rate_of_change_stats(symbol_index: np.ndarray, timestamps: np.ndarray, closes: np.ndarray, n_symbols: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''
+    Computes the mean and variance of the close-to-close change and the number of changes
+    for every symbol in one vectorized pass. Bars do not need to be sorted.
+    Symbols with no changes get a mean and variance of nan.
+    '''
+    if len(closes) > 0:
+        # sort on a single (symbol, time) key, bars straight from the bar store are already in order
+        key = (symbol_index.astype(np.int64) << 40) | (timestamps - timestamps.min()).astype(np.int64)
+        if np.any(key[1:] < key[:-1]):
+            order = np.argsort(key)
+            symbol_index = symbol_index[order]
+            closes = closes[order]
+
+    # a change only counts when both bars belong to the same symbol
+    same_symbol = symbol_index[1:] == symbol_index[:-1]
+    change_symbol = symbol_index[1:][same_symbol]
+    changes = np.diff(closes)[same_symbol]
+
+    count = np.bincount(change_symbol, minlength=n_symbols)
+    total = np.bincount(change_symbol, weights=changes, minlength=n_symbols)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        deviations = changes - mean[change_symbol]
+        variance = np.bincount(change_symbol, weights=deviations * deviations,
+                               minlength=n_symbols) / count
+    return mean, variance, count
+
+
+def rate_of_change_means(bars_by_symbol: Dict[str, np.ndarray]) -> dict:
+    '''
+    Returns the mean close-to-close change for each symbol that has at least two bars,
+    e.g. {'TSLA': 0.42, 'AAPL': -0.1}.
+    '''
+    symbols, symbol_index, timestamps, closes = stack_bars(bars_by_symbol)
+    mean, _, count = rate_of_change_stats(
+        symbol_index, timestamps, closes, len(symbols))
+    return {symbols[i]: float(mean[i]) for i in np.flatnonzero(count)}
@@ -0,0 +1,76 @@
+import json
+from typing import Dict, Iterable, List, Union
+
+import arrow
+from sqlmodel import Session
+
+from database import (get_blacklist_entries, remove_blacklist_entry,
+                      remove_expired_blacklist_entries, set_blacklist_entries)
+from database.model import BlacklistEntry
+from .clock import WallClock
+
+
+class Blacklist:
+    '''
+    Tickers that shouldn't be bought again until their entry expires. Entries are kept in the
+    database and indexed in memory, so membership checks and filtering never touch the database
+    and every change writes only its own row. Expired entries are dropped on load.
+    '''
+
+    def __init__(self, engine, clock=None):
+        self.engine = engine
+        self.clock = clock if clock is not None else WallClock()
+        with Session(self.engine) as session:
+            remove_expired_blacklist_entries(session, self.now())
+            self.entries: Dict[str, int] = {
+                entry.ticker: entry.expires for entry in get_blacklist_entries(session)}
+
+    def now(self) -> int:
+        return self.clock.now().int_timestamp
+
+    def add(self, ticker: str, expires: Union[arrow.Arrow, None] = None):
+        '''
+        Blacklists the ticker until expires, a month from now by default.
+        '''
+        if expires is None:
+            expires = self.clock.now().shift(months=1)
+        self.add_many({ticker: expires.int_timestamp})
+
+    def add_many(self, entries: Dict[str, int]):
+        '''
+        Blacklists several tickers at once, given as {ticker: expiry unix timestamp}.
+        '''
+        with Session(self.engine) as session:
+            set_blacklist_entries(session, [BlacklistEntry(ticker=ticker, expires=int(expires))
+                                            for ticker, expires in entries.items()])
+        self.entries.update(entries)
+
+    def remove(self, ticker: str):
+        if self.entries.pop(ticker, None) is None:
+            return
+        with Session(self.engine) as session:
+            remove_blacklist_entry(session, ticker)
+
+    def __contains__(self, ticker: str) -> bool:
+        return self.entries.get(ticker, 0) > self.now()
+
+    def filter(self, tickers: Iterable[str]) -> List[str]:
+        '''
+        Returns the tickers that are not blacklisted, in the same order.
+        '''
+        now = self.now()
+        return [ticker for ticker in tickers if self.entries.get(ticker, 0) <= now]
+
+    def get(self) -> Dict[str, int]:
+        '''
+        Returns the active entries as {ticker: expiry unix timestamp}.
+        '''
+        now = self.now()
+        return {ticker: expires for ticker, expires in self.entries.items() if expires > now}
+
+    def import_json(self, path: str):
+        '''
+        Adds the entries of a blacklist.json file written by earlier versions.
+        '''
+        with open(path, 'r') as f:
+            self.add_many({ticker: int(expires) for ticker, expires in json.load(f).items()})
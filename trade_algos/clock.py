@@ -0,0 +1,16 @@
+import time
+
+import arrow
+
+
+class WallClock:
+    '''
+    The real clock. Algorithms read the time and sleep through their clock
+    so a backtest can swap in simulated time.
+    '''
+
+    def now(self) -> arrow.Arrow:
+        return arrow.now()
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
@@ -1,10 +1,117 @@
-import time
 import math
+from typing import Dict, List, Tuple
 
 from . import BaseAlgorithm
-from ark_wrapper import Ark
+from ark_wrapper.history import DATE_FORMAT, HoldingsHistory, diff_snapshots
+from database import ARK_TABLES, get_engine
+
+
+class MarketSnapshot:
+    '''
+    Everything the copycat planner needs to know about the account and the market, fetched up front.
+    '''
+
+    def __init__(self, cash: float, buying_power: float, shares: Dict[str, float], prices: Dict[str, float],
+                 yesterday_prices: Dict[str, float], fractionable: Dict[str, bool]):
+        self.cash = cash
+        self.buying_power = buying_power
+        self.shares = shares  # shares we hold of each symbol
+        self.prices = prices
+        self.yesterday_prices = yesterday_prices
+        self.fractionable = fractionable
+
+
+class CopyCatPlan:
+    def __init__(self, daily_budget: float):
+        self.daily_budget = daily_budget
+        self.buys: List[dict] = []
+        self.sells: List[dict] = []
+        self.skipped: List[Tuple[str, str]] = []  # (symbol, reason)
+
+    def __repr__(self):
+        return f'CopyCatPlan(buys={self.buys}, sells={self.sells}, skipped={self.skipped})'
+
+
+def whole_shares(amount: float, price: float, round_up: bool = False) -> int:
+    shares = math.floor(amount / price)
+    # buy a single share if the amount is within 10% of its price
+    if round_up and shares <= 0 and 1 - (amount / price) < 0.1:
+        shares = 1
+    return shares
+
+
+def plan_orders(trades: List[dict], holdings: Dict[str, float], snapshot: MarketSnapshot, daily_budget_percent: float, min_bal: float) -> CopyCatPlan:
+    '''
+    Plans the orders that copy ARK's trades. The daily budget is split over ARK's buys by the value
+    ARK bought of each, and every ARK sell sells the same fraction of our position as ARK sold of its
+    holding. Symbols that can't be traded fractionally are bought and sold in whole shares.
+    holdings are ARK's shares of each ticker before the trades.
+    '''
+    plan = CopyCatPlan((snapshot.cash - min_bal) * daily_budget_percent)
+
+    ark_purchases = {}              # value of shares purchased by ark
+    ark_sells = {}                  # fraction of its shares ark sold
+    for trade in trades:
+        ticker = trade['ticker']
+        if trade['direction'] == 'Buy':
+            if ticker not in snapshot.yesterday_prices:
+                plan.skipped.append((ticker, 'no price'))
+                continue
+            ark_purchases[ticker] = trade['shares'] * snapshot.yesterday_prices[ticker]
+        elif trade['direction'] == 'Sell' and holdings.get(ticker):
+            ark_sells[ticker] = trade['shares'] / holdings[ticker]
+
+    total_ark_purchased = sum(ark_purchases.values())
+    buying_power = snapshot.buying_power
+    for symbol, purchased in ark_purchases.items():
+        amount = plan.daily_budget * purchased / total_ark_purchased if total_ark_purchased else 0
+        if amount <= 0:
+            continue
+        if buying_power < amount:
+            plan.skipped.append((symbol, 'not enough buying power'))
+            continue
+        buying_power -= amount
+        if snapshot.fractionable.get(symbol):
+            plan.buys.append(dict(symbol=symbol, notional=round(amount, 2), side='buy',
+                                  type='market', time_in_force='day'))
+            continue
+        price = snapshot.prices.get(symbol)
+        shares = whole_shares(amount, price, round_up=True) if price else 0
+        if shares <= 0:
+            plan.skipped.append((symbol, 'cannot buy a whole share'))
+            continue
+        plan.buys.append(dict(symbol=symbol, qty=shares, side='buy',
+                              type='market', time_in_force='day'))
+
+    for symbol, fraction in ark_sells.items():
+        price = snapshot.prices.get(symbol)
+        value = snapshot.shares.get(symbol, 0) * (price or 0)
+        if not value:
+            continue
+        amount = value * fraction
+        if value < amount:
+            plan.skipped.append((symbol, 'not enough shares'))
+            continue
+        if snapshot.fractionable.get(symbol):
+            plan.sells.append(dict(symbol=symbol, notional=round(amount, 2), side='sell',
+                                   type='market', time_in_force='day'))
+            continue
+        shares = whole_shares(amount, price)
+        if shares <= 0:
+            plan.skipped.append((symbol, 'cannot sell a whole share'))
+            continue
+        plan.sells.append(dict(symbol=symbol, qty=shares, side='sell',
+                               type='market', time_in_force='day'))
+    return plan
+
 
 class CopyCatAlgorithm(BaseAlgorithm):
+    history_database_url = 'sqlite:///ark_history.db'
+    history = None
+    # derive ARK's trades from consecutive holdings snapshots instead of the trades endpoint.
+    # Creations and redemptions change every holding's share count, so on flow days nearly
+    # every ticker shows up as a trade.
+    derive_trades = False
 
     def set_daily_budget_percent(self, percent: float) -> None:
         self.daily_budget_percent = percent
@@ -15,8 +122,72 @@ class CopyCatAlgorithm(BaseAlgorithm):
     def set_etf_symbol(self, symbol: str = "ARKK") -> None:     # this is actually an ETF symbol; not a ticker.
         self.etf_symbol = symbol
 
+    def set_derive_trades(self, derive_trades: bool) -> None:
+        self.derive_trades = derive_trades
+
+    def get_history(self) -> HoldingsHistory:
+        if self.history is None:
+            self.history = HoldingsHistory(get_engine(self.history_database_url, ARK_TABLES))
+        return self.history
+
+    def get_ark_activity(self) -> Tuple[List[dict], Dict[str, float]]:
+        '''
+        Returns ARK's latest trades from the trades endpoint and its shares of each ticker in the
+        snapshot before them, read from the local holdings history. With derive_trades, the trades
+        are the difference between the two latest snapshots instead.
+        '''
+        history = self.get_history()
+        today = self.clock.now().format(DATE_FORMAT)
+        week_ago = self.clock.now().shift(days=-7).format(DATE_FORMAT)
+        history.sync(self.etf_symbol, week_ago, today)
+        snapshots = history.get_holdings(self.etf_symbol, week_ago, today)
+        dates = sorted(snapshots)
+
+        if self.derive_trades:
+            if len(dates) < 2:
+                return [], {}
+            previous = dates[-2]
+            trades = diff_snapshots(self.etf_symbol, dates[-1], snapshots[previous], snapshots[dates[-1]])
+        else:
+            trades = history.ark.get_etf_trades(self.etf_symbol)['trades']
+            if not trades:
+                return [], {}
+            # the last snapshot before the trades, or the latest one if ARK hasn't published that far back
+            earlier = [date for date in dates if date < min(trade['date'] for trade in trades)] or dates
+            previous = earlier[-1] if earlier else None
+
+        # cash lines and foreign listings like 4689 or ARCT UQ can't be traded
+        trades = [trade for trade in trades if trade['ticker'] and trade['ticker'].isalpha()]
+        holdings = {holding.ticker: holding.shares for holding in snapshots.get(previous, []) if holding.ticker}
+        return trades, holdings
+
+    def take_snapshot(self, buy_symbols: List[str], sell_symbols: List[str]) -> MarketSnapshot:
+        '''
+        Fetches the account, positions, prices and fractionability the planner needs in a handful of requests.
+        '''
+        self.account.invalidate()
+        account = self.account.get()
+        self.positions.load()
+        symbols = list(dict.fromkeys(buy_symbols + sell_symbols))
+        return MarketSnapshot(
+            cash=account.cash,
+            buying_power=account.buying_power,
+            shares={symbol: self.positions.get_qty(symbol) for symbol in sell_symbols},
+            prices=self.get_current_prices(symbols),
+            yesterday_prices=self.get_yesterday_prices(buy_symbols),
+            fractionable=self.get_fractionable(symbols),
+        )
+
+    def execute_plan(self, plan: CopyCatPlan):
+        for side, planned in [('purchase', plan.buys), ('sell', plan.sells)]:
+            for result in self.submit_orders(planned):
+                if not result.ok:
+                    raise result.error
+                order = result.planned
+                amount = f"${order['notional']}" if 'notional' in order else f"{order['qty']} shares"
+                print(f"Submitted order to {side} {amount} of {order['symbol']}")
+
     def run(self):
-        ark = Ark()
         while True:
             traded_today = self.has_traded_today()
             clock = None
@@ -24,125 +195,35 @@ class CopyCatAlgorithm(BaseAlgorithm):
                 clock = self.api.get_clock()
             except Exception as e:
                 print(e)
-                time.sleep(5)
+                self.clock.sleep(5)
                 continue
 
             if traded_today:
-                time.sleep(60 * 60 * 11)
+                self.clock.sleep(60 * 60 * 11)
                 print("Sleeping until next data upload.")
 
             if not clock.is_open:
-                time.sleep(10)
+                self.clock.sleep(10)
                 continue
 
-            print("Begin trading for today")    
+            print("Begin trading for today")
             print(f'Getting ARK ETF Data for symbol {self.etf_symbol}...')
-            yesterday_trades = ark.get_etf_trades(self.etf_symbol)
-            yesterday_holdings_raw = ark.get_etf_holdings(self.etf_symbol)
+            trades, holdings = self.get_ark_activity()
 
-            print('Getting holdings data for each ticker...')
-            yesterday_holdings = {}
-            for holding in yesterday_holdings_raw['holdings']:
-                ticker = holding['ticker']
-                yesterday_holdings[ticker] = holding
+            print('Getting market snapshot...')
+            buy_symbols = [trade['ticker'] for trade in trades if trade['direction'] == 'Buy']
+            sell_symbols = [trade['ticker'] for trade in trades if trade['direction'] == 'Sell']
+            snapshot = self.take_snapshot(buy_symbols, sell_symbols)
 
-            self.daily_budget = (self.get_account_cash() - self.min_bal) * self.daily_budget_percent
+            plan = plan_orders(trades, holdings, snapshot, self.daily_budget_percent, self.min_bal)
+            self.daily_budget = plan.daily_budget
             print(f'Daily budget: {self.daily_budget}')
+            for order in plan.buys + plan.sells:
+                amount = f"${order['notional']}" if 'notional' in order else f"{order['qty']} shares"
+                print(f"Planning to {order['side']} {amount} of {order['symbol']}")
+            for symbol, reason in plan.skipped:
+                print(f"Skipping {symbol}: {reason}")
+
+            self.execute_plan(plan)
 
-            ark_purchases = {}              # value of shares purchased by ark
-            ark_sells = {}                  # percentage of shares to sell
-            calculated_purchases = {}       # dollars of shares to buy
-            calculated_sells = {}           # dollars of shares to sell
-
-            for trade in yesterday_trades['trades']:
-                ticker = trade['ticker']
-                if trade['direction'] == "Buy":
-                    # this gets cost
-                    share_price = self.get_yesterday_price(ticker)
-                    ark_purchases[ticker] = trade['shares'] * share_price
-                if trade['direction'] == "Sell":
-                    # this gets percentage of owned that was sold
-                    ark_sells[ticker] = trade['shares'] / yesterday_holdings[ticker]['shares']
-                
-            total_ark_purchased = 0         # total value of shares purchased by ark
-            for purchase in ark_purchases:
-                total_ark_purchased += ark_purchases[purchase]
-
-            for symbol in ark_purchases:
-                symbol_purchase_percentage = ark_purchases[symbol] / total_ark_purchased
-                calculated_purchases[symbol] = self.daily_budget * symbol_purchase_percentage
-                print(f"Planning to purchase ${calculated_purchases[symbol]} of  {symbol}")      # print what we're planning to purchase
-
-            for symbol in ark_sells:
-                current_value = self.get_number_of_shares(symbol) * self.get_current_price(symbol)
-                if not current_value:
-                    continue
-                calculated_sells[symbol] = current_value * ark_sells[symbol]
-                print(f"Planning to sell ${calculated_sells[symbol]} of {symbol}")               # print what we're planning to sell
-
-            for purchase_symbol in calculated_purchases:
-                if self.get_account_buying_power() < calculated_purchases[purchase_symbol]:
-                    continue
-                try:
-                    self.api.submit_order(
-                        symbol=purchase_symbol,
-                        notional=calculated_purchases[purchase_symbol],
-                        side='buy',
-                        type='market',
-                        time_in_force='day'
-                    )
-                    print(f"Submitted order to purchase ${calculated_purchases[purchase_symbol]} of {purchase_symbol}")
-                except Exception as e:
-                    if 'fractionable' in str(e):
-                        print(f"Cannot purchase {purchase_symbol} as fractional. Recalculating...")
-                        price = self.get_current_price(purchase_symbol)
-                        shares = math.floor(calculated_purchases[purchase_symbol] / price)
-                        percent_diff = 1 - (calculated_purchases[purchase_symbol] / price)
-                        if percent_diff < 0.1 and shares <= 0:
-                            shares = 1
-                        if shares > 0:
-                            self.api.submit_order(
-                                symbol=purchase_symbol,
-                                qty=shares,
-                                side='buy',
-                                type='market',
-                                time_in_force='day'
-                            )
-                            print(f"Submitted order to purchase {shares} shares of {purchase_symbol}")
-                        else:
-                            print(f"Cannot purchase {purchase_symbol}, skipping...")
-                    else:
-                        raise e
-
-            for sell_symbol in calculated_sells:
-                if self.get_value_of_shares(sell_symbol) < calculated_sells[sell_symbol] or not self.get_number_of_shares(sell_symbol):
-                    continue
-                try:
-                    self.api.submit_order(
-                        symbol=sell_symbol,
-                        notional=calculated_sells[sell_symbol],
-                        side='sell',
-                        type='market',
-                        time_in_force='day'
-                    )
-                    print(f"Submitted order to sell ${calculated_sells[sell_symbol]} of {sell_symbol}")
-                except Exception as e:
-                    if 'fractionable' in str(e):
-                        print(f"Cannot sell {sell_symbol} as fractional. Recalculating...")
-                        price = self.get_current_price(sell_symbol)
-                        shares = math.floor(calculated_sells[sell_symbol] / price)
-                        if shares > 0:
-                            self.api.submit_order(
-                                symbol=sell_symbol,
-                                qty=shares,
-                                side='sell',
-                                type='market',
-                                time_in_force='day'
-                            )
-                            print(f"Submitted order to sell {shares} shares of {sell_symbol}")
-                        else:
-                            print(f"Cannot sell {sell_symbol} as fractional. Skipping...")
-                    else:
-                        raise e
-
-            print("Done trading for the day.")
\ No newline at end of file
+            print("Done trading for the day.")
@@ -0,0 +1,107 @@
+from typing import Dict, List, Tuple, Union
+
+import arrow
+from sqlmodel import Session
+
+from database import add_holdings, add_sales, get_most_recent_holdings, get_recorded_order_ids, iter_fills
+from database.model import Holding, Sale
+from .portfolio import Portfolio
+
+
+class FillLedger:
+    '''
+    Records buy fills as holdings and sell fills as sales in the database and keeps the most
+    recent buy price of every ticker in memory, so cost basis lookups don't need the broker.
+    Once loaded, the FIFO portfolio is updated with every recorded fill. Fills that carry an
+    order id are recorded once per order.
+    '''
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.buy_prices = {}
+        self.portfolio = None
+
+    def new_fills(self, session: Session, model, fills: list) -> list:
+        '''
+        Pads (ticker, shares, price, date) fills with an order id of None, and leaves out the fills
+        of orders that are already recorded in the table of model or earlier in fills.
+        '''
+        fills = [tuple(fill) + (None,) * (5 - len(fill)) for fill in fills]
+        seen = get_recorded_order_ids(session, model, [fill[4] for fill in fills if fill[4] is not None])
+        new = []
+        for fill in fills:
+            if fill[4] is not None:
+                if fill[4] in seen:
+                    continue
+                seen.add(fill[4])
+            new.append(fill)
+        return new
+
+    def record_buy(self, ticker: str, shares: float, price: float, buy_date: Union[str, None] = None,
+                   order_id: Union[str, None] = None):
+        self.record_buys([(ticker, shares, price, buy_date, order_id)])
+
+    def record_buys(self, fills: List[Tuple]):
+        '''
+        Records (ticker, shares, price, buy date[, order id]) buy fills in a single commit. Buy dates
+        are anything arrow can parse and default to now. Fills of an order that is already recorded
+        are skipped.
+        '''
+        now = arrow.utcnow()
+        with Session(self.engine) as session:
+            fills = [(ticker, shares, price, arrow.get(buy_date or now).datetime, order_id)
+                     for ticker, shares, price, buy_date, order_id in self.new_fills(session, Holding, fills)]
+            add_holdings(session, [Holding(ticker=ticker, shares=shares, buy_price=price, buy_date=buy_date,
+                                           order_id=order_id)
+                                   for ticker, shares, price, buy_date, order_id in fills])
+        for ticker, shares, price, buy_date, _ in fills:
+            self.buy_prices[ticker] = price
+            if self.portfolio is not None:
+                self.portfolio.record_buy(ticker, shares, price, buy_date)
+
+    def record_sell(self, ticker: str, shares: float, price: float, sell_date: Union[str, None] = None,
+                    order_id: Union[str, None] = None):
+        self.record_sells([(ticker, shares, price, sell_date, order_id)])
+
+    def record_sells(self, fills: List[Tuple]):
+        '''
+        Records (ticker, shares, price, sell date[, order id]) sell fills in a single commit.
+        Fills of an order that is already recorded are skipped.
+        '''
+        now = arrow.utcnow()
+        with Session(self.engine) as session:
+            fills = self.new_fills(session, Sale, fills)
+            add_sales(session, [Sale(ticker=ticker, shares=shares, sell_price=price,
+                                     sell_date=arrow.get(sell_date or now).datetime, order_id=order_id)
+                                for ticker, shares, price, sell_date, order_id in fills])
+        if self.portfolio is not None:
+            for ticker, shares, price, _, _ in fills:
+                self.portfolio.record_sell(ticker, shares, price)
+
+    def get_portfolio(self) -> Portfolio:
+        '''
+        Returns the FIFO lots of every ticker, rebuilt from the recorded fills on first use.
+        '''
+        if self.portfolio is None:
+            with Session(self.engine) as session:
+                self.portfolio = Portfolio.from_fills(iter_fills(session))
+        return self.portfolio
+
+    def get_buy_price(self, ticker: str) -> Union[float, None]:
+        '''
+        Returns the price of the most recent recorded buy of the ticker, or None if there is none.
+        '''
+        return self.get_buy_prices([ticker]).get(ticker)
+
+    def get_buy_prices(self, tickers: List[str]) -> Dict[str, float]:
+        '''
+        Returns the price of the most recent recorded buy of each ticker, loading the ones not in
+        memory yet in a single query. Tickers without a recorded buy are left out.
+        '''
+        missing = [ticker for ticker in tickers if ticker not in self.buy_prices]
+        if missing:
+            with Session(self.engine) as session:
+                holdings = get_most_recent_holdings(session, missing)
+            for ticker, holding in holdings.items():
+                self.buy_prices[ticker] = holding.buy_price
+        return {ticker: self.buy_prices[ticker] for ticker in tickers if ticker in self.buy_prices}
@@ -1,16 +1,21 @@
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import os
-import time
-from typing import List
-import json
-from datetime import timedelta
+from typing import List, Tuple
 
 import arrow
 from alpaca_trade_api import TimeFrame, TimeFrameUnit
 import requests
 
+from database import BLACKLIST_TABLES, MEANS_TABLES, get_engine
 from . import BaseAlgorithm
+from .allocation import allocate_shares
+from .analytics import rate_of_change_means
+from .blacklist import Blacklist
+from .means_cache import MeansCache
 
+# timeframes the means can be calculated over
+TIMEFRAMES = ['day', 'week', 'month']
 # chunk a list into n evenly sized chunks
 
 
@@ -19,43 +24,14 @@ def chunk(lst, n):
         yield lst[i:i + n]
 
 
-def create_blacklist(path: str, symbols: List[str] = []):
-    values = {}
-    for symbol in symbols:
-        values[symbol] = arrow.now().shift(months=1).timestamp
-    with open(path, 'w') as f:
-        json.dump(values, f)
-
-
-def create_cache_file(data: dict, filename: str):
-    # get the date now
-    now = arrow.utcnow()
-    output_data = {
-        'date': now.isoformat(),
-        'data': data
-    }
-    with open(filename, 'w') as f:
-        json.dump(output_data, f, indent=4)
-
-
-def load_cache_file(filename: str) -> dict:
-    with open(filename, 'r') as f:
-        data = json.load(f)
-    date = arrow.get(data['date'])
-
-    # check if the cache file is older than 12 hours
-    # if it is, return empty data and delete the file
-    now = arrow.utcnow()
-    if now - date > timedelta(hours=12):
-        os.remove(filename)
-        return {}
-
-    return data['data']
-
-
 class MeanReversionAlgorithm(BaseAlgorithm):
     budget = 0.0
     blacklist_path = 'blacklist.json'
+    blacklist_database_url = 'sqlite:///blacklist.db'
+    blacklist = None
+    chunk_size = 10
+    top_n = 10  # most tickers bought in a day
+    max_workers = 4
 
     def set_tickers(self, tickers: List[str]):
         self.tickers = list(set(tickers))
@@ -63,38 +39,34 @@ class MeanReversionAlgorithm(BaseAlgorithm):
     def set_budget(self, budget: float):
         self.budget = budget
 
+    def set_max_workers(self, max_workers: int):
+        self.max_workers = max_workers
+
+    def set_top_n(self, top_n: int):
+        self.top_n = top_n
+
+    def set_chunk_size(self, chunk_size: int):
+        self.chunk_size = chunk_size
+
+    def get_blacklist_store(self) -> Blacklist:
+        if self.blacklist is None:
+            self.blacklist = Blacklist(get_engine(
+                self.blacklist_database_url, BLACKLIST_TABLES), self.clock)
+            # carry over the blacklist file of earlier versions
+            if os.path.exists(self.blacklist_path):
+                self.blacklist.import_json(self.blacklist_path)
+                os.replace(self.blacklist_path,
+                           self.blacklist_path + '.imported')
+        return self.blacklist
+
     def add_to_blacklist(self, ticker: str):
-        # check if blacklist exists
-        if os.path.exists(self.blacklist_path):
-            # append the ticker to the blacklist
-            with open(self.blacklist_path, 'r') as f:
-                blacklist = json.load(f)
-            blacklist[ticker] = arrow.now().shift(months=1).timestamp
-            with open(self.blacklist_path, 'w') as f:
-                json.dump(blacklist, f)
-        else:
-            # create the blacklist
-            create_blacklist(self.blacklist_path, [ticker])
+        self.get_blacklist_store().add(ticker)
 
     def remove_from_blacklist(self, ticker: str):
-        # check if blacklist exists
-        if os.path.exists(self.blacklist_path):
-            # append the ticker to the blacklist
-            with open(self.blacklist_path, 'r') as f:
-                blacklist = json.load(f)
-            if ticker in blacklist:
-                del blacklist[ticker]
-                with open(self.blacklist_path, 'w') as f:
-                    json.dump(blacklist, f)
-        # otherwise, do nothing
+        self.get_blacklist_store().remove(ticker)
 
     def get_blacklist(self) -> dict:
-        if os.path.exists(self.blacklist_path):
-            with open(self.blacklist_path, 'r') as f:
-                blacklist = json.load(f)
-        else:
-            blacklist = {}
-        return blacklist
+        return self.get_blacklist_store().get()
 
     # def stop_loss(self):
     #     positions = self.get_owned_positions()
@@ -103,63 +75,86 @@ class MeanReversionAlgorithm(BaseAlgorithm):
     #             self.sell_all(symbol)
 
     def get_owned_positions(self) -> dict:
-        positions = self.get_portfolio(raw=True)
+        self.positions.load()
         owned_positions = {}
-        for position in positions:
-            symbol = position['symbol']
-            shares = float(position['qty'])
-            market_value = float(position['market_value'])
-            avg_entry_price = float(position['avg_entry_price'])
+        for symbol in self.positions.symbols():
+            position = self.positions.get_position(symbol)
             owned_positions[symbol] = {
-                'shares': shares,  # shares the user owns
-                'market_value': market_value,  # market value of the shares
-                'avg_entry_price': avg_entry_price  # average buy price of the shares
+                'shares': position.qty,  # shares the user owns
+                'market_value': position.market_value,  # market value of the shares
+                'avg_entry_price': position.avg_entry_price  # average buy price of the shares
             }
         return owned_positions
 
-    def mean(self, symbols: List[str], timeframe: str = 'month') -> dict:
-        alpaca_timeframe = TimeFrame(1, TimeFrameUnit.Hour)
-        start_date = arrow.now().shift(months=-1)
+    def bar_window(self, timeframe: str = 'month') -> Tuple[arrow.Arrow, arrow.Arrow]:
+        '''
+        Returns the start and end of the hourly bars the means are calculated over.
+        '''
+        now = self.clock.now()
+        start_date = now.shift(months=-1)
         if timeframe == 'day':
-            start_date = arrow.now().shift(days=-1)
+            start_date = now.shift(days=-1)
         if timeframe == 'week':
-            start_date = arrow.now().shift(weeks=-1)
-        today = arrow.now().shift(minutes=-30)
+            start_date = now.shift(weeks=-1)
+        return start_date, now.shift(minutes=-30)
+
+    def means_watermark(self, timeframe: str = 'month') -> arrow.Arrow:
+        '''
+        Returns when the last hourly bar the means are calculated over closed. Cached means with
+        an older watermark are stale, as another bar has closed since.
+        '''
+        _, end = self.bar_window(timeframe)
+        return end.floor('hour')
+
+    def mean(self, symbols: List[str], timeframe: str = 'month') -> dict:
+        alpaca_timeframe = TimeFrame(1, TimeFrameUnit.Hour)
+        start_date, today = self.bar_window(timeframe)
         try:
-            bars = self.api.get_bars(symbols, alpaca_timeframe, start=start_date.isoformat(
-            ), end=today.isoformat(), limit=10000)
+            bars_by_symbol = self.get_stored_bars(
+                symbols, alpaca_timeframe, start_date, today)
         except requests.exceptions.HTTPError as e:
             print('HTTPError: {}'.format(e))
             return {}
-        # bars for multiple symbols are grouped in the same list
-        # create an object with each symbol as a key
-        # and the list of bars as the value
-        # e.g. {'TSLA': [bar1, bar2, bar3], 'AAPL': [bar1, bar2, bar3]}
-        bars_by_symbol = {}
-        changes_by_symbol = {}
-        for bar in bars:
-            if bar.S in bars_by_symbol:
-                bars_by_symbol[bar.S].append(bar)
-            else:
-                bars_by_symbol[bar.S] = [bar]
-
-        # sort the bars by time
-        for symbol in bars_by_symbol:
-            bars_by_symbol[symbol].sort(key=lambda bar: bar.t)
-            changes_by_symbol[symbol] = []
-            for i in range(1, len(bars_by_symbol[symbol])):
-                changes_by_symbol[symbol].append(
-                    bars_by_symbol[symbol][i].c - bars_by_symbol[symbol][i-1].c)
 
-        # calculate the mean of the changes
-        means = {}
-        for symbol in changes_by_symbol:
-            means[symbol] = sum(changes_by_symbol[symbol]) / \
-                len(changes_by_symbol[symbol])
+        return rate_of_change_means(bars_by_symbol)
 
-        return means
+    def submit_planned_orders(self, planned: List[dict]) -> list:
+        '''
+        Submits the orders as one batch, printing any that failed, and returns the submitted orders.
+        '''
+        submitted = []
+        for result in self.submit_orders(planned):
+            if result.ok:
+                submitted.append(result.order)
+            else:
+                print(
+                    f"Could not {result.planned['side']} {result.planned['symbol']}: {result.error}")
+        return submitted
+
+    def concurrent_means(self, ticker_chunks: List[List[str]], timeframe: str = 'month') -> dict:
+        '''
+        Calculates the means of every chunk with several requests in flight at once.
+        Requests are capped by the algorithm's rate limiter and results are merged as they arrive.
+        '''
+        values = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.mean, ticker_chunk, timeframe): ticker_chunk
+                       for ticker_chunk in ticker_chunks}
+            retries = {}
+            for future in as_completed(futures):
+                chunk_values = future.result()
+                # combine values and chunk_values
+                values.update(chunk_values)
+                if not chunk_values and len(futures[future]) > 1:
+                    print(
+                        'There was an issue getting data in bulk. Trying again...')
+                    for t in futures[future]:
+                        retries[executor.submit(self.mean, [t], timeframe)] = t
+            for future in as_completed(retries):
+                values.update(future.result())
+        return values
 
-    def calculate_buy_amounts(self, tickers: List[str], testing: bool = False) -> dict:
+    def calculate_buy_amounts(self, tickers: List[str], testing: bool = False, weights: dict = None) -> dict:
 
         budget = self.budget
         cash = self.get_account_cash()
@@ -170,28 +165,20 @@ class MeanReversionAlgorithm(BaseAlgorithm):
             print('Not enough cash in budget, skipping today....')
             return {}
 
-        # get the current market price of each ticker in buy
-        prices = {}
-        buy_amounts = {}
-        for ticker in tickers:
-            prices[ticker] = self.get_current_price(ticker)
-            buy_amounts[ticker] = 0
-
-        current_cost = 0.0
+        # get the current market price of each ticker in buy, tickers without one are not bought
+        prices = self.get_current_prices(tickers)
 
-        while True:
-            for ticker in tickers:
-                if current_cost + prices[ticker] <= budget:
-                    buy_amounts[ticker] += 1
-                    current_cost += prices[ticker]
-                else:
-                    return buy_amounts
+        return allocate_shares({ticker: prices[ticker] for ticker in tickers if ticker in prices}, budget, weights)
 
-    def run(self, symbols: List[str], cache_means: bool = False, timeFrame: str = 'month', cache_filename: str = 'mean_reversion.json', testing: bool = False) -> dict:
+    def run(self, symbols: List[str], cache_means: bool = False, timeFrame: str = 'month', cache_filename: str = 'mean_reversion.db', testing: bool = False) -> dict:
 
         print('Initialzing Mean Reversion Algorithm')
         print('Waiting for market open....')
 
+        cache = None
+        if cache_means:
+            cache = MeansCache(get_engine(f'sqlite:///{cache_filename}', MEANS_TABLES))
+
         waitTime = 60
         waitCount = 0
         try:
@@ -201,7 +188,7 @@ class MeanReversionAlgorithm(BaseAlgorithm):
                     clock = self.api.get_clock()
 
                     if not clock.is_open:
-                        time.sleep(60)
+                        self.clock.sleep(60)
                         continue
 
                 sell = []
@@ -210,7 +197,7 @@ class MeanReversionAlgorithm(BaseAlgorithm):
                 print('Market Open! Good morning!')
                 # pretty print the current local time to console
                 print('The date and time is currently', end=' ')
-                print(arrow.now().format('YYYY-MM-DD HH:mm:ss'))
+                print(self.clock.now().format('YYYY-MM-DD HH:mm:ss'))
 
                 print(f"Using {timeFrame} timeframe.")
 
@@ -223,39 +210,31 @@ class MeanReversionAlgorithm(BaseAlgorithm):
                     print('Clearing orders...')
                     # clear existing orders
                     self.clear_account_orders()
+                    if not self.order_tracker.streaming:
+                        self.start_order_stream()
 
                 values = {}
-                cache_invalid = False
 
                 print('Running analysis.....')
 
-                if cache_means and os.path.isfile(cache_filename):
-                    print('Loading cached means from {}'.format(cache_filename))
-                    values = load_cache_file(cache_filename)
-
-                if not values:
-                    cache_invalid = True
-                    print('Calculating means.....')
-                    chunks = chunk(self.tickers, 10)
-                    for ticker_chunk in chunks:
-                        chunk_values = self.mean(ticker_chunk, timeFrame)
-                        # combine values and chunk_values
-                        values.update(chunk_values)
-                        if not values:
-                            print(
-                                'There was an issue getting data in bulk. Trying again...')
-                            for t in ticker_chunk:
-                                roc = self.mean([t], timeFrame)
-                                if roc:
-                                    values[ticker] = roc[ticker]
+                watermark = self.means_watermark(timeFrame)
+                if cache is not None:
+                    values = cache.get(self.tickers, timeFrame, self.clock.now(), min_watermark=watermark)
+                    print(f'Loaded {len(values)} cached means from {cache_filename}')
+
+                # only tickers without a fresh cached mean are calculated
+                missing = [ticker for ticker in self.tickers if ticker not in values]
+                if missing:
+                    print(f'Calculating means for {len(missing)} tickers.....')
+                    calculated = self.concurrent_means(
+                        list(chunk(missing, self.chunk_size)), timeFrame)
+                    values.update(calculated)
+                    if cache is not None:
+                        cache.put(calculated, timeFrame, watermark, self.clock.now())
 
                 sorted_values = OrderedDict(
                     sorted(values.items(), key=lambda x: x[1], reverse=True))
 
-                if cache_means and cache_invalid:
-                    # output to json file
-                    create_cache_file(sorted_values, cache_filename)
-
                 # get all tickers with a mean reversion greater than 0
                 tickers = []
                 for ticker in sorted_values:
@@ -267,41 +246,50 @@ class MeanReversionAlgorithm(BaseAlgorithm):
                         sell.append(ticker)
 
                 print(f'Selling tickers: {sell}')
+                planned_sells = []
                 for ticker in sell:
                     qty = owned_positions[ticker]['shares']
                     print(f'Selling {qty} shares of {ticker}')
-                    if not testing:
-                        self.place_sell_order(ticker, qty)
+                    planned_sells.append(dict(symbol=ticker, qty=float(qty), side='sell',
+                                              type='market', time_in_force='day'))
+                sell_orders = []
+                if not testing:
+                    sell_orders = self.submit_planned_orders(planned_sells)
 
                 print('Waiting for positions to sell...')
-                while len(self.api.list_orders(status='open')) > 0:
-                    time.sleep(3)
+                self.wait_for_orders(sell_orders)
 
                 print('Calculating buy amounts...')
 
-                # if there are more than 10 tickers, only buy the top 10
-                if len(tickers) > 10:
-                    tickers = tickers[:10]
+                # held blacklisted tickers are kept, but no more are bought
+                tickers = self.get_blacklist_store().filter(tickers)
+
+                # if there are more than top_n tickers, only buy the top top_n
+                if len(tickers) > self.top_n:
+                    tickers = tickers[:self.top_n]
                     print(
-                        f"More than 10 top stocks, only buying top 10: {tickers}")
+                        f"More than {self.top_n} top stocks, only buying top {self.top_n}: {tickers}")
 
                 buy_amounts = self.calculate_buy_amounts(tickers, testing)
 
                 # print(buy_amounts)
 
                 print('Buying tickers...')
+                planned_buys = []
                 for ticker in buy_amounts:
                     if buy_amounts[ticker] > 0:
                         print(
                             f'Buying {buy_amounts[ticker]} shares of {ticker}')
-                        if not testing:
-                            self.place_buy_order(ticker, buy_amounts[ticker])
+                        planned_buys.append(dict(symbol=ticker, qty=float(buy_amounts[ticker]), side='buy',
+                                                 type='market', time_in_force='day'))
+                if not testing:
+                    self.submit_planned_orders(planned_buys)
 
                 # done for the day, sleeping until market close
                 print('Done for the day, sleeping until market close.')
                 if not clock is None:
                     while clock.is_open:
-                        time.sleep(120)
+                        self.clock.sleep(120)
                         clock = self.api.get_clock()
 
                 print('Market Closed! Good Night!')
@@ -310,7 +298,7 @@ class MeanReversionAlgorithm(BaseAlgorithm):
         except Exception as e:
             print(e)
             print('Error occurred, waiting and retrying...')
-            time.sleep(waitTime * waitCount)
+            self.clock.sleep(waitTime * waitCount)
             waitCount += 1
             if waitCount > 10:
                 print('Exceeded wait count, exiting...')
@@ -0,0 +1,46 @@
+from typing import Dict, List, Union
+
+import arrow
+from sqlmodel import Session
+
+from database import BATCH_SIZE, get_cached_means, set_cached_means
+from database.model import CachedMean
+
+
+class MeansCache:
+    '''
+    Rate of change means cached per ticker and timeframe in SQLite, each with the time it was
+    computed and the end of the bars it covers. Means older than max_age seconds are stale, so
+    only stale and new tickers need to be recomputed. With an engine from database.get_engine the
+    database runs in WAL mode, so several processes can read it while one writes.
+    '''
+
+    def __init__(self, engine, max_age: float = 12 * 60 * 60):
+        self.engine = engine
+        self.max_age = max_age
+
+    def get(self, tickers: List[str], timeframe: str, now: arrow.Arrow, min_watermark: Union[arrow.Arrow, None] = None) -> Dict[str, float]:
+        '''
+        Returns the means that are still fresh, e.g. {'TSLA': 0.42}. Tickers that are missing or
+        stale are left out. If min_watermark is given, means over bars ending before it are stale too.
+        '''
+        computed_after = int(now.int_timestamp - self.max_age)
+        watermark = min_watermark.int_timestamp if min_watermark is not None else None
+        means = {}
+        with Session(self.engine) as session:
+            for i in range(0, len(tickers), BATCH_SIZE):
+                for cached in get_cached_means(session, tickers[i:i + BATCH_SIZE], timeframe, computed_after):
+                    if watermark is None or cached.watermark >= watermark:
+                        means[cached.ticker] = cached.mean
+        return means
+
+    def put(self, means: Dict[str, float], timeframe: str, watermark: arrow.Arrow, now: arrow.Arrow):
+        '''
+        Stores freshly computed means over bars ending at watermark.
+        '''
+        rows = [CachedMean(ticker=ticker, timeframe=timeframe, mean=mean,
+                           watermark=watermark.int_timestamp, computed_at=now.int_timestamp)
+                for ticker, mean in means.items()]
+        with Session(self.engine) as session:
+            for i in range(0, len(rows), BATCH_SIZE):
+                set_cached_means(session, rows[i:i + BATCH_SIZE])
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import Future, wait
+from typing import Callable, Dict, List, Union
+
+import arrow
+
+# order statuses after which an order will not change anymore
+FINAL_STATUSES = {'filled', 'canceled', 'expired', 'rejected', 'done_for_day'}
+# trade update events that move an order into a final status
+FINAL_EVENTS = {'fill', 'canceled', 'expired', 'rejected', 'done_for_day'}
+
+
+def make_client_order_id(order: dict, index: int = 0, date: Union[str, None] = None, prefix: str = 'stonks') -> str:
+    '''
+    Builds a client order id from the order's fields, its position in the batch and the trading day.
+    Submitting the same planned order twice gives the same id, so Alpaca rejects the duplicate
+    instead of filling it twice.
+    '''
+    if date is None:
+        date = arrow.now().format('YYYY-MM-DD')
+    key = json.dumps({'order': order, 'index': index, 'date': date},
+                     sort_keys=True, default=str)
+    return f'{prefix}-{hashlib.sha1(key.encode()).hexdigest()[:32]}'
+
+
+class OrderResult:
+    def __init__(self, planned: dict, order=None, error: Union[Exception, None] = None):
+        self.planned = planned
+        self.order = order
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self):
+        return f'OrderResult({self.planned}, order={self.order}, error={self.error})'
+
+
+def order_to_dict(order) -> dict:
+    if isinstance(order, dict):
+        return order
+    return getattr(order, '_raw', None) or vars(order)
+
+
+class OrderTracker:
+    '''
+    Tracks submitted orders until they are filled, canceled, expired or rejected, and hands out
+    a future per order that resolves with the final order. Updates come from the trade updates
+    stream when it is connected. Otherwise, or as a safety net, only the orders we are waiting
+    on are polled by id. Futures are kept for resolved_ttl seconds once resolved, so an order that
+    completed before it was tracked gets its finished future, and on_fill runs once per order.
+    on_fill gets every final order with filled shares, including partial fills that were then canceled.
+    '''
+
+    def __init__(self, api, on_fill: Union[Callable, None] = None, poll_interval: float = 3.0, stream_poll_interval: float = 30.0,
+                 resolved_ttl: float = 60 * 60):
+        self.api = api
+        self.on_fill = on_fill
+        self.poll_interval = poll_interval
+        self.stream_poll_interval = stream_poll_interval
+        self.resolved_ttl = resolved_ttl
+        self.futures: Dict[str, Future] = {}
+        self.resolved: Dict[str, float] = {}  # when each order was resolved, oldest first
+        self.lock = threading.Lock()
+        self.streaming = False
+
+    def track(self, order) -> Future:
+        '''
+        Returns the future for the order, resolving it right away if the order is already final.
+        '''
+        order = order_to_dict(order)
+        with self.lock:
+            future = self.futures.get(order['id'])
+            if future is None:
+                future = self.futures[order['id']] = Future()
+        if order.get('status') in FINAL_STATUSES:
+            self.resolve(order)
+        return future
+
+    def prune(self, now: float):
+        '''
+        Forgets the orders resolved more than resolved_ttl seconds ago. Must be called with the lock held.
+        '''
+        while self.resolved:
+            order_id = next(iter(self.resolved))
+            if now - self.resolved[order_id] < self.resolved_ttl:
+                break
+            del self.resolved[order_id]
+            self.futures.pop(order_id, None)
+
+    def resolve(self, order: dict):
+        with self.lock:
+            if order['id'] in self.resolved:
+                return
+            now = time.monotonic()
+            self.prune(now)
+            self.resolved[order['id']] = now
+            future = self.futures.get(order['id'])
+            if future is None:
+                # the update arrived before anyone tracked the order
+                future = self.futures[order['id']] = Future()
+        # canceled and expired orders may have filled in part
+        filled_qty = float(order.get('filled_qty') or 0)
+        if filled_qty > 0 and self.on_fill is not None:
+            self.on_fill(order['symbol'], order['side'], filled_qty,
+                         float(order['filled_avg_price']), order['id'])
+        future.set_result(order)
+
+    def handle_update(self, event: str, order):
+        order = order_to_dict(order)
+        if event in FINAL_EVENTS:
+            self.resolve(order)
+
+    async def on_trade_update(self, data):
+        self.handle_update(data.event, data.order)
+
+    def start_stream(self, stream):
+        '''
+        Subscribes to trade updates and runs the stream in a background thread.
+        '''
+        stream.subscribe_trade_updates(self.on_trade_update)
+        self.streaming = True
+        thread = threading.Thread(target=stream.run, daemon=True)
+        thread.start()
+        return thread
+
+    def poll(self, order_ids: List[str]):
+        for order_id in order_ids:
+            order = order_to_dict(self.api.get_order(order_id))
+            if order.get('status') in FINAL_STATUSES:
+                self.resolve(order)
+
+    def wait(self, futures: List[Future], timeout: Union[float, None] = None) -> List[dict]:
+        '''
+        Blocks until every future has resolved and returns the final orders.
+        Raises TimeoutError if they have not all resolved within timeout seconds.
+        '''
+        interval = self.stream_poll_interval if self.streaming else self.poll_interval
+        waited = 0.0
+        while True:
+            _, pending = wait(futures, timeout=interval)
+            if not pending:
+                return [future.result() for future in futures]
+            waited += interval
+            if timeout is not None and waited >= timeout:
+                raise TimeoutError(f'{len(pending)} orders did not complete')
+            pending_ids = [order_id for order_id, future in list(self.futures.items())
+                           if future in pending]
+            self.poll(pending_ids)
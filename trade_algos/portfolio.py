@@ -0,0 +1,153 @@
+from collections import deque
+from typing import Dict, Iterable, List, Tuple, Union
+
+import arrow
+
+# remaining shares below this are rounding left over from fractional fills
+EPSILON = 1e-9
+
+
+class Lot:
+    __slots__ = ('shares', 'price', 'date')
+
+    def __init__(self, shares: float, price: float, date=None):
+        self.shares = shares
+        self.price = price
+        self.date = date
+
+    def __repr__(self):
+        return f'Lot(shares={self.shares}, price={self.price}, date={self.date})'
+
+
+class TickerLots:
+    '''
+    The open lots of a ticker in the order they were bought, with running totals of the shares,
+    their cost and the realized P&L, so none of them need to walk the lots.
+    '''
+
+    def __init__(self, ticker: str):
+        self.ticker = ticker
+        self.lots = deque()
+        self.shares = 0.0
+        self.cost = 0.0
+        self.realized = 0.0
+
+    def buy(self, shares: float, price: float, date=None):
+        self.lots.append(Lot(shares, price, date))
+        self.shares += shares
+        self.cost += shares * price
+
+    def sell(self, shares: float, price: float) -> float:
+        '''
+        Closes shares from the oldest lots first and returns the P&L realized by the sale.
+        Shares sold beyond the open lots are ignored.
+        '''
+        realized = 0.0
+        while shares > EPSILON and self.lots:
+            lot = self.lots[0]
+            closed = min(shares, lot.shares)
+            realized += closed * (price - lot.price)
+            self.cost -= closed * lot.price
+            self.shares -= closed
+            lot.shares -= closed
+            shares -= closed
+            if lot.shares <= EPSILON:
+                self.lots.popleft()
+        if not self.lots:
+            self.shares = 0.0
+            self.cost = 0.0
+        self.realized += realized
+        return realized
+
+    def average_cost(self) -> float:
+        return self.cost / self.shares if self.shares > EPSILON else 0.0
+
+    def unrealized(self, price: float) -> float:
+        return self.shares * price - self.cost
+
+
+class Portfolio:
+    '''
+    FIFO cost basis and P&L of every ticker, kept up to date as fills are applied. Rebuilding it
+    from the database is a single pass over the fills in the order they happened.
+    '''
+
+    def __init__(self):
+        self.tickers: Dict[str, TickerLots] = {}
+        self.realized = 0.0
+
+    @classmethod
+    def from_fills(cls, fills: Iterable[Tuple[str, str, float, float, object]]) -> 'Portfolio':
+        '''
+        Builds a portfolio from (side, ticker, shares, price, date) fills, e.g. from database.iter_fills.
+        '''
+        portfolio = cls()
+        for side, ticker, shares, price, date in fills:
+            portfolio.apply_fill(ticker, side, shares, price, date)
+        return portfolio
+
+    def apply_fill(self, ticker: str, side: str, shares: float, price: float, date=None) -> float:
+        '''
+        Applies a filled order and returns the P&L it realized.
+        '''
+        if side == 'buy':
+            self.record_buy(ticker, shares, price, date)
+            return 0.0
+        return self.record_sell(ticker, shares, price)
+
+    def record_buy(self, ticker: str, shares: float, price: float, date=None):
+        lots = self.tickers.get(ticker)
+        if lots is None:
+            lots = self.tickers[ticker] = TickerLots(ticker)
+        lots.buy(shares, price, date)
+
+    def record_sell(self, ticker: str, shares: float, price: float) -> float:
+        lots = self.tickers.get(ticker)
+        if lots is None:
+            return 0.0
+        realized = lots.sell(shares, price)
+        self.realized += realized
+        return realized
+
+    def held(self) -> List[str]:
+        return [ticker for ticker, lots in self.tickers.items() if lots.shares > EPSILON]
+
+    def get_shares(self, ticker: str) -> float:
+        lots = self.tickers.get(ticker)
+        return lots.shares if lots is not None else 0.0
+
+    def get_cost_basis(self, ticker: str) -> float:
+        lots = self.tickers.get(ticker)
+        return lots.cost if lots is not None else 0.0
+
+    def get_average_cost(self, ticker: str) -> float:
+        lots = self.tickers.get(ticker)
+        return lots.average_cost() if lots is not None else 0.0
+
+    def get_realized_pnl(self, ticker: Union[str, None] = None) -> float:
+        if ticker is None:
+            return self.realized
+        lots = self.tickers.get(ticker)
+        return lots.realized if lots is not None else 0.0
+
+    def get_unrealized_pnl(self, ticker: str, price: float) -> float:
+        lots = self.tickers.get(ticker)
+        return lots.unrealized(price) if lots is not None else 0.0
+
+    def summary(self, prices: Dict[str, float]) -> Dict[str, dict]:
+        '''
+        Returns the shares, cost basis and P&L of every ticker ever traded. Unrealized P&L is
+        left out for tickers without a price.
+        '''
+        summary = {}
+        for ticker, lots in self.tickers.items():
+            price = prices.get(ticker)
+            summary[ticker] = {
+                'shares': lots.shares,
+                'cost_basis': round(lots.cost, 2),
+                'average_cost': round(lots.average_cost(), 4),
+                'realized_pnl': round(lots.realized, 2),
+                'unrealized_pnl': round(lots.unrealized(price), 2) if price is not None else None,
+                'oldest_lot': arrow.get(lots.lots[0].date).isoformat() if lots.lots and lots.lots[0].date else None,
+            }
+        return summary
@@ -0,0 +1,82 @@
+import time
+from typing import Dict, Union
+
+
+class Position:
+    def __init__(self, symbol: str, qty: float, avg_entry_price: float, market_value: float = 0.0):
+        self.symbol = symbol
+        self.qty = qty
+        self.avg_entry_price = avg_entry_price
+        self.market_value = market_value
+
+    def __repr__(self):
+        return f'Position({self.symbol}, qty={self.qty}, avg_entry_price={self.avg_entry_price})'
+
+
+class PositionBook:
+    '''
+    All open positions loaded with a single list_positions request and indexed by symbol.
+    The book is reloaded once it is older than max_age seconds or after it has been invalidated,
+    and fills can be applied to it in between.
+    '''
+
+    def __init__(self, api, max_age: float = 60.0):
+        self.api = api
+        self.max_age = max_age
+        self.positions: Union[Dict[str, Position], None] = None
+        self.loaded_at = 0.0
+
+    def load(self):
+        positions = {}
+        for position in self.api.list_positions():
+            positions[position.symbol] = Position(
+                position.symbol,
+                float(position.qty),
+                float(position.avg_entry_price),
+                float(position.market_value),
+            )
+        self.positions = positions
+        self.loaded_at = time.monotonic()
+
+    def get(self) -> 'PositionBook':
+        if self.positions is None or time.monotonic() - self.loaded_at > self.max_age:
+            self.load()
+        return self
+
+    def invalidate(self):
+        self.positions = None
+
+    def symbols(self):
+        return self.get().positions.keys()
+
+    def get_position(self, symbol: str) -> Union[Position, None]:
+        return self.get().positions.get(symbol)
+
+    def get_qty(self, symbol: str) -> float:
+        position = self.get_position(symbol)
+        if position is None:
+            return 0
+        return position.qty
+
+    def apply_fill(self, symbol: str, side: str, qty: float, price: float):
+        '''
+        Updates the book with a filled order. Buys move the average entry price,
+        sells reduce the quantity and remove the position once it is closed.
+        '''
+        if self.positions is None:
+            return
+        position = self.positions.get(symbol)
+        if side == 'buy':
+            if position is None:
+                self.positions[symbol] = Position(symbol, qty, price, qty * price)
+                return
+            total = position.qty + qty
+            position.avg_entry_price = (position.qty * position.avg_entry_price +
+                                        qty * price) / total
+            position.qty = total
+            position.market_value = total * price
+        elif position is not None:
+            position.qty -= qty
+            position.market_value = position.qty * price
+            if position.qty <= 0:
+                del self.positions[symbol]
@@ -0,0 +1,40 @@
+import threading
+import time
+from typing import Union
+
+
+class TokenBucket:
+    '''
+    Thread-safe token bucket. Tokens refill at rate per second up to capacity,
+    and acquire blocks until enough tokens are available.
+    '''
+
+    def __init__(self, rate: float, capacity: Union[float, None] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens +
+                                  (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def requests_per_minute(limit: int, burst: Union[int, None] = None) -> TokenBucket:
+    '''
+    Returns a bucket that allows limit requests per minute, with bursts of up to burst requests.
+    Alpaca allows 200 requests per minute per account.
+    '''
+    if burst is None:
+        burst = max(1, limit // 20)
+    return TokenBucket(limit / 60.0, burst)
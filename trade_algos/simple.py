@@ -1,11 +1,19 @@
-import time
+import asyncio
 import datetime
+from typing import Union
 
+from database import get_engine
 from . import BaseAlgorithm
+from .ledger import FillLedger
+from .stream import run_until
 class SimpleAlgorithm(BaseAlgorithm):
     '''
     Buys given stock or crypto. Set a max loss and a min gained. When min gained is hit, sell. When max loss is hit, sell.
     '''
+    database_url = 'sqlite:///holdings.db'
+    ledger = None
+    broker_buy_prices = None  # buy prices of symbols bought before the ledger recorded them
+
     def set_min_gain(self, symbol: str, min_gain: float) -> None:
         self.symbols[symbol]['min_gain'] = min_gain
 
@@ -18,71 +26,172 @@ class SimpleAlgorithm(BaseAlgorithm):
     def get_max_loss(self, symbol: str) -> float:
         return self.symbols[symbol]['max_loss']
 
+    def get_ledger(self) -> FillLedger:
+        if self.ledger is None:
+            self.ledger = FillLedger(get_engine(self.database_url))
+        return self.ledger
+
+    def record_fill(self, symbol: str, side: str, qty: float, price: float, order_id: Union[str, None] = None):
+        '''
+        Called by the order tracker for every filled order. This is the only place fills reach the ledger.
+        '''
+        super().record_fill(symbol, side, qty, price, order_id)
+        if side == 'buy':
+            self.get_ledger().record_buy(symbol, qty, price, self.clock.now().isoformat(), order_id)
+        else:
+            self.get_ledger().record_sell(symbol, qty, price, self.clock.now().isoformat(), order_id)
+
     def get_buy_price(self, symbol: str) -> float:
-        orders = self.api.list_orders(status="closed", symbols=[symbol])
-        if orders:
+        buy_price = self.get_ledger().get_buy_price(symbol)
+        if buy_price is not None:
+            return buy_price
+        # bought before the ledger existed, read the last filled buy from the broker once
+        if self.broker_buy_prices is None:
+            self.broker_buy_prices = {}
+        if symbol not in self.broker_buy_prices:
+            orders = self.api.list_orders(status="closed", symbols=[symbol])
             for order in orders:
-                if order.side == 'buy':
-                    return float(order.filled_avg_price)
-        return 0
+                # closed orders include canceled and expired buys that never filled
+                if order.side == 'buy' and float(order.filled_qty or 0) > 0:
+                    self.broker_buy_prices[symbol] = float(order.filled_avg_price)
+                    break
+        return self.broker_buy_prices.get(symbol, 0)
+
+    def buy_symbols(self, symbols) -> None:
+        # load the recorded buy prices of every symbol at once
+        self.get_ledger().get_buy_prices(list(symbols))
+        orders = []
+        # iterate through symbols
+        for symbol in symbols:
+            # check if we are holding any of this symbol
+            buy_price = self.get_buy_price(symbol)
+            # if we are holding any of this symbol
+            if buy_price != 0:
+                # don't buy any more
+                print(f'Holding {symbol} at {buy_price}')
+                self.holding_count += 1
+                continue
+            print(f"Buying {symbol}....")
+            # buy the symbol at current market price
+            orders.append(self.place_buy_order(symbol, self.symbols[symbol].get('qty', 1)))
+            self.holding_count += 1
+        # the order tracker records the fills in the ledger as they complete
+        for order in self.wait_for_orders(orders):
+            if order['status'] == 'filled':
+                print(f"{order['symbol']} bought at {order['filled_avg_price']}")
+            else:
+                print(f"{order['symbol']} buy {order['status']}")
+
+    def get_difference(self, symbol: str, current_price: float, buy_price: float) -> float:
+        return (current_price - buy_price) * self.symbols[symbol].get('qty', 1)
+
+    def should_sell(self, symbol: str, current_price: float, buy_price: float) -> bool:
+        difference = self.get_difference(symbol, current_price, buy_price)
+        return difference > self.get_min_gain(symbol) or difference < self.get_max_loss(symbol)
+
+    def sell_symbol(self, symbol: str, current_price: float) -> None:
+        # sell the symbol at current market price
+        self.place_sell_order(symbol, self.symbols[symbol].get('qty', 1))
+        self.holding_count -= 1
+        print(f'{symbol} sold at {current_price}')
 
     def run(self):
         while True:
             clock = self.api.get_clock()
 
             if not clock.is_open:
-                time.sleep(60)
+                self.clock.sleep(60)
                 continue
             
             # clear existing orders
             self.clear_account_orders()
+            # fills of the sells reach the ledger through the order updates
+            if not self.order_tracker.streaming:
+                self.start_order_stream()
 
             closingTime = clock.next_close.replace(tzinfo=datetime.timezone.utc).timestamp()
             # get symbols
             symbols = self.get_symbols()
 
-            # iterate through symbols
-            for symbol in symbols:
-                # check if we are holding any of this symbol
-                buy_price = self.get_buy_price(symbol)
-                # if we are holding any of this symbol
-                if buy_price != 0:
-                    # don't buy any more
-                    print(f'Holding {symbol} at {buy_price}')
-                    self.holding_count += 1
-                    continue
-                print(f"Buying {symbol}....")
-                # buy the symbol at current market price
-                order = self.place_buy_order(symbol, self.symbols[symbol].get('qty', 1))
-                self.holding_count += 1
-                print(f'{symbol} bought at {order.filled_avg_price}')
+            self.buy_symbols(symbols)
 
             while self.holding_count > 0:
-                currTime = clock.timestamp.replace(tzinfo=datetime.timezone.utc).timestamp()
+                currTime = self.clock.now().timestamp()
                 if currTime > closingTime:
                     break
+                # get the current price of every symbol at once
+                prices = self.get_current_prices(list(symbols))
                 # iterate through symbols
                 for symbol in symbols:
                     print('-' * 20)
-                    # get current price
-                    current_price = self.get_current_price(symbol)
+                    current_price = prices.get(symbol)
+                    if current_price is None:
+                        print(f'No latest trade for {symbol}, skipping')
+                        continue
                     buy_price = self.get_buy_price(symbol)
-                    min_gain = self.get_min_gain(symbol)
-                    max_loss = self.get_max_loss(symbol)
-                    difference = (current_price - buy_price) * self.symbols[symbol].get('qty', 1)
+                    if buy_price == 0:
+                        # the buy did not fill
+                        continue
+                    difference = self.get_difference(symbol, current_price, buy_price)
                     print(f'{symbol} current price: {current_price}')
                     print(f'{symbol} buy price: {buy_price}')
                     print(f'{symbol} difference: {round(difference, 2)}')
-                    if difference > min_gain:
-                        # sell the symbol at current market price
-                        self.place_sell_order(symbol, symbols.get('qty', 1))
-                        self.holding_count -= 1
-                        print(f'{symbol} sold at {current_price}')
-                    elif difference < max_loss:
-                        # sell the symbol at current market price
-                        self.place_sell_order(symbol, symbols.get('qty', 1))
-                        self.holding_count -= 1
-                        print(f'{symbol} sold at {current_price}')
+                    if self.should_sell(symbol, current_price, buy_price):
+                        self.sell_symbol(symbol, current_price)
 
                 # wait a second
-                time.sleep(1)
\ No newline at end of file
+                self.clock.sleep(1)
+
+    def run_streaming(self, stream=None, testing: bool = False):
+        '''
+        Same as run, but evaluates the thresholds on every trade pushed over the websocket
+        instead of polling prices every second. REST is only used to place orders.
+        '''
+        while True:
+            closingTime = float('inf')
+            if not testing:
+                clock = self.api.get_clock()
+
+                if not clock.is_open:
+                    self.clock.sleep(60)
+                    continue
+
+                # clear existing orders
+                self.clear_account_orders()
+
+                closingTime = clock.next_close.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+            symbols = list(self.get_symbols())
+            self.buy_symbols(symbols)
+            buy_prices = {symbol: self.get_buy_price(symbol) for symbol in symbols}
+            held = set(symbols)
+
+            day_stream = stream if stream is not None else self.create_stream()
+
+            async def on_trade(trade):
+                symbol = trade.symbol
+                if symbol not in held:
+                    return
+                if buy_prices[symbol] == 0:
+                    # the buy may not have filled yet when streaming started
+                    buy_prices[symbol] = await asyncio.to_thread(self.get_buy_price, symbol)
+                    if buy_prices[symbol] == 0:
+                        return
+                if self.should_sell(symbol, trade.price, buy_prices[symbol]):
+                    held.discard(symbol)
+                    # place the order off the event loop so other ticks keep flowing
+                    await asyncio.to_thread(self.sell_symbol, symbol, trade.price)
+                    if not held:
+                        await day_stream.stop_ws()
+
+            day_stream.subscribe_trades(on_trade, *symbols)
+            day_stream.subscribe_trade_updates(self.order_tracker.on_trade_update)
+            print(f'Streaming trades for {len(symbols)} symbols...')
+            if closingTime == float('inf'):
+                day_stream.run()
+            else:
+                # stops at the close even when no trades come in
+                run_until(day_stream, closingTime, self.clock)
+
+            if testing:
+                return
@@ -0,0 +1,76 @@
+import asyncio
+from types import SimpleNamespace
+from typing import Iterable, Tuple
+
+from alpaca_trade_api.stream import Stream
+
+
+def create_stream(API_KEY: str, API_SECRET: str, base_url: str, data_feed: str = 'iex') -> Stream:
+    '''
+    Returns an Alpaca websocket stream. A single connection carries the trades of every subscribed symbol.
+    '''
+    return Stream(API_KEY, API_SECRET, base_url=base_url, data_feed=data_feed)
+
+
+def run_until(stream, stop_at: float, clock) -> None:
+    '''
+    Runs the stream like stream.run() until stop_at, a unix timestamp on the given clock. A timer
+    task on the stream's loop stops it then, even if no messages arrive.
+    '''
+    async def stop_later():
+        await asyncio.sleep(max(0.0, stop_at - clock.now().timestamp()))
+        await stream.stop_ws()
+
+    async def run():
+        timer = asyncio.ensure_future(stop_later())
+        try:
+            await stream._run_forever()
+        finally:
+            timer.cancel()
+
+    asyncio.run(run())
+
+
+class FakeStream:
+    '''
+    Local stand-in for the Alpaca stream that replays the given (symbol, price) trades
+    through the subscribed handlers, for testing strategies without a websocket.
+    '''
+
+    def __init__(self, trades: Iterable[Tuple[str, float]] = (), delay: float = 0.0):
+        self.trades = list(trades)
+        self.delay = delay
+        self.trade_handlers = {}
+        self.trade_update_handlers = []
+        self.stopped = False
+
+    def subscribe_trades(self, handler, *symbols):
+        for symbol in symbols:
+            self.trade_handlers[symbol] = handler
+
+    def unsubscribe_trades(self, *symbols):
+        for symbol in symbols:
+            self.trade_handlers.pop(symbol, None)
+
+    def subscribe_trade_updates(self, handler):
+        self.trade_update_handlers.append(handler)
+
+    async def publish_trade_update(self, event: str, order):
+        for handler in self.trade_update_handlers:
+            await handler(SimpleNamespace(event=event, order=order))
+
+    async def _run_forever(self):
+        for symbol, price in self.trades:
+            if self.stopped:
+                return
+            handler = self.trade_handlers.get(symbol)
+            if handler is not None:
+                await handler(SimpleNamespace(symbol=symbol, price=price))
+            await asyncio.sleep(self.delay)
+
+    def run(self):
+        self.stopped = False
+        asyncio.run(self._run_forever())
+
+    async def stop_ws(self):
+        self.stopped = True
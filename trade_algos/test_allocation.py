@@ -0,0 +1,42 @@
+from .allocation import allocate_notional, allocate_shares
+
+
+def test_allocate_shares_equal_weight():
+    prices = {'AAPL': 100.0, 'MSFT': 250.0, 'PENNY': 0.01}
+    amounts = allocate_shares(prices, 1000.0)
+    cost = sum(amounts[symbol] * prices[symbol] for symbol in prices)
+
+    assert cost <= 1000.0
+    # leftover cash is smaller than the cheapest share
+    assert 1000.0 - cost < 0.01 + 1e-9
+    assert amounts['AAPL'] == 4
+    assert amounts['MSFT'] == 1
+
+
+def test_allocate_shares_skips_expensive_ticker():
+    # the old round-robin loop stopped at BRK and left the rest unspent
+    prices = {'BRK': 500000.0, 'AAPL': 100.0}
+    amounts = allocate_shares(prices, 1000.0)
+    assert amounts == {'BRK': 0, 'AAPL': 10}
+
+
+def test_allocate_shares_spreads_leftover_round_robin():
+    # after the shortfall shares, 245 is left: 40 full rounds of A, B and C, a partial round
+    # of A and B, and the last dollar goes to A
+    prices = {'A': 1.0, 'B': 2.0, 'C': 3.0, 'X': 1000.0}
+    assert allocate_shares(prices, 1000.0) == {'A': 294, 'B': 167, 'C': 124, 'X': 0}
+
+
+def test_allocate_shares_weighted():
+    prices = {'AAPL': 10.0, 'MSFT': 10.0}
+    amounts = allocate_shares(prices, 100.0, weights={'AAPL': 3, 'MSFT': 1})
+    assert amounts == {'AAPL': 8, 'MSFT': 2}
+
+    amounts = allocate_shares(
+        prices, 100.0, weights={'AAPL': 3, 'MSFT': 1}, fractional=True)
+    assert amounts == {'AAPL': 7.5, 'MSFT': 2.5}
+
+
+def test_allocate_notional():
+    assert allocate_notional(['AAPL', 'MSFT', 'TSLA'], 100.0) == {
+        'AAPL': 33.33, 'MSFT': 33.33, 'TSLA': 33.33}
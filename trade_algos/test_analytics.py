@@ -0,0 +1,27 @@
+import numpy as np
+
+from .analytics import rate_of_change_means, rate_of_change_stats
+
+
+def test_rate_of_change_stats():
+    # two symbols, interleaved and out of order
+    symbol_index = np.array([1, 0, 0, 1, 0, 1])
+    timestamps = np.array([3, 2, 1, 1, 3, 2])
+    closes = np.array([7.0, 12.0, 10.0, 1.0, 11.0, 4.0])
+    mean, variance, count = rate_of_change_stats(
+        symbol_index, timestamps, closes, 3)
+
+    assert list(count) == [2, 2, 0]
+    assert mean[0] == 0.5
+    assert mean[1] == 3.0
+    assert variance[0] == np.var([2.0, -1.0])
+    assert np.isnan(mean[2])
+
+
+def test_rate_of_change_means_skips_single_bar():
+    bar_dtype = [('t', '<i8'), ('c', '<f8')]
+    bars_by_symbol = {
+        'AAPL': np.array([(1, 1.0), (2, 3.0)], dtype=bar_dtype),
+        'MSFT': np.array([(1, 5.0)], dtype=bar_dtype),
+    }
+    assert rate_of_change_means(bars_by_symbol) == {'AAPL': 2.0}
@@ -0,0 +1,36 @@
+import arrow
+import pytest
+
+from bar_store import BarStore
+from tests.fakes import FakeApi, FakeClock, make_bars
+
+from . import BaseAlgorithm
+
+
+def test_yesterday_prices_are_fetched_together_once_a_day(tmp_path):
+    algo = BaseAlgorithm('key', 'secret')
+    start = arrow.get('2022-06-01T00:00:00+00:00')
+    algo.api = FakeApi(make_bars('AAPL', start, [float(i) for i in range(100, 107)], 'days') +
+                       make_bars('MSFT', start, [float(i) for i in range(200, 207)], 'days'))
+    algo.bar_store = BarStore(str(tmp_path))
+    algo.clock = FakeClock(arrow.get('2022-06-08T15:00:00+00:00'))
+
+    assert algo.get_yesterday_prices(['AAPL', 'MSFT', 'GME']) == {'AAPL': 106.0, 'MSFT': 206.0}
+    assert algo.get_yesterday_price('AAPL') == 106.0
+    assert [request[0] for request in algo.api.requests] == [['AAPL', 'MSFT', 'GME']]
+    assert arrow.get(algo.api.requests[0][2]) <= algo.clock.now().shift(minutes=-15)
+
+    # the next day the closes are looked up again
+    algo.clock.current = algo.clock.now().shift(days=1)
+    algo.get_yesterday_prices(['AAPL', 'MSFT'])
+    assert len(algo.api.requests) == 2
+
+
+def test_symbols_without_a_latest_trade_are_left_out():
+    algo = BaseAlgorithm('key', 'secret')
+    algo.set_api(FakeApi(prices={'AAPL': 100.0}))
+
+    assert algo.get_current_prices(['AAPL', 'HALTED']) == {'AAPL': 100.0}
+    assert algo.get_current_price('AAPL') == 100.0
+    with pytest.raises(ValueError, match='HALTED'):
+        algo.get_current_price('HALTED')
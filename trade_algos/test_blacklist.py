@@ -0,0 +1,47 @@
+import json
+
+import arrow
+
+from database import BLACKLIST_TABLES, get_engine
+from tests.fakes import FakeClock
+
+from .blacklist import Blacklist
+from .mean_reversion import MeanReversionAlgorithm
+
+
+def test_entries_expire_and_persist(tmp_path):
+    engine = get_engine(f'sqlite:///{tmp_path}/blacklist.db', BLACKLIST_TABLES)
+    clock = FakeClock(arrow.get('2022-06-01T00:00:00+00:00'))
+    blacklist = Blacklist(engine, clock)
+    blacklist.add('AAPL')
+    blacklist.add('MSFT', clock.now().shift(days=1))
+    blacklist.add('TSLA')
+    blacklist.remove('TSLA')
+
+    assert 'AAPL' in blacklist
+    assert blacklist.filter(['TSLA', 'AAPL', 'MSFT', 'GME']) == ['TSLA', 'GME']
+
+    clock.current = clock.now().shift(days=2)
+    assert 'MSFT' not in blacklist
+    assert blacklist.filter(['AAPL', 'MSFT']) == ['MSFT']
+
+    # a reload only keeps the entries that haven't expired
+    reloaded = Blacklist(engine, clock)
+    assert reloaded.entries.keys() == {'AAPL'}
+
+
+def test_mean_reversion_imports_blacklist_file(tmp_path):
+    path = tmp_path / 'blacklist.json'
+    expires = arrow.now().shift(days=1).int_timestamp
+    with open(path, 'w') as f:
+        json.dump({'AAPL': expires, 'MSFT': arrow.now().shift(days=-1).int_timestamp}, f)
+
+    algo = MeanReversionAlgorithm('key', 'secret')
+    algo.blacklist_path = str(path)
+    algo.blacklist_database_url = f'sqlite:///{tmp_path}/blacklist.db'
+
+    assert algo.get_blacklist() == {'AAPL': expires}
+    assert not path.exists()
+    algo.add_to_blacklist('TSLA')
+    algo.remove_from_blacklist('AAPL')
+    assert list(algo.get_blacklist()) == ['TSLA']
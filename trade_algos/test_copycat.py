@@ -0,0 +1,98 @@
+import arrow
+
+from ark_wrapper.history import HoldingsHistory
+from database import ARK_TABLES, get_engine
+from tests.fakes import FakeClock
+
+from .copycat import CopyCatAlgorithm, MarketSnapshot, plan_orders
+
+
+def trade(ticker, direction, shares):
+    return {'ticker': ticker, 'direction': direction, 'shares': shares}
+
+
+def test_plan_orders_splits_budget_and_copies_sells():
+    snapshot = MarketSnapshot(
+        cash=11000.0,
+        buying_power=11000.0,
+        shares={'ROKU': 10, 'COIN': 3, 'SHOP': 0},
+        prices={'TSLA': 700.0, 'PATH': 40.0, 'ROKU': 100.0, 'COIN': 50.0, 'SHOP': 30.0},
+        yesterday_prices={'TSLA': 700.0, 'PATH': 40.0, 'CRSP': 100.0},
+        fractionable={'TSLA': True, 'ROKU': True},
+    )
+    trades = [
+        trade('TSLA', 'Buy', 30),    # $21000 bought
+        trade('PATH', 'Buy', 225),   # $9000 bought
+        trade('GME', 'Buy', 10),     # no price
+        trade('ROKU', 'Sell', 25),   # a quarter of ARK's holding
+        trade('COIN', 'Sell', 50),   # half of it
+        trade('SHOP', 'Sell', 10),   # we don't hold any
+    ]
+    holdings = {'ROKU': 100, 'COIN': 100, 'SHOP': 100}
+
+    plan = plan_orders(trades, holdings, snapshot, daily_budget_percent=0.1, min_bal=1000.0)
+
+    assert plan.daily_budget == 1000.0
+    assert plan.buys == [
+        dict(symbol='TSLA', notional=700.0, side='buy', type='market', time_in_force='day'),
+        # $300 of a symbol that can't be bought fractionally is 7 whole shares
+        dict(symbol='PATH', qty=7, side='buy', type='market', time_in_force='day'),
+    ]
+    assert plan.sells == [
+        dict(symbol='ROKU', notional=250.0, side='sell', type='market', time_in_force='day'),
+        dict(symbol='COIN', qty=1, side='sell', type='market', time_in_force='day'),
+    ]
+    assert plan.skipped == [('GME', 'no price')]
+
+
+def test_plan_orders_respects_buying_power_and_rounds_up_close_amounts():
+    snapshot = MarketSnapshot(cash=2000.0, buying_power=600.0, shares={},
+                              prices={'TSLA': 700.0, 'PATH': 100.0},
+                              yesterday_prices={'TSLA': 700.0, 'PATH': 100.0}, fractionable={})
+    trades = [trade('TSLA', 'Buy', 1), trade('PATH', 'Buy', 0.15)]
+
+    plan = plan_orders(trades, {}, snapshot, daily_budget_percent=0.5, min_bal=0.0)
+
+    # TSLA's $978 doesn't fit, PATH's $21 would be a fifth of a share
+    assert plan.buys == []
+    assert plan.skipped == [('TSLA', 'not enough buying power'), ('PATH', 'cannot buy a whole share')]
+
+    snapshot.buying_power = 2000.0
+    plan = plan_orders([trade('PATH', 'Buy', 1)], {}, snapshot, daily_budget_percent=0.0475, min_bal=0.0)
+    # $95 is within 10% of one share
+    assert plan.buys == [dict(symbol='PATH', qty=1, side='buy', type='market', time_in_force='day')]
+
+
+class FakeArk:
+    def __init__(self, snapshots, trades):
+        self.snapshots = snapshots
+        self.trades = trades
+
+    def get_etf_holdings(self, symbol, start_date=None, end_date=None, limit=None):
+        holdings = [dict(holding, date=date) for date, snapshot in self.snapshots.items()
+                    if start_date <= date <= end_date for holding in snapshot]
+        return {'symbol': symbol, 'holdings': holdings}
+
+    def get_etf_trades(self, symbol, start_date=None, end_date=None, limit=None):
+        return {'symbol': symbol, 'trades': self.trades}
+
+
+def test_ark_activity_uses_trades_endpoint_unless_derived():
+    snapshots = {
+        '2022-06-01': [{'ticker': 'TSLA', 'shares': 100}, {'ticker': 'ROKU', 'shares': 50}],
+        # a creation day: every share count grows
+        '2022-06-02': [{'ticker': 'TSLA', 'shares': 110}, {'ticker': 'ROKU', 'shares': 55}],
+    }
+    trades = [{'fund': 'ARKK', 'date': '2022-06-02', 'ticker': 'ROKU', 'direction': 'Sell', 'shares': 5},
+              {'fund': 'ARKK', 'date': '2022-06-02', 'ticker': '4689', 'direction': 'Buy', 'shares': 5}]
+    algo = CopyCatAlgorithm('key', 'secret')
+    algo.clock = FakeClock(arrow.get('2022-06-03T15:00:00Z'))
+    algo.set_etf_symbol('ARKK')
+    algo.history = HoldingsHistory(get_engine('sqlite://', ARK_TABLES), FakeArk(snapshots, trades))
+
+    assert algo.get_ark_activity() == (trades[:1], {'TSLA': 100, 'ROKU': 50})
+
+    algo.set_derive_trades(True)
+    derived, holdings = algo.get_ark_activity()
+    assert [(trade['ticker'], trade['direction']) for trade in derived] == [('ROKU', 'Buy'), ('TSLA', 'Buy')]
+    assert holdings == {'TSLA': 100, 'ROKU': 50}
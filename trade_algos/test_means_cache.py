@@ -0,0 +1,56 @@
+import arrow
+from sqlmodel import create_engine
+
+from database import MEANS_TABLES, get_engine
+from tests.fakes import FakeClock
+
+from .mean_reversion import MeanReversionAlgorithm
+from .means_cache import MeansCache
+
+
+def test_only_stale_means_are_dropped(tmp_path):
+    url = f'sqlite:///{tmp_path}/means.db'
+    cache = MeansCache(get_engine(url, MEANS_TABLES), max_age=60 * 60)
+    now = arrow.get('2022-06-01T14:00:00+00:00')
+
+    cache.put({'AAPL': 0.5, 'MSFT': -0.1}, 'month', now.shift(hours=-1), now.shift(hours=-2))
+    cache.put({'TSLA': 1.5}, 'month', now.shift(minutes=-30), now)
+    cache.put({'TSLA': 2.5}, 'week', now.shift(minutes=-30), now)
+
+    assert cache.get(['AAPL', 'MSFT', 'TSLA', 'GME'], 'month', now) == {'TSLA': 1.5}
+    assert cache.get(['AAPL', 'TSLA'], 'month', now.shift(hours=-2)) == {'AAPL': 0.5, 'TSLA': 1.5}
+    assert cache.get(['AAPL', 'TSLA'], 'month', now.shift(hours=-2),
+                     min_watermark=now.shift(minutes=-45)) == {'TSLA': 1.5}
+
+    # recomputed means replace the old ones, and other connections see them
+    cache.put({'AAPL': 0.7}, 'month', now.shift(minutes=-30), now)
+    # a second engine stands in for another process
+    reader = MeansCache(create_engine(url), max_age=60 * 60)
+    assert reader.get(['AAPL', 'MSFT', 'TSLA'], 'month', now) == {'AAPL': 0.7, 'TSLA': 1.5}
+    with reader.engine.connect() as connection:
+        assert connection.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+
+
+def test_large_ticker_lists_are_batched():
+    cache = MeansCache(get_engine('sqlite://', MEANS_TABLES))
+    now = arrow.get('2022-06-01T14:00:00+00:00')
+    means = {f'T{i}': float(i) for i in range(2000)}
+
+    cache.put(means, 'month', now, now)
+    assert cache.get(list(means), 'month', now) == means
+
+
+def test_means_over_older_bars_are_recalculated():
+    algo = MeanReversionAlgorithm('key', 'secret')
+    algo.clock = FakeClock(arrow.get('2022-06-01T14:50:00+00:00'))
+    cache = MeansCache(get_engine('sqlite://', MEANS_TABLES))
+    watermark = algo.means_watermark('month')
+    assert watermark == arrow.get('2022-06-01T14:00:00+00:00')
+    cache.put({'AAPL': 0.5}, 'month', watermark, algo.clock.now())
+
+    # no bar has closed since
+    algo.clock.current = algo.clock.now().shift(minutes=30)
+    assert cache.get(['AAPL'], 'month', algo.clock.now(), algo.means_watermark('month')) == {'AAPL': 0.5}
+
+    algo.clock.current = algo.clock.now().shift(hours=1)
+    assert cache.get(['AAPL'], 'month', algo.clock.now(), algo.means_watermark('month')) == {}
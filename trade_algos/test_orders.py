@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+from tests.fakes import FakeApi
+
+from .orders import OrderTracker, make_client_order_id
+from .stream import FakeStream
+
+
+def test_trade_updates_resolve_orders():
+    fills = []
+    tracker = OrderTracker(FakeApi(), on_fill=lambda *fill: fills.append(fill))
+    stream = FakeStream()
+    stream.subscribe_trade_updates(tracker.on_trade_update)
+
+    future = tracker.track({'id': '1', 'status': 'new'})
+    asyncio.run(stream.publish_trade_update('partial_fill', {'id': '1'}))
+    assert not future.done()
+
+    asyncio.run(stream.publish_trade_update('fill', {'id': '1', 'symbol': 'AAPL', 'side': 'buy', 'status': 'filled',
+                                                     'filled_qty': '2', 'filled_avg_price': '10.5'}))
+    assert future.result()['status'] == 'filled'
+    assert fills == [('AAPL', 'buy', 2.0, 10.5, '1')]
+
+
+def test_wait_polls_only_pending_orders():
+    api = FakeApi()
+    api.statuses = {'1': 'filled', '2': 'canceled'}
+    tracker = OrderTracker(api, poll_interval=0.01)
+
+    orders = tracker.wait([tracker.track({'id': '1', 'status': 'new'}),
+                           tracker.track({'id': '2', 'status': 'new'}),
+                           tracker.track({'id': '3', 'status': 'filled', 'symbol': 'AAPL', 'side': 'buy',
+                                          'filled_qty': '1', 'filled_avg_price': '1'})])
+    assert [order['status'] for order in orders] == ['filled', 'canceled', 'filled']
+    assert sorted(api.requested) == ['1', '2']
+
+
+def test_client_order_id_is_deterministic():
+    order = {'symbol': 'AAPL', 'qty': 1.0, 'side': 'buy',
+             'type': 'market', 'time_in_force': 'day'}
+    first = make_client_order_id(order, 0, date='2022-06-01')
+    assert first == make_client_order_id(dict(order), 0, date='2022-06-01')
+    assert first != make_client_order_id(order, 1, date='2022-06-01')
+    assert first != make_client_order_id(order, 0, date='2022-06-02')
+    assert len(first) <= 48
+
+
+def test_fill_before_wait_resolves_immediately():
+    fills = []
+    api = FakeApi()
+    tracker = OrderTracker(api, on_fill=lambda *fill: fills.append(fill), poll_interval=2.0)
+    stream = FakeStream()
+    stream.subscribe_trade_updates(tracker.on_trade_update)
+
+    submitted = {'id': '1', 'status': 'accepted'}
+    asyncio.run(stream.publish_trade_update('fill', {'id': '1', 'symbol': 'AAPL', 'side': 'sell', 'status': 'filled',
+                                                     'filled_qty': '1', 'filled_avg_price': '100'}))
+    start = time.monotonic()
+    orders = tracker.wait([tracker.track(submitted)])
+    assert time.monotonic() - start < 0.5
+    assert orders[0]['status'] == 'filled'
+
+    # a later poll or duplicate update does not apply the fill again
+    api.statuses = {'1': 'filled'}
+    tracker.poll(['1'])
+    asyncio.run(stream.publish_trade_update('fill', orders[0]))
+    assert fills == [('AAPL', 'sell', 1.0, 100.0, '1')]
+
+
+def test_partial_fills_are_applied_and_old_orders_forgotten():
+    fills = []
+    tracker = OrderTracker(FakeApi(), on_fill=lambda *fill: fills.append(fill), resolved_ttl=0)
+
+    tracker.handle_update('canceled', {'id': '1', 'symbol': 'AAPL', 'side': 'buy', 'status': 'canceled',
+                                       'filled_qty': '0.5', 'filled_avg_price': '10'})
+    tracker.handle_update('expired', {'id': '2', 'symbol': 'MSFT', 'side': 'buy', 'status': 'expired',
+                                      'filled_qty': '0', 'filled_avg_price': None})
+    assert fills == [('AAPL', 'buy', 0.5, 10.0, '1')]
+    assert list(tracker.futures) == ['2']
+    assert list(tracker.resolved) == ['2']
@@ -0,0 +1,48 @@
+import pytest
+
+from database import get_engine
+
+from .ledger import FillLedger
+from .portfolio import Portfolio
+
+
+def test_sells_close_oldest_lots_first():
+    portfolio = Portfolio()
+    portfolio.record_buy('AAPL', 10, 100.0)
+    portfolio.record_buy('AAPL', 10, 120.0)
+
+    # 10 from the first lot and 5 from the second
+    assert portfolio.record_sell('AAPL', 15, 130.0) == pytest.approx(10 * 30 + 5 * 10)
+    assert portfolio.get_shares('AAPL') == 5
+    assert portfolio.get_cost_basis('AAPL') == pytest.approx(600.0)
+    assert portfolio.get_average_cost('AAPL') == pytest.approx(120.0)
+    assert portfolio.get_unrealized_pnl('AAPL', 110.0) == pytest.approx(-50.0)
+    assert portfolio.get_realized_pnl() == pytest.approx(350.0)
+
+    # selling more than is held closes the position
+    portfolio.record_sell('AAPL', 50, 100.0)
+    assert portfolio.get_shares('AAPL') == 0
+    assert portfolio.get_cost_basis('AAPL') == 0
+    assert portfolio.held() == []
+    assert portfolio.record_sell('TSLA', 1, 100.0) == 0
+
+
+def test_ledger_rebuilds_the_same_portfolio():
+    ledger = FillLedger(get_engine('sqlite://'))
+    live = ledger.get_portfolio()
+    ledger.record_buys([('AAPL', 0.5, 100.0, '2022-06-01T14:30:00Z'),
+                        ('MSFT', 2, 250.0, '2022-06-01T14:30:00Z')])
+    ledger.record_buy('AAPL', 1.5, 110.0, '2022-06-02T14:30:00Z')
+    ledger.record_sell('AAPL', 1, 120.0, '2022-06-03T14:30:00Z')
+    ledger.record_sell('MSFT', 2, 240.0, '2022-06-03T14:30:00Z')
+
+    ledger.portfolio = None
+    rebuilt = ledger.get_portfolio()
+    assert rebuilt is not live
+    prices = {'AAPL': 115.0, 'MSFT': 245.0}
+    assert rebuilt.summary(prices) == live.summary(prices)
+    assert rebuilt.held() == ['AAPL']
+    assert rebuilt.get_average_cost('AAPL') == pytest.approx(110.0)
+    assert rebuilt.get_realized_pnl('AAPL') == pytest.approx(0.5 * 20 + 0.5 * 10)
+    assert rebuilt.get_realized_pnl() == pytest.approx(15.0 - 20.0)
+    assert rebuilt.summary(prices)['AAPL']['oldest_lot'] == '2022-06-02T14:30:00+00:00'
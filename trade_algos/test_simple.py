@@ -0,0 +1,80 @@
+import time
+from types import SimpleNamespace
+
+from database import get_engine
+from tests.fakes import FakeApi
+
+from .ledger import FillLedger
+from .clock import WallClock
+from .simple import SimpleAlgorithm
+from .stream import FakeStream, run_until
+
+
+def test_run_streaming_sells_on_thresholds():
+    algo = SimpleAlgorithm('key', 'secret')
+    algo.set_api(FakeApi(buy_prices={'AAPL': 100.0, 'MSFT': 200.0, 'TSLA': 300.0}))
+    algo.ledger = FillLedger(get_engine('sqlite://'))
+    for symbol in ['AAPL', 'MSFT', 'TSLA']:
+        algo.add_symbol(symbol, qty=1)
+        algo.set_min_gain(symbol, 5)
+        algo.set_max_loss(symbol, -5)
+
+    stream = FakeStream([('AAPL', 101.0), ('MSFT', 190.0), ('AAPL', 106.0),
+                         ('TSLA', 300.0), ('AAPL', 90.0)])
+    algo.run_streaming(stream, testing=True)
+
+    sold = [order['symbol'] for order in algo.api.orders if order['side'] == 'sell']
+    assert sold == ['MSFT', 'AAPL']
+    assert algo.holding_count == 1
+
+
+def test_streaming_stops_at_the_close_without_trades():
+    # only trades of symbols that are not held, for about 10 seconds
+    stream = FakeStream([('GME', 1.0)] * 1000, delay=0.01)
+    clock = WallClock()
+
+    start = time.monotonic()
+    run_until(stream, clock.now().timestamp() + 0.1, clock)
+    assert time.monotonic() - start < 1
+
+
+def test_get_buy_price_uses_ledger():
+    algo = SimpleAlgorithm('key', 'secret')
+    algo.set_api(FakeApi(buy_prices={'AAPL': 100.0}))
+    algo.ledger = FillLedger(get_engine('sqlite://'))
+
+    assert algo.get_buy_price('AAPL') == 100.0
+    algo.api.buy_prices['AAPL'] = 50.0
+    # the broker is only asked once, and what it returns is not recorded
+    assert algo.get_buy_price('AAPL') == 100.0
+    assert algo.ledger.get_buy_price('AAPL') is None
+
+    algo.record_fill('AAPL', 'buy', 1, 120.0)
+    assert algo.get_buy_price('AAPL') == 120.0
+
+
+def test_unfilled_buys_are_skipped():
+    algo = SimpleAlgorithm('key', 'secret')
+    algo.set_api(FakeApi())
+    algo.ledger = FillLedger(get_engine('sqlite://'))
+    algo.api.list_orders = lambda status=None, symbols=None: [
+        SimpleNamespace(side='buy', status='canceled', filled_qty=None, filled_avg_price=None),
+        SimpleNamespace(side='buy', status='filled', filled_qty='2', filled_avg_price='90.5')]
+
+    assert algo.get_buy_price('AAPL') == 90.5
+
+
+def test_fills_are_recorded_once_per_order():
+    algo = SimpleAlgorithm('key', 'secret')
+    algo.set_api(FakeApi())
+    algo.ledger = FillLedger(get_engine('sqlite://'))
+    portfolio = algo.ledger.get_portfolio()
+
+    fill = {'id': '1', 'symbol': 'AAPL', 'side': 'buy', 'status': 'filled', 'filled_qty': '2', 'filled_avg_price': '10'}
+    algo.order_tracker.handle_update('fill', fill)
+    algo.ledger.record_buy('AAPL', 2, 10.0, order_id='1')
+    algo.ledger.record_buys([('AAPL', 1, 11.0, None, '2'), ('AAPL', 1, 11.0, None, '2')])
+
+    assert portfolio.get_shares('AAPL') == 3
+    algo.ledger.portfolio = None
+    assert algo.ledger.get_portfolio().get_shares('AAPL') == 3
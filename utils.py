@@ -1,7 +1,14 @@
-
+import re
 import string
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Union
+
 from ark_wrapper import Ark
 
+ARK_FUNDS = ['ARKK', 'ARKW', 'ARKQ', 'ARKG', 'ARKF', 'ARKX', 'PRNT', 'IZRL', 'CTRU']
+# tickers with any of these characters, e.g. foreign listings like 4689 or ARCT UQ, can't be traded
+INVALID_TICKER = re.compile('[' + re.escape(string.punctuation + string.whitespace + string.digits) + ']')
+
 def get_ark_tickers(fund = 'ARKK'):
     ark = Ark()
     holdings = ark.get_etf_holdings(fund)
@@ -10,31 +17,33 @@ def get_ark_tickers(fund = 'ARKK'):
         ticker = holding.get('ticker')
         if ticker is not None:
             tickers.append(ticker)
-        
+
     return tickers
 
+def get_ark_universe(funds: List[str] = ARK_FUNDS, max_workers: Union[int, None] = None) -> Dict[str, Dict[str, float]]:
+    '''
+    Fetches the holdings of all funds in parallel and returns every tradable ticker with the funds
+    holding it and its weight in each, e.g. {'TSLA': {'ARKK': 10.5, 'ARKW': 6.2}}.
+    '''
+    ark = Ark()
+    with ThreadPoolExecutor(max_workers=max_workers or len(funds)) as executor:
+        holdings_by_fund = dict(zip(funds, executor.map(ark.get_etf_holdings, funds)))
+
+    universe = {}
+    for fund, holdings in holdings_by_fund.items():
+        for holding in holdings['holdings']:
+            ticker = holding.get('ticker')
+            if not ticker or INVALID_TICKER.search(ticker):
+                continue
+            universe.setdefault(ticker, {})[fund] = holding.get('weight')
+    return universe
+
 def get_all_ark_holdings():
-    funds = ['ARKK', 'ARKW', 'ARKQ', 'ARKG', 'ARKF', 'ARKX', 'PRNT', 'IZRL', 'CTRU']
-    invalid_chars = string.punctuation + string.whitespace + string.digits
-    tickers = []
-    print('Getting ARK Holdings', end='')
-    for fund in funds:
-        print('.', end='')
-        tickers += get_ark_tickers(fund)
-    print('')
-    print('Filtering and sorting')
-    # remove duplicates
-    tickers = list(set(tickers))
-    filtered_tickers = []
-    for ticker in tickers:
-        if any(digit in ticker for digit in invalid_chars):
-            continue
-        filtered_tickers.append(ticker)
-    filtered_tickers.sort()
+    print('Getting ARK Holdings')
+    tickers = sorted(get_ark_universe())
     print('Done')
-    return filtered_tickers
+    return tickers
 
 if __name__ == '__main__':
 
     print(get_all_ark_holdings())
-    
\ No newline at end of file